@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Modo por lotes, sin preguntas: subtitula todos los vídeos de un directorio o
+de un manifiesto (.txt con una ruta por línea o .json).
+
+Uso:
+    python batch.py media/ --idiomas en,fr --salida trabajos/ [--procesos 4]
+    python batch.py --cola trabajos/cola.sqlite3    # proceso trabajador adicional
+"""
+import argparse
+from subtitle_package.batch import ejecutar_lote, trabajar
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", nargs="?", help="Directorio de vídeos o manifiesto (.txt / .json)")
+    parser.add_argument("--idiomas", default="en", help="Idiomas de destino separados por comas")
+    parser.add_argument("--salida", default="trabajos", help="Directorio con un subdirectorio por trabajo")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos trabajadores")
+    parser.add_argument("--cola", default=None, help="Base SQLite de la cola (por defecto, <salida>/cola.sqlite3)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Añade cProfile y tracemalloc de las etapas de texto a los informes")
+    args = parser.parse_args()
+
+    if args.entrada is None:
+        if args.cola is None:
+            parser.error("indica una entrada o la cola a la que unirse con --cola")
+        # Se une a una cola existente como un trabajador más
+        trabajar(args.cola, perfil=args.profile)
+        return
+    idiomas = list(dict.fromkeys(idioma.strip() for idioma in args.idiomas.split(",") if idioma.strip()))
+    ejecutar_lote(args.entrada, args.salida, idiomas, procesos=args.procesos, ruta_cola=args.cola, perfil=args.profile)
+
+if __name__ == "__main__":
+    main()
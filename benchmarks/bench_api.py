@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Benchmark de rendimiento de las partes que dependen de la API de OpenAI,
+contra un servidor local simulado (benchmarks/mock_openai.py) con latencias,
+errores 429 y límites por minuto configurables.
+
+Escenarios:
+    transcripcion  transcribe_chunks sobre audio sintético de varias duraciones
+    traduccion     SRTTranslator.translate_all (bloque a bloque y por lotes)
+                   sobre SRT sintéticos de varios tamaños
+    pipeline       procesar_video completo (el flujo de main.py) sobre vídeos
+                   sintéticos generados con ffmpeg
+
+Para cada caso informa del rendimiento, la latencia p50/p99 de las peticiones
+y el tiempo perdido esperando reintentos. Los resultados se añaden a un
+archivo JSONL junto con la versión del código, y cada caso se compara con la
+última ejecución equivalente para detectar regresiones.
+
+Uso:
+    python -m benchmarks.bench_api [--escenarios transcripcion,traduccion,pipeline]
+        [--minutos 5,30] [--cues 200,2000] [--latencia-chat 0.5] [--prob-429 0.05]
+        [--tpm-chat 0] [--resultados benchmarks/resultados/bench_api.jsonl]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from dataclasses import asdict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.mock_openai import ConfigMock, ServidorMock
+
+RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados", "bench_api.jsonl")
+
+def version_codigo():
+    """Commit actual (con '-dirty' si hay cambios sin confirmar), o None fuera de git."""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def reiniciar_motor():
+    """
+    Descarta el motor compartido para que cada caso empiece con los límites
+    adaptativos en su estado inicial.
+    """
+    from subtitle_package import motor
+    with motor._motor_lock:
+        motor._motor = None
+
+def resumen_metricas(metricas, endpoint):
+    """Latencias, peticiones y tiempo perdido en reintentos de un endpoint."""
+    histograma = metricas.histogramas.get(("latencia_peticion_segundos", (("endpoint", endpoint),)))
+    contadores = {}
+    for (nombre, etiquetas), valor in metricas.contadores.items():
+        clave = (nombre, dict(etiquetas).get("endpoint"))
+        contadores[clave] = contadores.get(clave, 0) + valor
+    return {
+        "peticiones": contadores.get(("peticiones", endpoint), 0),
+        "reintentos": contadores.get(("reintentos", endpoint), 0),
+        "espera_reintentos_s": round(contadores.get(("espera_backoff_segundos", endpoint), 0.0), 3),
+        "p50_s": round(histograma.percentil(50), 4) if histograma else None,
+        "p99_s": round(histograma.percentil(99), 4) if histograma else None,
+    }
+
+def generar_fragmentos(minutos, chunk_ms=60000, sample_rate=16000):
+    """Fragmentos de ruido de 'chunk_ms' que suman 'minutos' de audio."""
+    import numpy as np
+    from subtitle_package.audio import FragmentoAudio
+
+    generador = np.random.default_rng(0)
+    por_fragmento = chunk_ms * sample_rate // 1000
+    total = minutos * 60 * sample_rate
+    for indice, offset in enumerate(range(0, total, por_fragmento)):
+        muestras = generador.integers(-2000, 2000, min(por_fragmento, total - offset), dtype=np.int16)
+        yield FragmentoAudio(indice, offset, muestras, sample_rate)
+
+def generar_video(ruta, minutos):
+    """Vídeo sintético: imagen fija y un tono con una pausa de 1 s cada 8 s."""
+    segundos = minutos * 60
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"color=c=black:s=160x120:r=5:d={segundos}",
+        "-f", "lavfi", "-i", f"aevalsrc='0.3*sin(440*2*PI*t)*gt(mod(t,8),1)':s=16000:d={segundos}",
+        "-c:v", "mpeg4", "-c:a", "aac", "-shortest", ruta,
+    ], check=True)
+
+def caso_transcripcion(minutos):
+    from subtitle_package.transcription import transcribe_chunks
+
+    inicio = time.perf_counter()
+    segmentos = transcribe_chunks(generar_fragmentos(minutos))
+    segundos = time.perf_counter() - inicio
+    return segundos, {"minutos_audio_por_s": round(minutos / segundos, 3), "segmentos": len(segmentos)}, "audio"
+
+def caso_traduccion(cues, por_lotes, directorio):
+    from benchmarks.bench_srt import generar_cues
+    from subtitle_package.cues import escribir_srt
+    from subtitle_package.subtitles import crear_traductor
+
+    ruta = os.path.join(directorio, f"sintetico_{cues}.srt")
+    escribir_srt(generar_cues(cues), ruta)
+    traductor = crear_traductor(ruta, None, "en", por_lotes=por_lotes, usar_cache=False)
+    traductor.read_file()
+    inicio = time.perf_counter()
+    traducidos = traductor.translate_all()
+    segundos = time.perf_counter() - inicio
+    return segundos, {"cues_por_s": round(len(traducidos) / segundos, 2)}, "chat"
+
+def caso_pipeline(minutos, idiomas, directorio):
+    from subtitle_package.job import procesar_video
+
+    video = os.path.join(directorio, f"sintetico_{minutos}min.mp4")
+    if not os.path.exists(video):
+        generar_video(video, minutos)
+    trabajo = os.path.join(directorio, f"trabajo_{minutos}_{'-'.join(idiomas)}")
+    os.makedirs(trabajo)
+    inicio = time.perf_counter()
+    procesar_video(video, os.path.join(trabajo, "subtitulos.srt"), os.path.join(trabajo, "final.mp4"), idiomas,
+                   ruta_manifiesto=os.path.join(trabajo, "manifiesto.json"),
+                   ruta_metricas=os.path.join(trabajo, "metricas"))
+    segundos = time.perf_counter() - inicio
+    return segundos, {"minutos_audio_por_s": round(minutos / segundos, 3)}, None
+
+def ejecutar_caso(escenario, parametros, funcion, *args):
+    from subtitle_package.metrics import obtener_metricas
+
+    reiniciar_motor()
+    metricas = obtener_metricas()
+    metricas.reiniciar()
+    segundos, rendimiento, endpoint = funcion(*args)
+    resultado = {"escenario": escenario, "parametros": parametros, "duracion_s": round(segundos, 3),
+                 **rendimiento}
+    if endpoint is None:
+        resultado["endpoints"] = {ep: resumen_metricas(metricas, ep) for ep in ("audio", "chat")}
+    else:
+        resultado.update(resumen_metricas(metricas, endpoint))
+    return resultado
+
+def _comparable(a, b):
+    return a["escenario"] == b["escenario"] and a["parametros"] == b["parametros"] and a["mock"] == b["mock"]
+
+def comparar(resultado, anteriores):
+    """Diferencia de rendimiento respecto a la última ejecución equivalente."""
+    previo = next((r for r in reversed(anteriores) if _comparable(r, resultado)), None)
+    if previo is None:
+        return ""
+    cambio = (previo["duracion_s"] - resultado["duracion_s"]) / previo["duracion_s"] * 100
+    aviso = "  << REGRESIÓN" if cambio < -10 else ""
+    return f"  ({cambio:+.0f}% frente a {previo.get('version') or '?'}){aviso}"
+
+def imprimir(resultado, comparacion):
+    metricas = resultado.get("endpoints", {}).get("chat") or resultado
+    rendimiento = next(f"{v} {k}" for k, v in resultado.items() if k.endswith("_por_s"))
+    print(f"{resultado['escenario']:<13} {json.dumps(resultado['parametros'], ensure_ascii=False):<42} "
+          f"{resultado['duracion_s']:8.2f} s  {rendimiento:<26} p50 {metricas['p50_s']} s  "
+          f"p99 {metricas['p99_s']} s  reintentos {metricas['reintentos']} "
+          f"({metricas['espera_reintentos_s']} s){comparacion}")
+
+def leer_resultados(ruta):
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, "r", encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escenarios", default="transcripcion,traduccion,pipeline")
+    parser.add_argument("--minutos", default="5,30", help="Duraciones del audio sintético (minutos)")
+    parser.add_argument("--cues", default="200,2000", help="Tamaños de los SRT sintéticos")
+    parser.add_argument("--idiomas", default="en,fr", help="Idiomas del escenario 'pipeline'")
+    parser.add_argument("--latencia-chat", type=float, default=0.5)
+    parser.add_argument("--latencia-audio", type=float, default=2.0, help="Segundos por minuto de audio")
+    parser.add_argument("--dispersion", type=float, default=0.4)
+    parser.add_argument("--prob-429", type=float, default=0.02)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--rpm-chat", type=int, default=0)
+    parser.add_argument("--tpm-chat", type=int, default=0)
+    parser.add_argument("--rpm-audio", type=int, default=0)
+    parser.add_argument("--resultados", default=RESULTADOS, help="Archivo JSONL donde se acumulan los resultados")
+    parser.add_argument("--etiqueta", default=None, help="Nombre libre para identificar la ejecución")
+    args = parser.parse_args()
+
+    config_mock = ConfigMock(latencia_chat=args.latencia_chat, latencia_audio_por_minuto=args.latencia_audio,
+                             dispersion=args.dispersion, prob_429=args.prob_429, retry_after=args.retry_after,
+                             rpm_chat=args.rpm_chat, tpm_chat=args.tpm_chat, rpm_audio=args.rpm_audio)
+    escenarios = args.escenarios.split(",")
+    minutos = [int(m) for m in args.minutos.split(",")]
+    cues = [int(c) for c in args.cues.split(",")]
+    idiomas = args.idiomas.split(",")
+    anteriores = leer_resultados(args.resultados)
+    version = version_codigo()
+    fecha = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    with ServidorMock(config_mock) as servidor, tempfile.TemporaryDirectory() as directorio:
+        # Deben fijarse antes de importar el paquete y de crear el cliente de la API
+        os.environ["OPENAI_BASE_URL"] = servidor.url
+        os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+        os.environ["SUBTITULOS_CACHE_DIR"] = os.path.join(directorio, "cache")
+
+        casos = []
+        if "transcripcion" in escenarios:
+            casos += [("transcripcion", {"minutos": m}, caso_transcripcion, m) for m in minutos]
+        if "traduccion" in escenarios:
+            casos += [("traduccion", {"cues": n, "por_lotes": por_lotes}, caso_traduccion, n, por_lotes, directorio)
+                      for n in cues for por_lotes in (False, True)]
+        if "pipeline" in escenarios:
+            casos += [("pipeline", {"minutos": m, "idiomas": idiomas}, caso_pipeline, m, idiomas, directorio)
+                      for m in minutos]
+
+        resultados = []
+        for escenario, parametros, funcion, *argumentos in casos:
+            resultado = ejecutar_caso(escenario, parametros, funcion, *argumentos)
+            resultado.update({"fecha": fecha, "version": version, "etiqueta": args.etiqueta,
+                              "mock": asdict(config_mock)})
+            resultados.append(resultado)
+
+        print()
+        for resultado in resultados:
+            imprimir(resultado, comparar(resultado, anteriores))
+        print(f"[INFO] Servidor simulado: peticiones {servidor.estadisticas.peticiones}, "
+              f"429 {servidor.estadisticas.errores_429}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.resultados)), exist_ok=True)
+    with open(args.resultados, "a", encoding="utf-8") as f:
+        for resultado in resultados:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    print(f"[INFO] Resultados añadidos a {args.resultados}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Comprueba el presupuesto de tiempo de arranque de la CLI y del parser de SRT:
+cada orden se ejecuta en un intérprete nuevo y se compara su tiempo de
+importación (descontando el del intérprete vacío) con un presupuesto, y se
+verifica que no cargue dependencias pesadas que no necesita (openai, torch,
+transformers, tiktoken). Termina con código 1 si algo se sale del presupuesto.
+
+Con --solo-modulos no se miden tiempos: solo se comprueban los módulos
+cargados por las órdenes que funcionan con la biblioteca estándar (la CLI y
+el parser). El resultado no depende de la máquina, así que es la comprobación
+que ejecuta la integración continua.
+
+Uso:
+    python -m benchmarks.bench_arranque [--repeticiones 5] [--factor 1.0] [--solo-modulos]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PESADOS = ("openai", "torch", "transformers", "tiktoken")
+
+# (nombre, código que se ejecuta, presupuesto en ms sobre el intérprete vacío, módulos prohibidos,
+#  si funciona solo con la biblioteca estándar)
+CASOS = (
+    ("main.py --help", "import sys; sys.argv = ['main.py', '--help']; import runpy; "
+                       "runpy.run_path('main.py', run_name='__main__')", 150, PESADOS + ("numpy",), True),
+    ("batch.py --help", "import sys; sys.argv = ['batch.py', '--help']; import runpy; "
+                        "runpy.run_path('batch.py', run_name='__main__')", 150, PESADOS + ("numpy",), True),
+    ("import parser_package.parser", "import parser_package.parser", 50, PESADOS + ("numpy", "dotenv"), True),
+    ("import subtitle_package.job", "import subtitle_package.job", 400, PESADOS, False),
+)
+
+def medir(codigo, repeticiones, prohibidos=()):
+    """Mejor tiempo (s) de un intérprete nuevo que ejecuta 'codigo', y módulos prohibidos que cargó."""
+    comprobacion = (f"\nimport sys\nprint(','.join(m for m in {tuple(prohibidos)!r} if m in sys.modules), "
+                    f"file=sys.stderr)")
+    mejor, cargados = float("inf"), ""
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        proceso = subprocess.run([sys.executable, "-c", f"try:\n    {codigo}\nexcept SystemExit:\n    pass"
+                                  + comprobacion], cwd=RAIZ, capture_output=True, text=True)
+        mejor = min(mejor, time.perf_counter() - inicio)
+        if proceso.returncode != 0:
+            raise RuntimeError(proceso.stderr)
+        cargados = proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else ""
+    return mejor, cargados
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--factor", type=float, default=1.0, help="Multiplica los presupuestos (máquinas lentas)")
+    parser.add_argument("--solo-modulos", action="store_true",
+                        help="Sin tiempos: solo los módulos cargados por la CLI y el parser")
+    args = parser.parse_args()
+
+    repeticiones = 1 if args.solo_modulos else args.repeticiones
+    base, _ = medir("pass", repeticiones)
+    print(f"{'intérprete vacío':<32} {base * 1000:8.1f} ms")
+    fallos = 0
+    for nombre, codigo, presupuesto_ms, prohibidos, sin_dependencias in CASOS:
+        if args.solo_modulos and not sin_dependencias:
+            continue
+        segundos, cargados = medir(codigo, repeticiones, prohibidos)
+        extra_ms = (segundos - base) * 1000
+        limite = presupuesto_ms * args.factor
+        problemas = []
+        if extra_ms > limite and not args.solo_modulos:
+            problemas.append(f"supera el presupuesto de {limite:.0f} ms")
+        if cargados:
+            problemas.append(f"carga {cargados}")
+        fallos += bool(problemas)
+        print(f"{nombre:<32} {extra_ms:+8.1f} ms  {'FALLO: ' + '; '.join(problemas) if problemas else 'ok'}")
+    sys.exit(1 if fallos else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Compara la extracción del audio de un archivo largo con un solo proceso de
+ffmpeg y con varios decodificando tramos a la vez: tiempo de cada modo,
+aceleración y si las muestras obtenidas son idénticas (o la diferencia
+máxima, en los códecs con síntesis de ruido como AAC).
+
+Uso:
+    python -m benchmarks.bench_extraccion archivo [--procesos 4] [--sample-rate 16000]
+"""
+import time
+import argparse
+import numpy as np
+from subtitle_package.audio import abrir_pcm, leer_en_buffer
+
+def extraer(ruta, sample_rate, procesos):
+    """Todas las muestras del archivo y los segundos que tardó la extracción."""
+    inicio = time.perf_counter()
+    proceso = abrir_pcm(ruta, sample_rate, procesos=procesos)
+    partes = []
+    try:
+        while True:
+            buffer = np.empty(sample_rate * 60, dtype=np.int16)
+            leidas = leer_en_buffer(proceso.stdout, buffer)
+            partes.append(buffer[:leidas])
+            if leidas < len(buffer):
+                break
+    finally:
+        proceso.stdout.close()
+        proceso.wait()
+    return np.concatenate(partes), time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivo")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    args = parser.parse_args()
+
+    secuencial, t_secuencial = extraer(args.archivo, args.sample_rate, 1)
+    paralela, t_paralela = extraer(args.archivo, args.sample_rate, args.procesos)
+    print(f"1 proceso:  {t_secuencial:7.2f} s  ({len(secuencial) / args.sample_rate:.1f} s de audio)")
+    print(f"{args.procesos} procesos: {t_paralela:7.2f} s  (x{t_secuencial / t_paralela:.2f})")
+    if len(secuencial) != len(paralela):
+        print(f"FALLO: {len(secuencial)} muestras frente a {len(paralela)}")
+        return
+    diferencia = int(np.abs(secuencial.astype(np.int32) - paralela).max()) if len(secuencial) else 0
+    print("Muestras idénticas" if not diferencia else f"Diferencia máxima: {diferencia} (de 32768)")
+
+if __name__ == "__main__":
+    main()
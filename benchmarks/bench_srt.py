@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks del modelo Cue y del parser/escritor SRT sobre archivos
+sintéticos (por defecto, 100.000 subtítulos).
+
+Uso:
+    python -m benchmarks.bench_srt [--cues 100000] [--repeticiones 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subtitle_package.cues import Cue, leer_srt, escribir_srt, formatear_srt
+from subtitle_package.reflow import reflow
+
+PALABRAS = ("hola", "mundo", "subtítulo", "traducción", "vídeo", "gracias", "qué", "tiempo",
+            "casa", "noche", "mañana", "nunca", "siempre", "después", "ahora")
+
+def generar_cues(n, semilla=0):
+    """Genera 'n' subtítulos consecutivos con texto aleatorio de 1 a 3 líneas."""
+    aleatorio = random.Random(semilla)
+    cues = []
+    inicio = 0
+    for i in range(1, n + 1):
+        duracion = aleatorio.randint(800, 6000)
+        lineas = [" ".join(aleatorio.choices(PALABRAS, k=aleatorio.randint(2, 12)))
+                  for _ in range(aleatorio.randint(1, 3))]
+        cues.append(Cue(i, inicio, inicio + duracion, "\n".join(lineas)))
+        inicio += duracion + aleatorio.randint(0, 500)
+    return cues
+
+def medir(nombre, funcion, repeticiones, n):
+    """Ejecuta 'funcion' varias veces e informa del mejor tiempo y del pico de memoria."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:<32} {mejor * 1000:9.1f} ms  {n / mejor:12,.0f} cues/s  pico {pico / 2**20:7.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cues", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    n = args.cues
+    cues = generar_cues(n)
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "sintetico.srt")
+        ruta_crlf = os.path.join(directorio, "sintetico_crlf.srt")
+        escribir_srt(cues, ruta)
+        with open(ruta_crlf, "w", encoding="utf-8-sig", newline="\r\n") as f:
+            f.write(formatear_srt(cues))
+        print(f"[INFO] {n:,} subtítulos, {os.path.getsize(ruta) / 2**20:.1f} MiB")
+
+        leidos = leer_srt(ruta)
+        medir("leer_srt", lambda: leer_srt(ruta), args.repeticiones, n)
+        medir("leer_srt (CRLF + BOM)", lambda: leer_srt(ruta_crlf), args.repeticiones, n)
+        medir("escribir_srt", lambda: escribir_srt(leidos, ruta + ".out"), args.repeticiones, n)
+        medir("formatear_srt", lambda: formatear_srt(leidos), args.repeticiones, n)
+        medir("reflow", lambda: sum(1 for _ in reflow(leidos)), args.repeticiones, n)
+
+        tracemalloc.start()
+        lista = leer_srt(ruta)
+        tamano, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{'memoria de la lista de Cue':<32} {tamano / len(lista):9.0f} B/cue")
+
+if __name__ == "__main__":
+    main()
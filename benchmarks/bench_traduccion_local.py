@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Rendimiento del backend de traducción local (subtitle_package.local_translation)
+con un modelo MarianMT diminuto inicializado al azar, sin descargas: mide
+bloques por segundo en CPU con distintos tamaños de lote, hilos y procesos.
+
+Con --modelo se mide un modelo real (nombre del Hub o ruta local).
+
+Uso:
+    python -m benchmarks.bench_traduccion_local [--cues 2000] [--modelo Helsinki-NLP/opus-mt-es-en]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subtitle_package.local_translation import TraductorLocal
+
+PALABRAS = ("hola", "mundo", "subtítulo", "traducción", "vídeo", "gracias", "qué", "tiempo",
+            "casa", "noche", "mañana", "nunca", "siempre", "después", "ahora")
+
+def crear_modelo_diminuto(directorio, semilla=0):
+    """
+    Guarda en 'directorio' un MarianMT de dos capas con pesos aleatorios y un
+    tokenizador de palabras (un token por palabra de PALABRAS), suficiente
+    para medir el coste de la inferencia. Los pesos son grandes para que la
+    salida dependa de la entrada, y con la misma semilla se obtiene siempre
+    el mismo modelo. Devuelve 'directorio'.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import MarianConfig, MarianMTModel, PreTrainedTokenizerFast
+
+    torch.manual_seed(semilla)
+
+    especiales = ["<pad>", "</s>", "<unk>"]
+    vocabulario = {palabra: i for i, palabra in enumerate(especiales + list(PALABRAS))}
+    base = Tokenizer(models.WordLevel(vocabulario, unk_token="<unk>"))
+    base.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizador = PreTrainedTokenizerFast(tokenizer_object=base, pad_token="<pad>",
+                                          eos_token="</s>", unk_token="<unk>")
+    config = MarianConfig(
+        vocab_size=len(vocabulario), d_model=32, encoder_layers=2, decoder_layers=2,
+        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=64, decoder_ffn_dim=64,
+        max_position_embeddings=128, pad_token_id=0, eos_token_id=1, decoder_start_token_id=0,
+        max_length=32, init_std=1.0,
+    )
+    MarianMTModel(config).save_pretrained(directorio)
+    tokenizador.save_pretrained(directorio)
+    return directorio
+
+def generar_textos(n, semilla=0):
+    aleatorio = random.Random(semilla)
+    return [" ".join(aleatorio.choices(PALABRAS, k=aleatorio.randint(2, 30))) for _ in range(n)]
+
+def medir(nombre, traductor, textos):
+    inicio = time.perf_counter()
+    traductor.traducir_textos(textos)
+    segundos = time.perf_counter() - inicio
+    print(f"{nombre:<40} {len(textos) / segundos:9.1f} bloques/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cues", type=int, default=2000)
+    parser.add_argument("--modelo", default=None)
+    args = parser.parse_args()
+
+    textos = generar_textos(args.cues)
+    with tempfile.TemporaryDirectory() as directorio:
+        modelo = args.modelo
+        if modelo is None:
+            crear_modelo_diminuto(directorio)
+            modelo = directorio
+        nucleos = os.cpu_count() or 1
+        medir("sin lotes (max_lote=1)", TraductorLocal(modelo, max_lote=1), textos[:200])
+        for max_lote in (8, 32, 64):
+            medir(f"max_lote={max_lote}, {nucleos} hilos", TraductorLocal(modelo, max_lote=max_lote), textos)
+        if nucleos > 1:
+            traductor = TraductorLocal(modelo, procesos=min(4, nucleos))
+            medir(f"{traductor.procesos} procesos x {traductor.hilos} hilos", traductor, textos)
+            traductor.cerrar()
+
+if __name__ == "__main__":
+    main()
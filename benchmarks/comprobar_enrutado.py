@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Comprobaciones del enrutador de traducciones (subtitle_package.router) sobre
+subtítulos leídos con el parser de SRT, tal y como le llegan en el pipeline
+(con las líneas de cada subtítulo unidas por espacios): cada caso indica el
+nivel al que debe ir. Termina con código 1 si alguno no coincide.
+
+Uso:
+    python -m benchmarks.comprobar_enrutado
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subtitle_package.cues import parsear_srt
+from subtitle_package.router import EnrutadorTraducciones, NIVEL_RAPIDO, NIVEL_COMPLETO
+
+# (texto del subtítulo en el SRT, nivel esperado)
+CASOS = (
+    ("- Hola.\n- Adiós.", NIVEL_COMPLETO),
+    ("-¿Qué haces?\n-Nada.", NIVEL_COMPLETO),
+    ("—Ven aquí. —No quiero.", NIVEL_COMPLETO),
+    ("- Solo habla uno", NIVEL_RAPIDO),
+    ("Uno - dos - tres", NIVEL_RAPIDO),
+    ("Es un bien-estar\npara todos", NIVEL_RAPIDO),
+)
+
+def main():
+    enrutador = EnrutadorTraducciones("en", "modelo-rapido", "modelo-completo")
+    fallos = 0
+    for texto, esperado in CASOS:
+        cue = parsear_srt(f"1\n00:00:01,000 --> 00:00:03,000\n{texto}\n")[0]
+        nivel = enrutador.nivel(cue.texto)
+        fallos += nivel != esperado
+        print(f"{cue.texto!r:<40} {nivel:<9} {'ok' if nivel == esperado else 'FALLO: se esperaba ' + esperado}")
+    sys.exit(1 if fallos else 0)
+
+if __name__ == "__main__":
+    main()
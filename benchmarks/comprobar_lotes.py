@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Comprueba que el enrutador de traducciones no multiplica las peticiones por
+lotes. Sobre un SRT sintético de 1000 subtítulos con frases triviales ("Sí.",
+que se resuelven en local), diálogos (modelo principal) y frases normales
+(modelo rápido) cuenta los lotes con y sin enrutador, tanto los de
+SRTTranslator.crear_lotes como las peticiones que hace el Pipeline (que
+además debe emitir los subtítulos en orden). Con el enrutador caben algunos
+lotes más (uno por nivel a medio llenar), pero no muchos más. Termina con
+código 1 si se supera 'MAX_PROPORCION'.
+
+No llama a la API: la función de traducción por lotes es simulada.
+
+Uso:
+    python -m benchmarks.comprobar_lotes
+"""
+import os
+import sys
+import random
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subtitle_package.cues import Cue
+from subtitle_package.pipeline import Pipeline
+from subtitle_package.router import EnrutadorTraducciones
+from subtitle_package.SRTTranslator import SRTTranslator
+
+# Lotes con enrutador / lotes sin enrutador que se admiten como máximo
+MAX_PROPORCION = 1.5
+
+TRIVIALES = ("Sí.", "No.", "Gracias.", "Vale.", "[Música]", "¿Hola?")
+DIALOGOS = ("- ¿Vienes?\n- Ahora no.", "-¿Qué haces aquí?\n-Nada, esperaba.", "—Ven. —No quiero.")
+FRASES = ("No sé si llegaremos a tiempo.", "Tenemos que hablar de lo que pasó ayer.",
+          "La reunión empieza a las nueve en punto.", "Nunca pensé que volvería a esta casa.",
+          "Dime la verdad, por una vez.", "El coche está aparcado detrás del edificio.")
+
+def subtitulos_sinteticos(n=1000, semilla=0):
+    aleatorio = random.Random(semilla)
+    cues = []
+    for i in range(n):
+        grupo = aleatorio.choices((TRIVIALES, DIALOGOS, FRASES), weights=(20, 15, 65))[0]
+        cues.append(Cue(i + 1, i * 3000, i * 3000 + 2500, aleatorio.choice(grupo)))
+    return cues
+
+def crear_traductor(enrutar, peticiones):
+    lock = threading.Lock()
+
+    def traducir_lote(textos, idioma_destino="en", contexto_previo="", contexto_siguiente="", modelo=None):
+        with lock:
+            peticiones.append(len(textos))
+        return {numero: f"[{idioma_destino}] {texto}" for numero, texto in textos.items()}
+
+    def traducir(texto, idioma_destino="en", contexto_previo="", contexto_siguiente="", modelo=None):
+        return traducir_lote({1: texto}, idioma_destino)[1]
+
+    enrutador = EnrutadorTraducciones("en", "modelo-rapido", "modelo-completo") if enrutar else None
+    return SRTTranslator(None, None, "en", translate_func=traducir, translate_batch_func=traducir_lote,
+                         max_tokens_lote=1000, enrutador=enrutador)
+
+def lotes_crear_lotes(cues, enrutar):
+    t = crear_traductor(enrutar, [])
+    t.bloques = cues
+    t.total_bloques = len(cues)
+    # Como en translate_all_por_lotes: los resueltos en local no se envían
+    locales = {i for i in range(len(cues)) if t.enrutador is not None
+               and t.enrutador.traduccion_local(t.obtener_texto_bloque(cues[i])) is not None}
+    return len(t.crear_lotes(excluidos=locales))
+
+def lotes_pipeline(cues, enrutar):
+    peticiones = []
+    pipeline = Pipeline(crear_traductor(enrutar, peticiones))
+    # Los lotes ya no son consecutivos: los subtítulos deben seguir saliendo en orden
+    recibidos = []
+    recibir = pipeline._recibir
+    pipeline._recibir = lambda entrada, pbar, _: recibir(entrada, pbar, recibidos)
+    pipeline.traducir_cues(cues)
+    if [cue.inicio_ms for cue in recibidos] != [cue.inicio_ms for cue in cues]:
+        raise RuntimeError("El Pipeline emitió los subtítulos traducidos desordenados")
+    return len(peticiones)
+
+def main():
+    cues = subtitulos_sinteticos()
+    fallos = 0
+    for nombre, contar in (("crear_lotes", lotes_crear_lotes), ("Pipeline", lotes_pipeline)):
+        sin_enrutador = contar(cues, False)
+        con_enrutador = contar(cues, True)
+        proporcion = con_enrutador / sin_enrutador
+        fallos += proporcion > MAX_PROPORCION
+        print(f"{nombre:<12} sin enrutador {sin_enrutador:>4} lotes, con enrutador {con_enrutador:>4} "
+              f"({proporcion:.2f}x) {'ok' if proporcion <= MAX_PROPORCION else 'FALLO'}")
+    sys.exit(1 if fallos else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Comprobaciones offline del backend de traducción local con el MarianMT
+diminuto de bench_traduccion_local (pesos aleatorios, sin descargas). Sus
+traducciones no tienen sentido, pero son deterministas, y eso basta para
+verificar que:
+
+- TraductorLocal devuelve cada traducción en la posición de su texto aunque
+  internamente ordene por longitud: traducir una permutación de los textos
+  da la misma permutación de las traducciones.
+- el reparto entre varios procesos da exactamente lo mismo que un solo proceso.
+
+Termina con código 1 si alguna comprobación falla. Necesita torch y transformers.
+
+Uso:
+    python -m benchmarks.comprobar_traduccion_local
+"""
+import os
+import sys
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_traduccion_local import PALABRAS, crear_modelo_diminuto
+from subtitle_package.local_translation import TraductorLocal
+
+def textos_de_longitudes_distintas(n, semilla=0):
+    """
+    'n' textos de 1 a n palabras en orden aleatorio. Al tener longitudes
+    distintas, el orden por longitud (y por tanto la composición de los
+    lotes) no depende del orden de entrada.
+    """
+    aleatorio = random.Random(semilla)
+    longitudes = list(range(1, n + 1))
+    aleatorio.shuffle(longitudes)
+    return [" ".join(aleatorio.choices(PALABRAS, k=k)) for k in longitudes]
+
+def comprobar_orden(modelo):
+    textos = textos_de_longitudes_distintas(24)
+    traductor = TraductorLocal(modelo, max_lote=4)
+    referencia = traductor.traducir_textos(textos)
+    permutacion = list(range(len(textos)))
+    random.Random(1).shuffle(permutacion)
+    permutados = traductor.traducir_textos([textos[i] for i in permutacion])
+    # Si el modelo diera la misma traducción para todo, la comprobación no probaría nada
+    return len(set(referencia)) > 1 and permutados == [referencia[i] for i in permutacion]
+
+def comprobar_procesos(modelo):
+    # Con lotes de un texto no interviene el relleno: cada traducción es la
+    # misma calcule el proceso que la calcule, y cualquier diferencia se debe
+    # al reparto o a la recomposición del resultado
+    textos = textos_de_longitudes_distintas(24, semilla=2)
+    uno = TraductorLocal(modelo, max_lote=1).traducir_textos(textos)
+    varios = TraductorLocal(modelo, procesos=2, hilos=1, max_lote=1)
+    try:
+        return len(set(uno)) > 1 and varios.traducir_textos(textos) == uno
+    finally:
+        varios.cerrar()
+
+COMPROBACIONES = (
+    ("orden de las traducciones tras ordenar por longitud", comprobar_orden),
+    ("varios procesos = un proceso", comprobar_procesos),
+)
+
+def main():
+    fallos = 0
+    with tempfile.TemporaryDirectory() as directorio:
+        modelo = crear_modelo_diminuto(directorio)
+        for nombre, comprobacion in COMPROBACIONES:
+            correcto = comprobacion(modelo)
+            fallos += not correcto
+            print(f"{nombre:<56} {'ok' if correcto else 'FALLO'}")
+    sys.exit(1 if fallos else 0)
+
+if __name__ == "__main__":
+    main()
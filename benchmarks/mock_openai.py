@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP local que imita los endpoints de OpenAI usados por el proyecto
+(/v1/chat/completions y /v1/audio/transcriptions), para medir el rendimiento
+sin gastar cuota.
+
+Permite configurar la distribución de latencia de cada endpoint (log-normal),
+inyectar errores 429 con Retry-After y aplicar límites de peticiones y tokens
+por minuto como los de la API real, incluidas las cabeceras x-ratelimit-*.
+
+Uso independiente:
+    python -m benchmarks.mock_openai [--puerto 8765] [--latencia-chat 0.5] [--prob-429 0.05]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python main.py
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+@dataclass
+class ConfigMock:
+    """
+    Comportamiento del servidor simulado.
+
+    Attributes:
+        latencia_chat (float): Mediana de la latencia de chat (segundos).
+        latencia_audio_por_minuto (float): Mediana de la latencia de transcripción
+            por minuto de audio (segundos).
+        dispersion (float): Sigma de la distribución log-normal (0 = latencia fija).
+        prob_429 (float): Probabilidad de responder 429 aunque no se supere ningún límite.
+        retry_after (float): Valor de Retry-After (segundos) en los 429.
+        rpm_chat (int): Peticiones por minuto de chat (0 = sin límite).
+        tpm_chat (int): Tokens por minuto de chat (0 = sin límite).
+        rpm_audio (int): Peticiones por minuto de transcripción (0 = sin límite).
+        segmentos_por_minuto (int): Segmentos SRT devueltos por minuto de audio.
+    """
+    latencia_chat: float = 0.5
+    latencia_audio_por_minuto: float = 2.0
+    dispersion: float = 0.4
+    prob_429: float = 0.0
+    retry_after: float = 1.0
+    rpm_chat: int = 0
+    tpm_chat: int = 0
+    rpm_audio: int = 0
+    segmentos_por_minuto: int = 20
+    semilla: int = 0
+
+class _Ventana:
+    """Límite por minuto con ventana deslizante, como el que aplica la API."""
+
+    def __init__(self, por_minuto):
+        self.por_minuto = por_minuto
+        self.eventos = []  # (instante, cantidad)
+        self._lock = threading.Lock()
+
+    def admitir(self, cantidad=1):
+        """Devuelve (admitido, restantes, segundos hasta que haya hueco)."""
+        if not self.por_minuto:
+            return True, None, 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            self.eventos = [(t, c) for t, c in self.eventos if ahora - t < 60]
+            usado = sum(c for _, c in self.eventos)
+            if usado + cantidad > self.por_minuto and self.eventos:
+                liberar = usado + cantidad - self.por_minuto
+                acumulado = 0
+                for t, c in self.eventos:
+                    acumulado += c
+                    if acumulado >= liberar:
+                        return False, self.por_minuto - usado, max(0.0, 60 - (ahora - t))
+            self.eventos.append((ahora, cantidad))
+            return True, self.por_minuto - usado - cantidad, 0.0
+
+@dataclass
+class EstadisticasMock:
+    peticiones: dict = field(default_factory=dict)
+    errores_429: dict = field(default_factory=dict)
+
+    def contar(self, tabla, endpoint):
+        tabla[endpoint] = tabla.get(endpoint, 0) + 1
+
+def _tokens(texto):
+    # Aproximación habitual: ~4 caracteres por token
+    return max(1, len(texto) // 4)
+
+def _traducir_falso(texto, idioma):
+    return f"[{idioma}] {texto}"
+
+def _respuesta_chat(peticion):
+    """Construye una respuesta verosímil para los prompts de traducción del proyecto."""
+    prompt = peticion["messages"][-1]["content"]
+    json_pedido = (peticion.get("response_format") or {}).get("type") == "json_object"
+    if json_pedido:
+        bloques = prompt.split("=== BLOQUES A TRADUCIR ===\n", 1)[-1].split("\n\n===", 1)[0]
+        textos = {m.group(1): m.group(2) for m in re.finditer(r"^\[(\d+)\] (.*)$", bloques, re.M)}
+        cabecera = prompt.split("CADA UNO DE LOS SIGUIENTES", 1)[0]
+        idiomas = [i.lower() for i in re.findall(r"'([A-Z-]+)'", cabecera)] or ["en"]
+        if "IDIOMAS" in cabecera:
+            traducciones = {i: {n: _traducir_falso(t, i) for n, t in textos.items()} for i in idiomas}
+        else:
+            traducciones = {n: _traducir_falso(t, idiomas[0]) for n, t in textos.items()}
+        return json.dumps({"traducciones": traducciones}, ensure_ascii=False)
+    texto = prompt.split("=== TEXTO A TRADUCIR ===\n", 1)[-1].split("\n\n===", 1)[0]
+    idioma = re.search(r"'([A-Z-]+)'", prompt)
+    return _traducir_falso(texto, idioma.group(1).lower() if idioma else "en")
+
+def _duracion_audio(cuerpo):
+    """Duración (s) del audio (WAV, FLAC u Ogg Opus) de una petición multipart, leyendo sus cabeceras."""
+    inicio = cuerpo.find(b"fLaC")
+    if inicio >= 0:
+        # STREAMINFO: frecuencia (20 bits) y número total de muestras (36 bits)
+        campos = int.from_bytes(cuerpo[inicio + 18:inicio + 26], "big")
+        return (campos & ((1 << 36) - 1)) / ((campos >> 44) or 16000)
+    inicio = cuerpo.find(b"OggS")
+    if inicio >= 0:
+        # Posición (a 48 kHz) de la última página menos las muestras de pre-skip de OpusHead
+        ultima = cuerpo.rfind(b"OggS")
+        cabecera_opus = cuerpo.find(b"OpusHead", inicio)
+        pre_skip = int.from_bytes(cuerpo[cabecera_opus + 10:cabecera_opus + 12], "little") if cabecera_opus >= 0 else 0
+        return max(0, int.from_bytes(cuerpo[ultima + 6:ultima + 14], "little") - pre_skip) / 48000
+    inicio = cuerpo.find(b"RIFF")
+    if inicio < 0:
+        return 0.0
+    cabecera = cuerpo[inicio:inicio + 44]
+    canales = int.from_bytes(cabecera[22:24], "little") or 1
+    frecuencia = int.from_bytes(cabecera[24:28], "little") or 16000
+    bits = int.from_bytes(cabecera[34:36], "little") or 16
+    datos = int.from_bytes(cabecera[40:44], "little")
+    return datos / (frecuencia * canales * bits // 8)
+
+def _srt_falso(duracion, segmentos_por_minuto):
+    numero = max(1, int(duracion / 60 * segmentos_por_minuto))
+    paso = duracion / numero
+    partes = []
+    for i in range(numero):
+        inicio, fin = i * paso, (i + 1) * paso - 0.1
+        marca = lambda s: f"{int(s // 3600):02}:{int(s % 3600 // 60):02}:{int(s % 60):02},{int(s * 1000 % 1000):03}"
+        partes.append(f"{i + 1}\n{marca(inicio)} --> {marca(fin)}\nfrase simulada número {i + 1} del fragmento\n")
+    return "\n".join(partes)
+
+class ServidorMock:
+    """
+    Servidor simulado en un hilo de fondo. 'url' es la base que debe usarse
+    como OPENAI_BASE_URL.
+    """
+
+    def __init__(self, config=None, puerto=0):
+        self.config = config or ConfigMock()
+        self.estadisticas = EstadisticasMock()
+        self._aleatorio = random.Random(self.config.semilla)
+        self._lock = threading.Lock()
+        self._limites = {
+            "chat": (_Ventana(self.config.rpm_chat), _Ventana(self.config.tpm_chat)),
+            "audio": (_Ventana(self.config.rpm_audio), _Ventana(0)),
+        }
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                cuerpo = self.rfile.read(int(self.headers.get("content-length", 0)))
+                servidor._atender(self, cuerpo)
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+        self._http.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._http.server_address[1]}/v1"
+        self._hilo = threading.Thread(target=self._http.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *excepcion):
+        self.detener()
+
+    def iniciar(self):
+        self._hilo.start()
+
+    def detener(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def _latencia(self, mediana):
+        with self._lock:
+            ruido = self._aleatorio.gauss(0, self.config.dispersion) if self.config.dispersion else 0.0
+            forzar_429 = self._aleatorio.random() < self.config.prob_429
+        return mediana * math.exp(ruido), forzar_429
+
+    def _responder(self, manejador, estado, cuerpo, tipo="application/json", cabeceras=()):
+        datos = cuerpo.encode("utf-8")
+        manejador.send_response(estado)
+        manejador.send_header("content-type", tipo)
+        manejador.send_header("content-length", str(len(datos)))
+        for nombre, valor in cabeceras:
+            manejador.send_header(nombre, valor)
+        try:
+            manejador.end_headers()
+            manejador.wfile.write(datos)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente canceló la petición (p. ej. la copia perdedora de una petición cubierta)
+            manejador.close_connection = True
+
+    def _atender(self, manejador, cuerpo):
+        endpoint = "chat" if manejador.path.endswith("/chat/completions") else "audio"
+        self.estadisticas.contar(self.estadisticas.peticiones, endpoint)
+        if endpoint == "chat":
+            peticion = json.loads(cuerpo)
+            tokens = sum(_tokens(m["content"]) for m in peticion["messages"])
+        else:
+            duracion = _duracion_audio(cuerpo)
+            tokens = 0
+
+        cubo_peticiones, cubo_tokens = self._limites[endpoint]
+        admitida, restantes, espera = cubo_peticiones.admitir(1)
+        if admitida:
+            admitida_tokens, restantes_tokens, espera_tokens = cubo_tokens.admitir(tokens)
+        else:
+            admitida_tokens, restantes_tokens, espera_tokens = True, None, 0.0
+        mediana = self.config.latencia_chat if endpoint == "chat" else \
+            self.config.latencia_audio_por_minuto * max(duracion, 1.0) / 60
+        latencia, forzar_429 = self._latencia(mediana)
+
+        if not admitida or not admitida_tokens or forzar_429:
+            self.estadisticas.contar(self.estadisticas.errores_429, endpoint)
+            espera = max(espera, espera_tokens) or self.config.retry_after
+            error = {"error": {"message": "Rate limit reached (simulado)", "type": "requests",
+                               "code": "rate_limit_exceeded"}}
+            self._responder(manejador, 429, json.dumps(error),
+                            cabeceras=[("retry-after", f"{math.ceil(espera)}"),
+                                       ("retry-after-ms", f"{int(espera * 1000)}")])
+            return
+
+        time.sleep(latencia)
+        cabeceras = []
+        if restantes is not None:
+            cabeceras += [("x-ratelimit-remaining-requests", str(restantes)), ("x-ratelimit-reset-requests", "1s")]
+        if restantes_tokens is not None:
+            cabeceras += [("x-ratelimit-remaining-tokens", str(restantes_tokens)), ("x-ratelimit-reset-tokens", "1s")]
+
+        if endpoint == "audio":
+            self._responder(manejador, 200, _srt_falso(duracion, self.config.segmentos_por_minuto),
+                            tipo="text/plain", cabeceras=cabeceras)
+            return
+        contenido = _respuesta_chat(peticion)
+        respuesta = {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+            "model": peticion.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": contenido}}],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": _tokens(contenido),
+                      "total_tokens": tokens + _tokens(contenido)},
+        }
+        self._responder(manejador, 200, json.dumps(respuesta, ensure_ascii=False), cabeceras=cabeceras)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia-chat", type=float, default=0.5)
+    parser.add_argument("--latencia-audio", type=float, default=2.0, help="Segundos por minuto de audio")
+    parser.add_argument("--dispersion", type=float, default=0.4)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--rpm-chat", type=int, default=0)
+    parser.add_argument("--tpm-chat", type=int, default=0)
+    parser.add_argument("--rpm-audio", type=int, default=0)
+    args = parser.parse_args()
+
+    config = ConfigMock(latencia_chat=args.latencia_chat, latencia_audio_por_minuto=args.latencia_audio,
+                        dispersion=args.dispersion, prob_429=args.prob_429, retry_after=args.retry_after,
+                        rpm_chat=args.rpm_chat, tpm_chat=args.tpm_chat, rpm_audio=args.rpm_audio)
+    servidor = ServidorMock(config, puerto=args.puerto)
+    servidor.iniciar()
+    print(f"[INFO] Servidor simulado en {servidor.url} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        servidor.detener()
+        print(f"[INFO] Peticiones: {servidor.estadisticas.peticiones}; 429: {servidor.estadisticas.errores_429}")
+
+if __name__ == "__main__":
+    main()
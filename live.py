@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Modo en directo: subtítulos incrementales, con unos segundos de retraso, de
+una emisión o de una grabación que todavía se está escribiendo.
+
+Uso:
+    python live.py grabacion.ts --idiomas en,fr --salida media/directo.vtt
+    ffmpeg -i rtmp://... -f mpegts - | python live.py - --idiomas en
+"""
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", help="Archivo que crece, tubería, URL o '-' para la entrada estándar")
+    parser.add_argument("--idiomas", default="en", help="Idiomas de destino separados por comas")
+    parser.add_argument("--salida", default="media/directo.srt",
+                        help="Archivo de subtítulos (.srt o .vtt); con varios idiomas se añade _<idioma>")
+    parser.add_argument("--original", default=None, help="Archivo para los subtítulos transcritos")
+    parser.add_argument("--ventana", type=float, default=10, help="Segundos de audio por ventana de transcripción")
+    parser.add_argument("--contexto-siguiente", type=int, default=0,
+                        help="Subtítulos posteriores que se esperan como contexto de la traducción")
+    args = parser.parse_args()
+
+    from subtitle_package.job import rutas_traducidas
+    from subtitle_package.live import subtitular_en_vivo
+
+    idiomas = list(dict.fromkeys(idioma.strip() for idioma in args.idiomas.split(",") if idioma.strip()))
+    salidas = {idiomas[0]: args.salida} if len(idiomas) == 1 else rutas_traducidas(args.salida, idiomas)
+    subtitular_en_vivo(args.entrada, salidas, srt_original=args.original, ventana_ms=int(args.ventana * 1000),
+                       contexto_siguiente=args.contexto_siguiente)
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,35 @@
-from subtitle_package.audio import extraer_audio
-from subtitle_package.transcription import transcribir_audio
-from subtitle_package.subtitles import generar_srt, traducir_srt
-from subtitle_package.video import insertar_subtitulos
-from parser_package.parser import parse
+import argparse
+from subtitle_package.metrics import obtener_metricas
 
 def menu():
     print("Bienvenido al generador de subtítulos")
     print("La ruta por defecto de los archivos es 'media/'")
 
     video_input = input("Ruta del vídeo (video.mp4): ")
-    audio_input = input("Ruta del audio extraído (audio.wav): ")
     srt_original_input = input("Archivo SRT original (subtitulos.srt): ")
-    srt_traducido_input = input("Archivo SRT traducido (subtitulos_en.srt): ")
     video_final_input = input("Vídeo final con subtítulos (video_con_subs.mp4): ")
-    idioma_destino = input("Idioma de destino (por defecto 'en'): ") or "en"
+    idiomas_input = input("Idiomas de destino separados por comas (por defecto 'en'): ") or "en"
 
     video = "media/" + (video_input or "video.mp4")
-    audio = "media/" + (audio_input or "audio.wav")
     srt_original = "media/" + (srt_original_input or "subtitulos.srt")
-    srt_traducido = "media/" + (srt_traducido_input or "subtitulos_en.srt")
     video_final = "media/" + (video_final_input or "video_con_subs.mp4")
+    idiomas = list(dict.fromkeys(idioma.strip() for idioma in idiomas_input.split(",") if idioma.strip()))
 
-    return video, audio, srt_original, srt_traducido, video_final, idioma_destino
+    return video, srt_original, video_final, idiomas
 
 def main():
-    video, audio, srt_original, srt_traducido, video_final, idioma_destino = menu()
-    extraer_audio(video, audio)
-    transcripcion = transcribir_audio(audio, chunk_length_ms=60000, max_workers=5)
-    generar_srt(transcripcion, srt_original)
-    traducir_srt(srt_original, srt_traducido, idioma_destino, num_contextos=2, max_workers=2)
-    parse(srt_traducido, srt_traducido)
-    insertar_subtitulos(video, srt_traducido, video_final, idioma=idioma_destino)
+    parser = argparse.ArgumentParser(description="Generador de subtítulos (modo interactivo)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Añade cProfile y tracemalloc de las etapas de texto al informe de rendimiento")
+    args = parser.parse_args()
+    if args.profile:
+        obtener_metricas().activar_perfil()
+
+    # Los backends (y sus dependencias) se cargan solo al procesar: '--help' es inmediato
+    from subtitle_package.job import procesar_video
+
+    video, srt_original, video_final, idiomas = menu()
+    procesar_video(video, srt_original, video_final, idiomas)
 
 if __name__ == "__main__":
     main()
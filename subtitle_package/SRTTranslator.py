@@ -1,16 +1,25 @@
 import os
-import time
+import json
+import difflib
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from openai import OpenAI
-from subtitle_package.config import OPENAI_API_KEY
-from transformers import pipeline
 from tqdm import tqdm
+from subtitle_package.tokens import contar_tokens
+from subtitle_package.cues import Cue, leer_srt, escribir_srt
+from subtitle_package.metrics import obtener_metricas
+from subtitle_package.router import NIVEL_LOCAL, NIVEL_RAPIDO, NIVEL_COMPLETO
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Versión del archivo auxiliar del modo incremental (ver 'guardar_origen')
+FORMATO_ORIGEN = 2
+
+class LoteDesalineadoError(ValueError):
+    """El modelo devolvió un número de bloques distinto al enviado en el lote."""
 
 class SRTTranslator:
     def __init__(self, srt_path, srt_traducido_path, idioma_destino="en",
-                 num_contextos=2, max_workers=5, translate_func=None):
+                 num_contextos=2, max_workers=5, translate_func=None,
+                 translate_batch_func=None, max_tokens_lote=1000,
+                 cache=None, modelo="gpt-4o", version_prompt=1, num_contextos_siguientes=None,
+                 enrutador=None, incremental=False, backend=None):
         """
         Inicializa el traductor de archivos SRT.
         
@@ -21,109 +30,177 @@ class SRTTranslator:
             num_contextos (int): Número de bloques de contexto a usar antes y después.
             max_workers (int): Número máximo de hilos para la concurrencia.
             translate_func (callable): Función que realiza la traducción de un texto dado.
+            translate_batch_func (callable): Función que traduce varios bloques (no necesariamente
+                consecutivos) en una sola petición. Si se indica, se activa el modo por lotes.
+            max_tokens_lote (int): Presupuesto de tokens de texto por lote en el modo por lotes.
+            cache (CacheTraducciones): Caché persistente consultada antes de cada traducción.
+            modelo (str): Modelo que usan las funciones de traducción (forma parte de la clave de caché).
+            version_prompt (int): Versión del prompt (forma parte de la clave de caché).
+            num_contextos_siguientes (int): Bloques de contexto posteriores, si deben
+                ser distintos de 'num_contextos' (0 en directo: solo contexto previo).
+            enrutador (EnrutadorTraducciones): Si se indica, cada bloque se resuelve
+                en local o se envía al modelo de su nivel; las funciones de
+                traducción reciben entonces el argumento 'modelo'.
+            incremental (bool): Reutiliza la traducción anterior de los bloques
+                cuyo texto y contexto no han cambiado desde la última ejecución
+                (ver 'reutilizar_anteriores').
+            backend (TraductorLocal): Backend de las funciones de traducción con
+                un 'resumen()' que se muestra al terminar (ver 'informar_resumen').
         """
         self.srt_path = srt_path
         self.srt_traducido_path = srt_traducido_path
         self.idioma_destino = idioma_destino
         self.num_contextos = num_contextos
+        self.num_contextos_siguientes = num_contextos if num_contextos_siguientes is None \
+            else num_contextos_siguientes
         self.max_workers = max_workers
         self.translate_func = translate_func  # Función de traducción inyectada
+        self.translate_batch_func = translate_batch_func
+        self.max_tokens_lote = max_tokens_lote
+        self.cache = cache
+        self.modelo = modelo
+        self.version_prompt = version_prompt
+        self.enrutador = enrutador
+        self.incremental = incremental
+        self.backend = backend
+        if cache is not None and translate_func is not None:
+            # En el modo por lotes cada bloque ya se consulta (y se cuenta) en
+            # 'traduccion_en_cache'; la función individual solo traduce los que faltaban
+            self.translate_func = cache.envolver(translate_func, modelo, version_prompt,
+                                                 contar=translate_batch_func is None)
 
-        self.bloques = []
+        self.bloques = []  # Lista de Cue
         self.total_bloques = 0
+        self.anteriores = {}  # Índice -> bloque traducido reutilizado de la ejecución anterior
+        self.ventanas_anteriores = {}  # Ventana -> (traducción, tiempos) (ver 'preparar_anteriores')
 
     def read_file(self):
-        """Lee el archivo SRT y divide el contenido en bloques."""
+        """Lee el archivo SRT y carga sus bloques (Cue)."""
         if not os.path.exists(self.srt_path):
             raise FileNotFoundError(f"No se encontró el archivo: {self.srt_path}")
-        with open(self.srt_path, "r", encoding="utf-8") as f:
-            contenido = f.read()
-        self.bloques = contenido.strip().split("\n\n")
+        self.bloques = leer_srt(self.srt_path)
         self.total_bloques = len(self.bloques)
 
-    def obtener_texto_bloque(self, bloque: str) -> str:
-        """Extrae el texto del bloque (a partir de la tercera línea)."""
-        lineas = bloque.split("\n")
-        if len(lineas) >= 3:
-            return " ".join(lineas[2:]).strip()
-        return ""
+    def obtener_texto_bloque(self, bloque) -> str:
+        """Devuelve el texto del bloque."""
+        return bloque.texto
 
-    def obtener_contexto_previo(self, indice: int) -> str:
-        """Obtiene el contexto previo usando 'num_contextos' bloques anteriores."""
+    def obtener_contexto_previo(self, indice: int, bloques=None) -> str:
+        """Obtiene el contexto previo usando 'num_contextos' bloques anteriores (de 'bloques', si se indica)."""
+        bloques = self.bloques if bloques is None else bloques
         contexto = []
         for offset in range(self.num_contextos, 0, -1):
             if indice - offset >= 0:
-                contexto.append(self.obtener_texto_bloque(self.bloques[indice - offset]))
+                contexto.append(self.obtener_texto_bloque(bloques[indice - offset]))
         return "\n".join(contexto)
 
-    def obtener_contexto_siguiente(self, indice: int) -> str:
-        """Obtiene el contexto siguiente usando 'num_contextos' bloques posteriores."""
+    def obtener_contexto_siguiente(self, indice: int, bloques=None) -> str:
+        """Obtiene el contexto siguiente usando 'num_contextos_siguientes' bloques posteriores."""
+        bloques = self.bloques if bloques is None else bloques
         contexto = []
-        for offset in range(1, self.num_contextos + 1):
-            if indice + offset < self.total_bloques:
-                contexto.append(self.obtener_texto_bloque(self.bloques[indice + offset]))
+        for offset in range(1, self.num_contextos_siguientes + 1):
+            if indice + offset < len(bloques):
+                contexto.append(self.obtener_texto_bloque(bloques[indice + offset]))
         return "\n".join(contexto)
 
-    def procesar_bloque(self, indice: int) -> str:
+    def nivel_bloque(self, indice: int) -> str:
+        """Nivel del enrutador ('local', 'rapido' o 'completo') de un bloque con texto."""
+        if self.enrutador is None:
+            return NIVEL_COMPLETO
+        texto = self.obtener_texto_bloque(self.bloques[indice])
+        if self.enrutador.traduccion_local(texto) is not None:
+            return NIVEL_LOCAL
+        return self.enrutador.nivel(texto)
+
+    def modelo_bloque(self, indice: int) -> str:
+        """Modelo con el que se traduce un bloque (forma parte de su clave de caché)."""
+        if self.enrutador is None:
+            return self.modelo
+        return self.enrutador.modelo(self.nivel_bloque(indice))
+
+    def resolver_local(self, indice: int):
+        """
+        Devuelve el bloque traducido sin llamar a la API si el enrutador puede
+        resolverlo en local, o None.
+        """
+        if self.enrutador is None or not self.bloques[indice].texto:
+            return None
+        traduccion = self.enrutador.traduccion_local(self.obtener_texto_bloque(self.bloques[indice]))
+        if traduccion is None:
+            return None
+        self.enrutador.contar(NIVEL_LOCAL)
+        return self.bloques[indice].con_texto(traduccion)
+
+    def _traducir_texto(self, indice: int, modelo=None) -> str:
+        """Traduce el texto de un bloque con su contexto (con 'modelo', si lo hay)."""
+        argumentos = {"modelo": modelo} if modelo is not None else {}
+        # Llamamos a la función de traducción que nos pasaron en el constructor
+        return self.translate_func(
+            self.obtener_texto_bloque(self.bloques[indice]),
+            self.idioma_destino,
+            contexto_previo=self.obtener_contexto_previo(indice),
+            contexto_siguiente=self.obtener_contexto_siguiente(indice),
+            **argumentos
+        )
+
+    def procesar_bloque(self, indice: int, nivel=None):
         """
         Procesa y traduce un bloque, utilizando el contexto previo y siguiente.
+        Devuelve un Cue con los mismos tiempos y el texto traducido.
+
+        Con enrutador, el bloque se resuelve en local o se traduce con el modelo
+        de su nivel (o de 'nivel', si se indica). Una traducción rápida dudosa
+        se repite con el modelo principal.
         """
         bloque = self.bloques[indice]
-        lineas = bloque.split("\n")
-        if len(lineas) < 3:
-            # Si no tiene al menos índice, tiempo y texto, devolvemos el bloque tal cual.
+        if not bloque.texto:
+            # Si no tiene texto, devolvemos el bloque tal cual.
             return bloque
 
-        texto_actual = self.obtener_texto_bloque(bloque)
-        contexto_previo = self.obtener_contexto_previo(indice)
-        contexto_siguiente = self.obtener_contexto_siguiente(indice)
+        if self.enrutador is None:
+            return bloque.con_texto(self._traducir_texto(indice))
 
-        # Llamamos a la función de traducción que nos pasaron en el constructor
-        texto_traducido = self.translate_func(
-            texto_actual,
-            self.idioma_destino,
-            contexto_previo=contexto_previo,
-            contexto_siguiente=contexto_siguiente
-        )
+        local = self.resolver_local(indice) if nivel is None else None
+        if local is not None:
+            return local
+        nivel = nivel or self.nivel_bloque(indice)
+        texto_traducido = self._traducir_texto(indice, self.enrutador.modelo(nivel))
+        escalado = nivel == NIVEL_RAPIDO and self.enrutador.dudosa(self.obtener_texto_bloque(bloque),
+                                                                   texto_traducido)
+        if escalado:
+            nivel = NIVEL_COMPLETO
+            texto_traducido = self._traducir_texto(indice, self.enrutador.modelo(NIVEL_COMPLETO))
+            if self.cache is not None:
+                # La clave del nivel rápido apunta a la traducción definitiva
+                self.cache.guardar(self.clave_cache(indice), texto_traducido)
+        self.enrutador.contar(nivel)
+        if escalado:
+            self.enrutador.contar_escalado()
 
-        # Reconstruir el bloque con las dos primeras líneas (índice y marca de tiempo) y la traducción.
-        bloque_traducido = "\n".join(lineas[:2] + [texto_traducido])
-        return bloque_traducido
-
-    def procesar_bloque_con_retries(self, indice: int, max_retries=30, base_backoff=0.5) -> str:
-        """
-        Procesa un bloque con reintentos usando backoff exponencial en caso de error por límite.
-        """
-        intento = 0
-        while intento < max_retries:
-            try:
-                return self.procesar_bloque(indice)
-            except Exception as e:
-                mensaje = str(e).lower()
-                if "rate limit" in mensaje:
-                    wait_time = base_backoff * (2 ** intento)
-                    print(f"[WARNING] Error rate limit en bloque {indice+1}: {e}. "
-                          f"Reintentando en {wait_time:.2f} segundos...")
-                    time.sleep(wait_time)
-                    intento += 1
-                else:
-                    # Si no es un error de límite, lo lanzamos de nuevo
-                    raise e
-        raise Exception(f"[ERROR] Fallo en el bloque {indice+1} tras {max_retries} intentos.")
+        # El bloque traducido conserva índice y marcas de tiempo
+        return bloque.con_texto(texto_traducido)
 
     def translate_all(self) -> list:
         """
-        Traduce todos los bloques en paralelo usando ThreadPoolExecutor,
-        aplicando reintentos con backoff cuando haya errores de límite.
+        Traduce todos los bloques en paralelo usando ThreadPoolExecutor.
+        Los reintentos ante errores de límite o de red los gestiona la función
+        de traducción (el motor de la API en el caso de GPT). Los bloques más
+        largos se envían primero, para que ninguno quede rezagado al final.
         """
-        resultados = [None] * self.total_bloques
+        if self.translate_batch_func is not None:
+            return self.translate_all_por_lotes()
+
+        resultados = [self.anteriores.get(i) for i in range(self.total_bloques)]
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # Programamos cada bloque para procesarlo en paralelo
+            orden = sorted((i for i in range(self.total_bloques) if i not in self.anteriores), reverse=True,
+                           key=lambda i: len(self.obtener_texto_bloque(self.bloques[i])))
             future_to_index = {
-                executor.submit(self.procesar_bloque_con_retries, i): i
-                for i in range(self.total_bloques)
+                executor.submit(self.procesar_bloque, i): i
+                for i in orden
             }
             pbar = tqdm(total=self.total_bloques, desc="Traduciendo bloques")
+            pbar.update(len(self.anteriores))
             for future in as_completed(future_to_index):
                 i = future_to_index[future]
                 try:
@@ -134,12 +211,315 @@ class SRTTranslator:
                     resultados[i] = self.bloques[i]
                 pbar.update(1)
             pbar.close()
+        self.informar_resumen()
+        return resultados
+
+    def clave_cache(self, indice: int) -> str:
+        """Clave de caché de un bloque con su propia ventana de contexto."""
+        return self.cache.clave(
+            self.obtener_texto_bloque(self.bloques[indice]),
+            self.idioma_destino,
+            self.obtener_contexto_previo(indice),
+            self.obtener_contexto_siguiente(indice),
+            self.modelo_bloque(indice),
+            self.version_prompt
+        )
+
+    def traduccion_en_cache(self, indice: int):
+        """
+        Devuelve el bloque traducido a partir de la caché o None si no está
+        (o si no hay caché configurada).
+        """
+        if self.cache is None:
+            return None
+        traduccion = self.cache.obtener(self.clave_cache(indice))
+        if traduccion is None:
+            return None
+        return self.bloques[indice].con_texto(traduccion)
+
+    def crear_lotes(self, excluidos=()) -> list:
+        """
+        Agrupa los bloques traducibles en lotes cuyo texto no supere
+        'max_tokens_lote' tokens, ordenados por su primer bloque. Los bloques
+        sin texto y los 'excluidos' no forman parte de ningún lote, pero no lo
+        cortan: las traducciones se identifican por índice y un lote no tiene
+        por qué ser consecutivo. Cada lote va a un solo modelo, así que los
+        bloques de cada nivel del enrutador se agrupan por separado.
+        """
+        lotes = []
+        en_curso = {}  # Nivel -> (lote, tokens del lote)
+        for i, bloque in enumerate(self.bloques):
+            if not bloque.texto or i in excluidos:
+                continue
+            tokens = contar_tokens(self.obtener_texto_bloque(bloque))
+            nivel = self.nivel_bloque(i)
+            lote_actual, tokens_lote = en_curso.get(nivel, ([], 0))
+            if lote_actual and tokens_lote + tokens > self.max_tokens_lote:
+                lotes.append(lote_actual)
+                lote_actual, tokens_lote = [], 0
+            lote_actual.append(i)
+            en_curso[nivel] = (lote_actual, tokens_lote + tokens)
+        lotes.extend(lote for lote, _ in en_curso.values() if lote)
+        return sorted(lotes)
+
+    def procesar_lote(self, indices: list) -> dict:
+        """
+        Traduce un lote de bloques en una sola petición, compartiendo un único
+        contexto previo (antes del primero) y siguiente (después del último).
+        Con enrutador, el lote se envía al modelo del nivel de sus bloques y los
+        bloques cuya traducción rápida es dudosa se repiten con el modelo principal.
+
+        Returns:
+            dict: Índice de bloque -> bloque traducido.
+        """
+        textos = {i + 1: self.obtener_texto_bloque(self.bloques[i]) for i in indices}
+        nivel = self.nivel_bloque(indices[0])
+        argumentos = {"modelo": self.enrutador.modelo(nivel)} if self.enrutador is not None else {}
+        traducciones = self.translate_batch_func(
+            textos,
+            self.idioma_destino,
+            contexto_previo=self.obtener_contexto_previo(indices[0]),
+            contexto_siguiente=self.obtener_contexto_siguiente(indices[-1]),
+            **argumentos
+        )
+        if set(traducciones) != set(textos):
+            raise LoteDesalineadoError(
+                f"Se enviaron {len(textos)} bloques y se recibieron {len(traducciones)}."
+            )
+        resultados = {}
+        for i in indices:
+            if (self.enrutador is not None and nivel == NIVEL_RAPIDO
+                    and self.enrutador.dudosa(textos[i + 1], traducciones[i + 1])):
+                resultados[i] = self.procesar_bloque(i, NIVEL_COMPLETO)
+                self.enrutador.contar_escalado()
+                traduccion = resultados[i].texto
+            else:
+                resultados[i] = self.bloques[i].con_texto(traducciones[i + 1])
+                if self.enrutador is not None:
+                    self.enrutador.contar(nivel)
+                traduccion = traducciones[i + 1]
+            if self.cache is not None:
+                self.cache.guardar(self.clave_cache(i), traduccion)
         return resultados
 
+    def procesar_lote_con_fallback(self, indices: list) -> dict:
+        """
+        Procesa un lote y, si la respuesta no está alineada, lo divide en dos
+        mitades y vuelve a intentarlo. Un lote de un solo bloque se traduce
+        con la función individual.
+        """
+        if len(indices) == 1:
+            return {indices[0]: self.procesar_bloque(indices[0])}
+        try:
+            return self.procesar_lote(indices)
+        except LoteDesalineadoError as e:
+            print(f"[WARNING] Lote de bloques {indices[0]+1}-{indices[-1]+1} desalineado: {e} "
+                  "Dividiendo en lotes más pequeños...")
+        mitad = len(indices) // 2
+        resultados = self.procesar_lote_con_fallback(indices[:mitad])
+        resultados.update(self.procesar_lote_con_fallback(indices[mitad:]))
+        return resultados
+
+    def translate_all_por_lotes(self) -> list:
+        """
+        Traduce todos los bloques agrupándolos en lotes por presupuesto de tokens.
+        Los bloques sin texto y los de lotes fallidos se dejan sin traducir. Los
+        bloques que el enrutador resuelve en local y los que están en la caché no
+        se envían (tampoco los reutilizados de la ejecución anterior), y los
+        lotes más largos se envían primero.
+        """
+        resultados = list(self.bloques)
+        resueltos = set(self.anteriores)
+        for i, bloque_traducido in self.anteriores.items():
+            resultados[i] = bloque_traducido
+        if self.cache is not None or self.enrutador is not None:
+            for i, bloque in enumerate(self.bloques):
+                if not bloque.texto or i in resueltos:
+                    continue
+                bloque_traducido = self.resolver_local(i) or self.traduccion_en_cache(i)
+                if bloque_traducido is not None:
+                    resultados[i] = bloque_traducido
+                    resueltos.add(i)
+        lotes = sorted(self.crear_lotes(excluidos=resueltos), reverse=True,
+                       key=lambda lote: sum(len(self.obtener_texto_bloque(self.bloques[i])) for i in lote))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_lote = {
+                executor.submit(self.procesar_lote_con_fallback, lote): lote
+                for lote in lotes
+            }
+            pbar = tqdm(total=self.total_bloques, desc="Traduciendo bloques por lotes")
+            pbar.update(self.total_bloques - sum(len(lote) for lote in lotes))
+            for future in as_completed(future_to_lote):
+                lote = future_to_lote[future]
+                try:
+                    for i, bloque_traducido in future.result().items():
+                        resultados[i] = bloque_traducido
+                except Exception as e:
+                    print(f"[ERROR] Fallo en el lote {lote[0]+1}-{lote[-1]+1}: {e}")
+                pbar.update(len(lote))
+            pbar.close()
+        self.informar_resumen()
+        return resultados
+
+    def informar_resumen(self):
+        """Muestra, al terminar una traducción, el resumen del enrutador y del backend, si los hay."""
+        for origen in (self.enrutador, self.backend):
+            if origen is not None:
+                print(f"[INFO] {origen.resumen()}")
+
+    def ruta_origen(self) -> str:
+        """Ruta del archivo auxiliar con el original de la última traducción (modo incremental)."""
+        return self.srt_traducido_path + ".origen.json"
+
+    def parametros_incremental(self) -> dict:
+        """Parámetros que, si cambian, invalidan las traducciones anteriores."""
+        return {"idioma_destino": self.idioma_destino, "num_contextos": self.num_contextos,
+                "num_contextos_siguientes": self.num_contextos_siguientes, "modelo": self.modelo,
+                "modelo_rapido": self.enrutador.modelo_rapido if self.enrutador is not None else None,
+                "version_prompt": self.version_prompt}
+
+    def leer_anteriores(self):
+        """
+        Devuelve los bloques originales de la última ejecución y la traducción
+        de cada uno (dos listas paralelas: Cue y str), o None si no los hay o
+        se tradujeron con otros parámetros. Las traducciones se guardan junto
+        al original, antes del reflow, así que no importa que el SRT
+        traducido tenga otro número de subtítulos.
+        """
+        if self.srt_traducido_path is None or not os.path.exists(self.ruta_origen()):
+            return None
+        with open(self.ruta_origen(), "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos.get("formato") != FORMATO_ORIGEN:
+            return None
+        if datos.get("parametros") != self.parametros_incremental():
+            print("[INFO] La traducción anterior se hizo con otros parámetros; se traduce todo de nuevo.")
+            return None
+        originales = [Cue(None, inicio_ms, fin_ms, texto) for inicio_ms, fin_ms, texto, _ in datos["bloques"]]
+        return originales, [traduccion for _, _, _, traduccion in datos["bloques"]]
+
+    def _sin_traducir(self, original, traduccion) -> bool:
+        """Indica si un bloque anterior quedó sin traducir (por un fallo) y hay que volver a pedirlo."""
+        texto = self.obtener_texto_bloque(original)
+        if not texto or traduccion != texto:
+            return False
+        return self.enrutador is None or self.enrutador.traduccion_local(texto) != texto
+
+    def clave_ventana(self, indice: int, bloques=None) -> tuple:
+        """Texto de un bloque con su ventana de contexto: si no cambia, su traducción tampoco."""
+        bloques = self.bloques if bloques is None else bloques
+        return (self.obtener_contexto_previo(indice, bloques), self.obtener_texto_bloque(bloques[indice]),
+                self.obtener_contexto_siguiente(indice, bloques))
+
+    def preparar_anteriores(self):
+        """
+        Modo incremental cuando los bloques llegan de uno en uno (Pipeline) y
+        no se pueden alinear las dos versiones completas: indexa la traducción
+        de cada bloque anterior por su ventana ('clave_ventana'), la misma
+        condición que exige 'reutilizar_anteriores'. Se consulta con
+        'traduccion_anterior'.
+        """
+        self.ventanas_anteriores = {}
+        anteriores = self.leer_anteriores()
+        if anteriores is None:
+            return
+        originales, traducciones = anteriores
+        for i, (original, traduccion) in enumerate(zip(originales, traducciones)):
+            if not self._sin_traducir(original, traduccion):
+                # Una misma ventana puede repetirse: se guardan los tiempos de todas
+                _, tiempos = self.ventanas_anteriores.setdefault(self.clave_ventana(i, originales),
+                                                                 (traduccion, set()))
+                tiempos.add((original.inicio_ms, original.fin_ms))
+
+    def traduccion_anterior(self, indice: int):
+        """
+        Bloque traducido reutilizado de la ejecución anterior si su ventana no
+        ha cambiado (ver 'preparar_anteriores'), con los tiempos actuales, o None.
+        """
+        anterior = self.ventanas_anteriores.get(self.clave_ventana(indice)) if self.ventanas_anteriores else None
+        if anterior is None:
+            return None
+        return self.bloques[indice].con_texto(anterior[0])
+
+    def retemporizado(self, indice: int) -> bool:
+        """Indica si un bloque reutilizado con 'traduccion_anterior' solo cambió sus tiempos."""
+        _, tiempos = self.ventanas_anteriores[self.clave_ventana(indice)]
+        return (self.bloques[indice].inicio_ms, self.bloques[indice].fin_ms) not in tiempos
+
+    def reutilizar_anteriores(self) -> dict:
+        """
+        Alinea los bloques actuales con los de la última ejecución (difflib
+        sobre el texto de los bloques) y reutiliza la traducción de cada bloque
+        cuyo texto y ventana de contexto no han cambiado. Si solo cambiaron sus
+        tiempos, se conserva la traducción con los tiempos nuevos. Se vuelven a
+        traducir los bloques editados, los vecinos cuyo contexto incluye
+        alguno de ellos y los que quedaron sin traducir por un fallo.
+
+        Returns:
+            dict: Índice de bloque -> bloque traducido reutilizado.
+        """
+        anteriores = self.leer_anteriores()
+        if anteriores is None:
+            return {}
+        originales, traducciones = anteriores
+        alineador = difflib.SequenceMatcher(None, [self.obtener_texto_bloque(b) for b in originales],
+                                            [self.obtener_texto_bloque(b) for b in self.bloques], autojunk=False)
+        reutilizados = {}
+        retemporizados = 0
+        for etiqueta, i1, _, j1, j2 in alineador.get_opcodes():
+            if etiqueta != "equal":
+                continue
+            for desplazamiento in range(j2 - j1):
+                anterior, actual = i1 + desplazamiento, j1 + desplazamiento
+                if (self.obtener_contexto_previo(actual) != self.obtener_contexto_previo(anterior, originales)
+                        or self.obtener_contexto_siguiente(actual)
+                        != self.obtener_contexto_siguiente(anterior, originales)):
+                    continue
+                bloque = self.bloques[actual]
+                if self._sin_traducir(originales[anterior], traducciones[anterior]):
+                    continue
+                reutilizados[actual] = bloque.con_texto(traducciones[anterior])
+                retemporizados += (bloque.inicio_ms, bloque.fin_ms) != (originales[anterior].inicio_ms,
+                                                                         originales[anterior].fin_ms)
+        self.informar_reutilizados(reutilizados, retemporizados)
+        return reutilizados
+
+    def informar_reutilizados(self, reutilizados, retemporizados):
+        """Anota en las métricas y muestra cuántos bloques se reutilizaron y cuántas llamadas se ahorraron."""
+        # Llamadas a la API que habría costado traducir de nuevo los bloques reutilizados
+        locales = {i for i, bloque in enumerate(self.bloques)
+                   if bloque.texto and self.enrutador is not None
+                   and self.enrutador.traduccion_local(self.obtener_texto_bloque(bloque)) is not None}
+        if self.translate_batch_func is not None:
+            ahorradas = len(self.crear_lotes(excluidos=locales)) \
+                - len(self.crear_lotes(excluidos=locales | set(reutilizados)))
+        else:
+            ahorradas = sum(1 for i in reutilizados if self.bloques[i].texto and i not in locales)
+        metricas = obtener_metricas()
+        metricas.incrementar("traduccion_incremental", len(reutilizados), resultado="reutilizado")
+        metricas.incrementar("traduccion_incremental", self.total_bloques - len(reutilizados),
+                             resultado="traducido")
+        metricas.incrementar("llamadas_ahorradas_incremental", ahorradas)
+        print(f"[INFO] Traducción incremental: {len(reutilizados)} de {self.total_bloques} bloques reutilizados "
+              f"({retemporizados} solo con tiempos nuevos), {self.total_bloques - len(reutilizados)} por "
+              f"traducir; {ahorradas} llamadas a la API ahorradas.")
+
+    def guardar_origen(self, bloques_traducidos):
+        """
+        Guarda junto a la traducción el original del que procede y la
+        traducción de cada bloque (antes del reflow), para el modo incremental.
+        """
+        datos = {"formato": FORMATO_ORIGEN, "parametros": self.parametros_incremental(),
+                 "bloques": [[bloque.inicio_ms, bloque.fin_ms, bloque.texto, traducido.texto]
+                             for bloque, traducido in zip(self.bloques, bloques_traducidos)]}
+        with open(self.ruta_origen(), "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+
     def write_file(self, bloques_traducidos: list):
         """Escribe el contenido traducido en el archivo de salida."""
-        with open(self.srt_traducido_path, "w", encoding="utf-8") as f:
-            f.write("\n\n".join(bloques_traducidos))
+        escribir_srt(bloques_traducidos, self.srt_traducido_path)
+        if self.incremental:
+            self.guardar_origen(bloques_traducidos)
         print(f"[INFO] Archivo traducido guardado en: {self.srt_traducido_path}")
 
     def run(self):
@@ -147,5 +527,11 @@ class SRTTranslator:
         Ejecuta el proceso completo de traducción: lectura, traducción concurrente y escritura.
         """
         self.read_file()
+        if self.incremental:
+            self.anteriores = self.reutilizar_anteriores()
         bloques_traducidos = self.translate_all()
         self.write_file(bloques_traducidos)
+        if self.cache is not None:
+            estadisticas = self.cache.estadisticas()
+            print(f"[INFO] Caché de traducciones: {estadisticas['aciertos']} aciertos, "
+                  f"{estadisticas['fallos']} fallos.")
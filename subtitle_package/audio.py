@@ -1,4 +1,13 @@
+import os
+import re
+import math
+import threading
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from subtitle_package.metrics import obtener_metricas
 
 def extraer_audio(video_path, audio_path):
     """
@@ -22,5 +31,420 @@ def extraer_audio(video_path, audio_path):
     ]
 
     print(f"[INFO] Extrayendo audio desde: {video_path}")
-    subprocess.run(comando, check=True)
+    with obtener_metricas().etapa("extraer_audio"):
+        subprocess.run(comando, check=True)
     print(f"[INFO] Audio extraído y guardado en: {audio_path}")
+
+# Whisper trabaja internamente a 16 kHz en mono: no hace falta más resolución.
+SAMPLE_RATE_WHISPER = 16000
+
+# Segundos sin datos nuevos tras los que se da por terminado un archivo en vivo
+ESPERA_FIN_EN_VIVO_S = 10
+
+# Duración mínima de un archivo para decodificarlo por tramos en paralelo
+MIN_DURACION_PARALELA_S = 600
+
+class FragmentoAudio:
+    """
+    Fragmento de audio PCM (int16, mono) con su posición exacta dentro del audio original.
+
+    Attributes:
+        indice (int): Posición del fragmento en la secuencia.
+        offset (int): Muestra del audio original en la que empieza el fragmento.
+        muestras (numpy.ndarray): Muestras del fragmento. Puede ser una vista sobre
+            un buffer reutilizable, por lo que no debe conservarse más allá de su uso.
+        sample_rate (int): Frecuencia de muestreo en Hz.
+        inicio_nucleo (int): Primera muestra que pertenece en exclusiva a este fragmento.
+        fin_nucleo (int): Muestra final (excluida) que pertenece en exclusiva a este fragmento.
+            Fuera del núcleo el fragmento se solapa con sus vecinos.
+    """
+    __slots__ = ("indice", "offset", "muestras", "sample_rate", "inicio_nucleo", "fin_nucleo")
+
+    def __init__(self, indice, offset, muestras, sample_rate=SAMPLE_RATE_WHISPER,
+                 inicio_nucleo=None, fin_nucleo=None):
+        self.indice = indice
+        self.offset = offset
+        self.muestras = muestras
+        self.sample_rate = sample_rate
+        self.inicio_nucleo = offset if inicio_nucleo is None else inicio_nucleo
+        self.fin_nucleo = offset + len(muestras) if fin_nucleo is None else fin_nucleo
+
+    @property
+    def inicio(self):
+        """Instante de inicio del fragmento en segundos."""
+        return self.offset / self.sample_rate
+
+    @property
+    def duracion(self):
+        """Duración del fragmento en segundos."""
+        return len(self.muestras) / self.sample_rate
+
+def duracion_media(media_path):
+    """Duración (s) de un archivo multimedia según ffmpeg, o None si no la indica."""
+    salida = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-i", media_path],
+                            capture_output=True, text=True, errors="replace").stderr
+    coincidencia = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", salida)
+    if coincidencia is None:
+        return None
+    horas, minutos, segundos = coincidencia.groups()
+    return int(horas) * 3600 + int(minutos) * 60 + float(segundos)
+
+def _comando_pcm(entrada, sample_rate, salida=(), nostdin=True):
+    """Orden de ffmpeg que emite por stdout el audio de 'entrada' como PCM int16 mono."""
+    return [
+        "ffmpeg", "-loglevel", "error",
+        *(["-nostdin"] if nostdin else []),
+        *entrada,
+        "-vn",                     # Elimina el video
+        "-f", "s16le",             # PCM crudo sin cabecera
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),   # Frecuencia de muestreo
+        "-ac", "1",                # Audio mono
+        *salida,
+        "pipe:1"
+    ]
+
+class DecodificacionParalela:
+    """
+    Decodifica el audio de un archivo largo por tramos, con varios procesos de
+    ffmpeg a la vez, y lo entrega en orden como un único flujo PCM. Ofrece la
+    parte de la interfaz de subprocess.Popen que usan los lectores de
+    fragmentos ('stdout.readinto', 'stdout.close', 'wait' y 'args'), así que
+    los fragmentos conservan su offset exacto en muestras.
+
+    Cada tramo se decodifica buscando en la entrada ('-ss') PRERROLLO_S
+    segundos antes de su inicio, para que el decodificador y el remuestreador
+    lleguen al tramo en el mismo estado que en una decodificación continua, y
+    se empalma con el anterior en el desplazamiento en que coinciden las
+    muestras de ambos justo antes de la frontera (las marcas de tiempo tras
+    una búsqueda no siempre son exactas a nivel de muestra). El resultado es
+    idéntico muestra a muestra al de un solo proceso, salvo en los códecs que
+    sintetizan ruido pseudoaleatorio (la sustitución de ruido de AAC), donde
+    difiere solo en ese ruido.
+    """
+
+    PRERROLLO_S = 2
+    MARGEN_S = 0.5       # Audio de más que se decodifica tras el fin de cada tramo
+    REFERENCIA_MS = 250  # Muestras previas a la frontera que deben coincidir
+    BUSQUEDA_MS = 100    # Desplazamiento máximo que se busca en cada frontera
+
+    def __init__(self, media_path, duracion_s, sample_rate=SAMPLE_RATE_WHISPER, procesos=2):
+        self.media_path = media_path
+        self.sample_rate = sample_rate
+        self.args = _comando_pcm(["-i", media_path], sample_rate)
+        self.stdout = self
+        duracion_tramo = int(min(600, max(60, math.ceil(duracion_s / (2 * procesos)))))
+        inicios = list(range(0, math.ceil(duracion_s), duracion_tramo))
+        self._tramos = deque((inicio, inicio + duracion_tramo if inicio != inicios[-1] else None)
+                             for inicio in inicios)
+        print(f"[INFO] Decodificando el audio en {len(inicios)} tramos con {procesos} procesos en paralelo...")
+        self._executor = ThreadPoolExecutor(max_workers=procesos, thread_name_prefix="decodificacion")
+        self._en_curso = deque()  # (inicio, fin, Future) en orden
+        self._procesos = set()
+        self._lock = threading.Lock()
+        self._cerrado = False
+        self._previo = None       # (muestras, muestra absoluta de muestras[0]) del último tramo
+        self._pendiente = memoryview(b"")
+        # Como mucho un tramo decodificado de más por proceso espera en memoria
+        for _ in range(procesos + 1):
+            self._programar()
+
+    def _programar(self):
+        if self._tramos:
+            inicio, fin = self._tramos.popleft()
+            self._en_curso.append((inicio, fin, self._executor.submit(self._decodificar, inicio, fin)))
+
+    def _decodificar(self, inicio, fin):
+        """Decodifica un tramo con su prerrollo. Devuelve (segundo inicial, muestras)."""
+        desde = max(0, inicio - self.PRERROLLO_S)
+        comando = _comando_pcm(
+            ["-threads", "1", *(["-ss", str(desde)] if desde else []), "-i", self.media_path],
+            self.sample_rate, ["-t", str(fin + self.MARGEN_S - desde)] if fin is not None else []
+        )
+        with self._lock:
+            if self._cerrado:
+                return desde, np.empty(0, dtype=np.int16)
+            proceso = subprocess.Popen(comando, stdout=subprocess.PIPE)
+            self._procesos.add(proceso)
+        try:
+            datos = proceso.stdout.read()
+        finally:
+            proceso.stdout.close()
+            codigo = proceso.wait()
+            with self._lock:
+                self._procesos.discard(proceso)
+        if codigo != 0 and not self._cerrado:
+            raise subprocess.CalledProcessError(codigo, comando)
+        return desde, np.frombuffer(datos, dtype=np.int16)
+
+    def _alinear(self, muestras, desde, frontera):
+        """
+        Muestra absoluta en la que empieza 'muestras' (decodificadas desde el
+        segundo 'desde'): la que hace coincidir sus muestras previas a
+        'frontera' con las del tramo anterior, o la más parecida si ninguna
+        coincide exactamente.
+        """
+        previas, origen_previo = self._previo
+        n = self.REFERENCIA_MS * self.sample_rate // 1000
+        referencia = previas[frontera - n - origen_previo:frontera - origen_previo].astype(np.int32)
+        nominal = desde * self.sample_rate
+        busqueda = self.BUSQUEDA_MS * self.sample_rate // 1000
+        mejor, menor_error = 0, None
+        for desplazamiento in sorted(range(-busqueda, busqueda + 1), key=abs):
+            posicion = frontera - n - nominal - desplazamiento
+            if posicion < 0 or posicion + n > len(muestras):
+                continue
+            error = int(np.abs(muestras[posicion:posicion + n] - referencia).sum())
+            if menor_error is None or error < menor_error:
+                mejor, menor_error = desplazamiento, error
+                if error == 0:
+                    break
+        return nominal + mejor
+
+    def _siguiente_bloque(self):
+        """Siguiente tramo ya empalmado (muestras propias del tramo), o None al final."""
+        if not self._en_curso:
+            return None
+        inicio, fin, futuro = self._en_curso.popleft()
+        self._programar()
+        desde, muestras = futuro.result()
+        frontera = inicio * self.sample_rate
+        if self._previo is None:
+            origen = 0
+        else:
+            previas, origen_previo = self._previo
+            if origen_previo + len(previas) < frontera:
+                # El audio terminó antes que el tramo anterior (duración del contenedor mayor)
+                self._en_curso.clear()
+                return None
+            origen = self._alinear(muestras, desde, frontera)
+        self._previo = (muestras, origen)
+        hasta = None if fin is None else fin * self.sample_rate - origen
+        return muestras[frontera - origen:hasta]
+
+    def readinto(self, vista):
+        while not len(self._pendiente):
+            bloque = self._siguiente_bloque()
+            if bloque is None:
+                return 0
+            self._pendiente = memoryview(np.ascontiguousarray(bloque)).cast("B")
+        n = min(len(vista), len(self._pendiente))
+        vista[:n] = self._pendiente[:n]
+        self._pendiente = self._pendiente[n:]
+        return n
+
+    def close(self):
+        with self._lock:
+            self._cerrado = True
+            for proceso in self._procesos:
+                proceso.kill()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def wait(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        return 0
+
+def abrir_pcm(media_path, sample_rate=SAMPLE_RATE_WHISPER, en_vivo=False, procesos=1):
+    """
+    Lanza ffmpeg para decodificar el audio de cualquier archivo multimedia y
+    emitirlo por stdout como PCM int16 mono a 'sample_rate' Hz.
+
+    Con 'procesos' > 1, un archivo de al menos MIN_DURACION_PARALELA_S segundos
+    se decodifica por tramos en ese número de procesos a la vez (ver
+    DecodificacionParalela), con el mismo resultado que un solo proceso.
+
+    Con 'en_vivo' la entrada puede ser un archivo que todavía se está
+    escribiendo (se sigue leyendo hasta que pasan ESPERA_FIN_EN_VIVO_S
+    segundos sin datos nuevos; el contenedor debe admitir lectura en streaming:
+    MPEG-TS, MKV, MP4 fragmentado, WAV...), una tubería o '-' para la entrada
+    estándar, y ffmpeg entrega el audio en cuanto lo decodifica.
+
+    Returns:
+        subprocess.Popen | DecodificacionParalela: Proceso de ffmpeg con el
+        audio en 'stdout' (o varios procesos con la misma interfaz).
+    """
+    if procesos > 1 and not en_vivo and os.path.isfile(media_path):
+        duracion = duracion_media(media_path)
+        if duracion is not None and duracion >= MIN_DURACION_PARALELA_S:
+            return DecodificacionParalela(media_path, duracion, sample_rate, procesos)
+    entrada = ["-i", media_path]
+    if en_vivo:
+        if media_path == "-":
+            entrada = ["-i", "pipe:0"]
+        elif os.path.isfile(media_path):
+            entrada = ["-follow", "1", "-rw_timeout", str(ESPERA_FIN_EN_VIVO_S * 1_000_000),
+                       "-i", "file:" + media_path]
+        entrada = ["-fflags", "nobuffer"] + entrada
+    comando = _comando_pcm(entrada, sample_rate, ["-flush_packets", "1"] if en_vivo else [],
+                           nostdin=not (en_vivo and media_path == "-"))
+    # Con '-' ffmpeg hereda la entrada estándar de este proceso
+    return subprocess.Popen(comando, stdout=subprocess.PIPE)
+
+def leer_en_buffer(stream, buffer):
+    """
+    Rellena 'buffer' (numpy.ndarray) con los bytes de 'stream' hasta llenarlo o
+    hasta el final del stream. Devuelve el número de muestras leídas.
+    """
+    vista = memoryview(buffer).cast("B")
+    leidos = 0
+    while leidos < len(vista):
+        n = stream.readinto(vista[leidos:])
+        if not n:
+            break
+        leidos += n
+    return leidos // buffer.itemsize
+
+def leer_fragmentos(media_path, chunk_length_ms, num_buffers=2, sample_rate=SAMPLE_RATE_WHISPER, en_vivo=False,
+                    procesos=1):
+    """
+    Decodifica el audio en streaming y lo entrega en fragmentos de duración fija.
+
+    El audio nunca se escribe a disco ni se carga completo en memoria: se leen
+    las muestras directamente del stdout de ffmpeg sobre 'num_buffers' buffers
+    que se reutilizan de forma circular. El consumidor debe haber terminado con
+    un fragmento antes de pedir 'num_buffers' fragmentos más.
+
+    Args:
+        media_path (str): Ruta del vídeo o audio de entrada.
+        chunk_length_ms (int): Duración de cada fragmento en milisegundos.
+        num_buffers (int): Número de buffers reutilizables.
+        sample_rate (int): Frecuencia de muestreo de salida.
+        en_vivo (bool): Entrada que sigue creciendo (ver 'abrir_pcm'). Cada
+            fragmento se entrega en cuanto se llena.
+        procesos (int): Procesos de ffmpeg que decodifican a la vez los
+            archivos largos (ver 'abrir_pcm').
+
+    Yields:
+        FragmentoAudio: Fragmentos consecutivos del audio.
+
+    Raises:
+        subprocess.CalledProcessError: Si el comando ffmpeg falla.
+    """
+    muestras_fragmento = int(sample_rate * chunk_length_ms / 1000)
+    buffers = [np.empty(muestras_fragmento, dtype=np.int16) for _ in range(num_buffers)]
+
+    proceso = abrir_pcm(media_path, sample_rate, en_vivo, procesos)
+    try:
+        indice = 0
+        offset = 0
+        while True:
+            buffer = buffers[indice % num_buffers]
+            leidas = leer_en_buffer(proceso.stdout, buffer)
+            if leidas == 0:
+                break
+            yield FragmentoAudio(indice, offset, buffer[:leidas], sample_rate)
+            indice += 1
+            offset += leidas
+            if leidas < muestras_fragmento:
+                break
+    finally:
+        proceso.stdout.close()
+        codigo = proceso.wait()
+    if codigo != 0:
+        raise subprocess.CalledProcessError(codigo, proceso.args)
+
+def energia_db(muestras, tam_trama):
+    """
+    Calcula la energía (dBFS) de cada trama de 'tam_trama' muestras.
+    Las muestras sobrantes al final que no completan una trama se ignoran.
+    """
+    num_tramas = len(muestras) // tam_trama
+    tramas = muestras[:num_tramas * tam_trama].reshape(num_tramas, tam_trama).astype(np.float32)
+    potencia = np.einsum("ij,ij->i", tramas, tramas) / (tam_trama * 32768.0 ** 2)
+    return 10 * np.log10(potencia + 1e-10)
+
+def elegir_corte(energia, desde, hasta, objetivo, radio=10, tolerancia_db=3.0):
+    """
+    Elige la trama de corte dentro de [desde, hasta).
+
+    La energía se suaviza con un máximo móvil de 'radio' tramas por cada lado,
+    de modo que las tramas más bajas quedan en el centro de las pausas y no
+    pegadas a la voz. Se toma la de menor energía suavizada y, entre las que
+    estén a menos de 'tolerancia_db' de ese mínimo, la más cercana a 'objetivo'.
+    """
+    relleno = np.pad(energia, radio, mode="edge")
+    suavizada = sliding_window_view(relleno, 2 * radio + 1).max(axis=1)
+    region = suavizada[desde:hasta]
+    candidatas = np.flatnonzero(region <= region.min() + tolerancia_db) + desde
+    return int(candidatas[np.argmin(np.abs(candidatas - objetivo))])
+
+def leer_fragmentos_por_silencios(media_path, objetivo_ms=60000, margen_ms=10000, solape_ms=0,
+                                  umbral_silencio_db=-50.0, trama_ms=20, num_buffers=2,
+                                  sample_rate=SAMPLE_RATE_WHISPER, en_vivo=False, procesos=1):
+    """
+    Decodifica el audio en streaming y lo divide cortando en las pausas.
+
+    Cada corte se sitúa en la zona de menor energía dentro de
+    'objetivo_ms' ± 'margen_ms' desde el corte anterior, de modo que no se
+    parten palabras. Los fragmentos cuyo núcleo es silencio completo (todas sus
+    tramas por debajo de 'umbral_silencio_db') no se entregan. Con 'solape_ms'
+    cada fragmento se amplía la mitad del solape por cada lado; la parte
+    propia de cada fragmento queda en 'inicio_nucleo'/'fin_nucleo'.
+
+    Como en 'leer_fragmentos', las muestras se entregan sobre 'num_buffers'
+    buffers reutilizables, y con 'en_vivo' la entrada puede seguir creciendo:
+    cada corte se decide en cuanto hay 'objetivo_ms' + 'margen_ms' de audio.
+    Con 'procesos' > 1 los archivos largos se decodifican por tramos en
+    paralelo (ver 'abrir_pcm').
+
+    Yields:
+        FragmentoAudio: Fragmentos con voz, con su offset real en muestras.
+
+    Raises:
+        subprocess.CalledProcessError: Si el comando ffmpeg falla.
+    """
+    tam_trama = int(sample_rate * trama_ms / 1000)
+    objetivo = int(sample_rate * objetivo_ms / 1000)
+    margen = int(sample_rate * margen_ms / 1000)
+    medio_solape = int(sample_rate * solape_ms / 2000)
+    capacidad = objetivo + margen + 2 * medio_solape
+
+    ventana = np.empty(capacidad, dtype=np.int16)
+    buffers = [np.empty(capacidad, dtype=np.int16) for _ in range(num_buffers)]
+
+    proceso = abrir_pcm(media_path, sample_rate, en_vivo, procesos)
+    try:
+        indice = 0
+        base = 0       # Muestra absoluta correspondiente a ventana[0]
+        prefijo = 0    # Muestras de solape al principio de la ventana
+        llenas = 0
+        fin_stream = False
+        while True:
+            if not fin_stream:
+                leidas = leer_en_buffer(proceso.stdout, ventana[llenas:])
+                llenas += leidas
+                fin_stream = llenas < capacidad
+            if llenas <= prefijo:
+                break
+
+            energia = energia_db(ventana[:llenas], tam_trama)
+            if fin_stream and llenas - prefijo <= objetivo + margen:
+                corte = llenas
+            else:
+                desde = (prefijo + objetivo - margen) // tam_trama
+                hasta = min(prefijo + objetivo + margen, llenas - medio_solape) // tam_trama
+                corte = elegir_corte(energia, desde, max(hasta, desde + 1),
+                                     (prefijo + objetivo) // tam_trama) * tam_trama + tam_trama // 2
+
+            nucleo = energia[prefijo // tam_trama:max(corte // tam_trama, prefijo // tam_trama + 1)]
+            if nucleo.size and nucleo.max() >= umbral_silencio_db:
+                fin = min(corte + medio_solape, llenas)
+                buffer = buffers[indice % num_buffers]
+                buffer[:fin] = ventana[:fin]
+                yield FragmentoAudio(indice, base, buffer[:fin], sample_rate,
+                                     inicio_nucleo=base + prefijo, fin_nucleo=base + corte)
+                indice += 1
+
+            if corte >= llenas:
+                break
+            # Se conserva el final de la ventana (incluido el solape) para el siguiente fragmento
+            inicio_resto = corte - medio_solape
+            ventana[:llenas - inicio_resto] = ventana[inicio_resto:llenas]
+            llenas -= inicio_resto
+            base += inicio_resto
+            prefijo = medio_solape
+    finally:
+        proceso.stdout.close()
+        codigo = proceso.wait()
+    if codigo != 0:
+        raise subprocess.CalledProcessError(codigo, proceso.args)
@@ -0,0 +1,425 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from subtitle_package import config
+from subtitle_package.tokens import contar_tokens
+from subtitle_package.metrics import obtener_metricas
+
+ENDPOINTS = ("audio", "chat")
+
+# Modelo de latencia (segundos = a + b * coste) mientras no hay historial: el
+# coste es segundos de audio en 'audio' y tokens estimados en 'chat'
+MODELOS_INICIALES = {"audio": (1.5, 0.06), "chat": (0.5, 0.008)}
+
+# Tokens de texto por segundo de audio y tokens fijos (prompt y contexto) de
+# cada petición de traducción, mientras no hay historial
+TOKENS_POR_SEGUNDO = 3.0
+TOKENS_FIJOS_PETICION = 250
+
+# Duraciones de fragmento (s) y tamaños de lote (tokens) entre los que se elige
+CANDIDATOS_FRAGMENTO_S = (20, 30, 45, 60, 90, 120, 180, 240, 300)
+CANDIDATOS_LOTE = (250, 500, 750, 1000, 1500, 2000, 3000)
+# Entre los planes que no tardan más de este margen sobre el mejor se prefiere
+# el de fragmentos y lotes más grandes (menos peticiones y más contexto)
+MARGEN_EMPATE = 1.05
+
+class ModeloLatencia:
+    """Latencia esperada de una petición en función de su coste: a + b * coste."""
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+    @classmethod
+    def ajustar(cls, puntos, inicial, minimo=20):
+        """
+        Ajusta el modelo por mínimos cuadrados a 'puntos' [(coste, latencia)].
+        Con menos de 'minimo' puntos, o si los costes apenas varían, se escala
+        el modelo 'inicial' (a, b) para que acierte la latencia media.
+        """
+        a, b = inicial
+        if len(puntos) < minimo:
+            return cls(a, b)
+        n = len(puntos)
+        media_x = sum(x for x, _ in puntos) / n
+        media_y = sum(y for _, y in puntos) / n
+        varianza = sum((x - media_x) ** 2 for x, _ in puntos)
+        if varianza > 1e-9 * n * max(media_x, 1.0) ** 2:
+            pendiente = sum((x - media_x) * (y - media_y) for x, y in puntos) / varianza
+            if pendiente > 0 and media_y - pendiente * media_x > 0:
+                return cls(media_y - pendiente * media_x, pendiente)
+        factor = media_y / max(a + b * media_x, 1e-6)
+        return cls(a * factor, b * factor)
+
+    def predecir(self, coste):
+        return self.a + self.b * coste
+
+    def escalar(self, factor):
+        return ModeloLatencia(self.a * factor, self.b * factor)
+
+class HistorialRendimiento:
+    """
+    Historial local (SQLite) de la latencia y los frenados (429) de cada
+    petición a la API y del resultado de cada ejecución, compartido entre
+    ejecuciones y procesos para que el autoajuste planifique con lo observado.
+    El coste de cada petición se guarda en segundos de audio ('audio') o en
+    tokens estimados ('chat').
+    """
+
+    def __init__(self, ruta=None, max_observaciones=5000, max_ejecuciones=200):
+        """
+        Args:
+            ruta (str): Archivo SQLite (por defecto, rendimiento.sqlite3 en CACHE_DIR).
+            max_observaciones (int): Peticiones que se conservan por endpoint.
+            max_ejecuciones (int): Ejecuciones que se conservan.
+        """
+        self.ruta = ruta or os.path.join(config.CACHE_DIR, "rendimiento.sqlite3")
+        self.max_observaciones = max_observaciones
+        self.max_ejecuciones = max_ejecuciones
+        if os.path.dirname(self.ruta):
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False)
+        with self._lock, self._conexion:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS observaciones (
+                    endpoint TEXT NOT NULL,
+                    instante REAL NOT NULL,
+                    hora INTEGER NOT NULL,
+                    coste REAL NOT NULL,
+                    latencia REAL,
+                    frenada INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS observaciones_endpoint ON observaciones (endpoint, instante);
+                CREATE TABLE IF NOT EXISTS ejecuciones (
+                    instante REAL NOT NULL,
+                    duracion_audio_s REAL NOT NULL,
+                    tokens_texto INTEGER NOT NULL,
+                    concurrencia_audio REAL NOT NULL,
+                    concurrencia_chat REAL NOT NULL,
+                    frenadas_audio INTEGER NOT NULL,
+                    frenadas_chat INTEGER NOT NULL,
+                    prevista_s REAL NOT NULL,
+                    real_s REAL NOT NULL
+                );
+            """)
+
+    def anotar(self, endpoint, observaciones):
+        """Guarda observaciones (instante, coste, latencia o None, frenada) de un endpoint."""
+        if not observaciones:
+            return
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                "INSERT INTO observaciones VALUES (?, ?, ?, ?, ?, ?)",
+                [(endpoint, instante, time.localtime(instante).tm_hour, coste, latencia, int(frenada))
+                 for instante, coste, latencia, frenada in observaciones]
+            )
+            self._conexion.execute(
+                "DELETE FROM observaciones WHERE endpoint = ? AND instante < (SELECT MIN(instante) FROM "
+                "(SELECT instante FROM observaciones WHERE endpoint = ? ORDER BY instante DESC LIMIT ?))",
+                (endpoint, endpoint, self.max_observaciones)
+            )
+
+    def anotar_ejecucion(self, duracion_audio_s, tokens_texto, concurrencias, frenadas, prevista_s, real_s):
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                "INSERT INTO ejecuciones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), duracion_audio_s, tokens_texto, concurrencias["audio"], concurrencias["chat"],
+                 frenadas["audio"], frenadas["chat"], prevista_s, real_s)
+            )
+            self._conexion.execute(
+                "DELETE FROM ejecuciones WHERE instante < (SELECT MIN(instante) FROM "
+                "(SELECT instante FROM ejecuciones ORDER BY instante DESC LIMIT ?))", (self.max_ejecuciones,)
+            )
+
+    def observaciones(self, endpoint, hora=None, margen_horas=2, minimo=20):
+        """
+        Observaciones [(coste, latencia o None, frenada)] de un endpoint. Con
+        'hora', solo las tomadas a una hora del día parecida (± 'margen_horas'),
+        si hay al menos 'minimo'; si no, todas.
+        """
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT hora, coste, latencia, frenada FROM observaciones WHERE endpoint = ?", (endpoint,)
+            ).fetchall()
+        if hora is not None:
+            cercanas = [fila for fila in filas if min((fila[0] - hora) % 24, (hora - fila[0]) % 24) <= margen_horas]
+            if len(cercanas) >= minimo:
+                filas = cercanas
+        return [(coste, latencia, bool(frenada)) for _, coste, latencia, frenada in filas]
+
+    def concurrencia_sostenible(self, endpoint, ultimas=10):
+        """
+        Mediana del límite AIMD al final de las últimas ejecuciones en las que
+        el endpoint llegó a frenarse, o None si en ninguna se frenó.
+        """
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT concurrencia_{endpoint} FROM ejecuciones WHERE frenadas_{endpoint} > 0 "
+                "ORDER BY instante DESC LIMIT ?", (ultimas,)
+            ).fetchall()
+        if not filas:
+            return None
+        valores = sorted(valor for (valor,) in filas)
+        return valores[len(valores) // 2]
+
+    def num_ejecuciones(self):
+        with self._lock:
+            return self._conexion.execute("SELECT COUNT(*) FROM ejecuciones").fetchone()[0]
+
+    def tokens_por_segundo(self, ultimas=20):
+        """Tokens de texto por segundo de audio en las últimas ejecuciones (o el valor por defecto)."""
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT SUM(tokens_texto), SUM(duracion_audio_s) FROM (SELECT tokens_texto, duracion_audio_s "
+                "FROM ejecuciones WHERE duracion_audio_s > 0 AND tokens_texto > 0 ORDER BY instante DESC LIMIT ?)",
+                (ultimas,)
+            ).fetchone()
+        return fila[0] / fila[1] if fila and fila[1] else TOKENS_POR_SEGUNDO
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+@dataclass
+class Plan:
+    """
+    Parámetros de una ejecución elegidos por el autoajuste.
+
+    Attributes:
+        chunk_length_ms (int): Duración de los fragmentos de audio.
+        concurrencia_audio (int): Peticiones de transcripción en vuelo al empezar.
+        concurrencia_chat (int): Peticiones de traducción en vuelo al empezar.
+        max_tokens_lote (int): Tokens de texto por lote de traducción.
+        prevista_s (float): Duración prevista de la ejecución.
+    """
+    chunk_length_ms: int
+    concurrencia_audio: int
+    concurrencia_chat: int
+    max_tokens_lote: int
+    prevista_s: float
+
+    def resumen(self):
+        return (f"fragmentos de {self.chunk_length_ms / 1000:.0f} s, {self.concurrencia_audio} peticiones de audio "
+                f"y {self.concurrencia_chat} de traducción a la vez, lotes de {self.max_tokens_lote} tokens; "
+                f"duración prevista {self.prevista_s / 60:.1f} min")
+
+class Autoajuste:
+    """
+    Planifica la duración de los fragmentos, la concurrencia y el tamaño de
+    los lotes de una ejecución para minimizar su duración prevista dentro de
+    los límites de la API, y los corrige durante la ejecución.
+
+    La previsión usa un modelo de latencia por endpoint ajustado a las
+    peticiones del historial (preferentemente de la misma franja horaria),
+    la concurrencia que la API sostuvo sin frenarnos en ejecuciones
+    anteriores y los límites de peticiones y tokens por minuto. Durante la
+    ejecución, si la latencia medida se aparta del modelo, este se reescala
+    y se vuelven a elegir la concurrencia y el tamaño de los lotes que
+    quedan; la duración de los fragmentos ya no cambia. Al terminar, las
+    observaciones de la ejecución se añaden al historial.
+    """
+
+    # Segundos entre revisiones del plan y desviación de la latencia que provoca un ajuste
+    INTERVALO_S = 10.0
+    DESVIACION = 1.5
+    MIN_OBSERVACIONES_AJUSTE = 5
+
+    def __init__(self, historial=None):
+        self.historial = historial or HistorialRendimiento()
+        self.modelos = {}
+        self.escalas = dict.fromkeys(ENDPOINTS, 1.0)
+        self.duracion_s = 0.0
+        self.num_idiomas = 1
+        self.tokens_por_segundo = TOKENS_POR_SEGUNDO
+        self.concurrencias_maximas = {}
+        self.plan = None
+
+    @staticmethod
+    def _motor():
+        # El motor (y con él la librería openai) solo se carga al usarlo
+        from subtitle_package.motor import obtener_motor
+
+        return obtener_motor()
+
+    def _prevision(self, fragmento_s, lote, concurrencia_audio, concurrencia_chat):
+        """Duración prevista (s) de la ejecución con unos parámetros dados."""
+        modelos = {endpoint: modelo.escalar(self.escalas[endpoint]) for endpoint, modelo in self.modelos.items()}
+        # Transcripción: las peticiones van en tandas de 'concurrencia_audio' o al ritmo del RPM
+        peticiones = max(1, math.ceil(self.duracion_s / fragmento_s))
+        latencia_audio = modelos["audio"].predecir(min(fragmento_s, self.duracion_s or fragmento_s))
+        transcripcion = math.ceil(peticiones / concurrencia_audio) * latencia_audio
+        if config.OPENAI_RPM_AUDIO:
+            transcripcion = max(transcripcion, (peticiones - 1) * 60 / config.OPENAI_RPM_AUDIO + latencia_audio)
+        # Traducción: lotes de 'lote' tokens, limitados por concurrencia, RPM y TPM
+        tokens = self.tokens_por_segundo * self.duracion_s
+        lotes = max(1, math.ceil(tokens / lote)) * self.num_idiomas
+        coste = TOKENS_FIJOS_PETICION + 2 * min(lote, max(tokens, 1))
+        latencia_chat = modelos["chat"].predecir(coste)
+        traduccion = math.ceil(lotes / concurrencia_chat) * latencia_chat
+        if config.OPENAI_RPM_CHAT:
+            traduccion = max(traduccion, lotes * 60 / config.OPENAI_RPM_CHAT)
+        if config.OPENAI_TPM_CHAT:
+            traduccion = max(traduccion, lotes * coste * 60 / config.OPENAI_TPM_CHAT)
+        # Las dos etapas se solapan; al final queda por traducir el último lote
+        return max(transcripcion, traduccion) + latencia_chat
+
+    def _concurrencia(self, motor, endpoint):
+        """
+        Concurrencia con la que empezar: la que la API sostuvo en ejecuciones
+        anteriores, el máximo si nunca nos frenó o, sin historial, la inicial
+        del motor.
+        """
+        maximo = self.concurrencias_maximas[endpoint]
+        sostenible = self.historial.concurrencia_sostenible(endpoint)
+        if sostenible is None:
+            return maximo if self.historial.num_ejecuciones() else max(1, int(motor.concurrencia_actual(endpoint)))
+        return max(1, min(maximo, int(sostenible)))
+
+    def _elegir(self, fragmentos_s, concurrencia_audio, concurrencia_chat):
+        """Mejor (previsión, fragmento, lote) entre los candidatos."""
+        candidatos = [(self._prevision(fragmento, lote, concurrencia_audio, concurrencia_chat), fragmento, lote)
+                      for fragmento in fragmentos_s for lote in CANDIDATOS_LOTE]
+        mejor = min(prevision for prevision, _, _ in candidatos)
+        return max((candidato for candidato in candidatos if candidato[0] <= mejor * MARGEN_EMPATE),
+                   key=lambda candidato: (candidato[1], candidato[2]))
+
+    def planificar(self, duracion_s, num_idiomas=1, chunk_length_ms=None, max_chunk_length_ms=300000):
+        """
+        Elige los parámetros de una ejecución.
+
+        Args:
+            duracion_s (float): Duración del audio.
+            num_idiomas (int): Idiomas a los que se traduce.
+            chunk_length_ms (int): Si se indica, duración de fragmento fija
+                (p. ej. la que ya usó el trabajo); solo se planifica el resto.
+            max_chunk_length_ms (int): Duración máxima de fragmento.
+
+        Returns:
+            Plan: Parámetros elegidos.
+        """
+        motor = self._motor()
+        hora = time.localtime().tm_hour
+        self.duracion_s = duracion_s or 0.0
+        self.num_idiomas = max(1, num_idiomas)
+        self.tokens_por_segundo = self.historial.tokens_por_segundo()
+        self.concurrencias_maximas = {endpoint: motor.concurrencia_maxima(endpoint) for endpoint in ENDPOINTS}
+        for endpoint in ENDPOINTS:
+            puntos = [(coste, latencia) for coste, latencia, frenada in self.historial.observaciones(endpoint, hora)
+                      if not frenada]
+            self.modelos[endpoint] = ModeloLatencia.ajustar(puntos, MODELOS_INICIALES[endpoint])
+        concurrencia_audio = self._concurrencia(motor, "audio")
+        concurrencia_chat = self._concurrencia(motor, "chat")
+        if chunk_length_ms:
+            fragmentos = (chunk_length_ms / 1000,)
+        else:
+            fragmentos = [f for f in CANDIDATOS_FRAGMENTO_S if f * 1000 <= max_chunk_length_ms] or (60,)
+        prevista, fragmento, lote = self._elegir(fragmentos, concurrencia_audio, concurrencia_chat)
+        peticiones_audio = max(1, math.ceil(self.duracion_s / fragmento))
+        self.plan = Plan(int(fragmento * 1000), min(concurrencia_audio, peticiones_audio), concurrencia_chat, lote,
+                         prevista)
+        print(f"[INFO] Plan del autoajuste: {self.plan.resumen()}")
+        return self.plan
+
+    def aplicar(self, traductores):
+        """Aplica el plan al motor y a los traductores (diccionario idioma -> SRTTranslator)."""
+        motor = self._motor()
+        motor.ajustar_concurrencia("audio", self.plan.concurrencia_audio)
+        motor.ajustar_concurrencia("chat", self.plan.concurrencia_chat)
+        for traductor in traductores.values():
+            traductor.max_tokens_lote = self.plan.max_tokens_lote
+
+    def _recoger(self, motor, observadas):
+        """Pasa a 'observadas' las observaciones nuevas del motor."""
+        for endpoint in ENDPOINTS:
+            pendientes = motor.endpoints[endpoint].observaciones
+            while pendientes:
+                instante, coste, latencia, frenada = pendientes.popleft()
+                observadas[endpoint].append((instante, coste, latencia, frenada))
+
+    def _revisar(self, motor, observadas, traductores):
+        """
+        Compara la latencia medida con la del modelo y, si se desvía más de
+        DESVIACION, reescala el modelo y vuelve a elegir la concurrencia y el
+        tamaño de los lotes.
+        """
+        cambios = []
+        for endpoint in ENDPOINTS:
+            medidas = [(coste, latencia) for _, coste, latencia, frenada in observadas[endpoint] if not frenada]
+            if len(medidas) < self.MIN_OBSERVACIONES_AJUSTE:
+                continue
+            modelo = self.modelos[endpoint].escalar(self.escalas[endpoint])
+            desviacion = sum(latencia for _, latencia in medidas) / sum(modelo.predecir(c) for c, _ in medidas)
+            if 1 / self.DESVIACION <= desviacion <= self.DESVIACION:
+                continue
+            self.escalas[endpoint] *= desviacion
+            cambios.append(f"latencia de {endpoint} x{desviacion:.2f} sobre el plan")
+            obtener_metricas().incrementar("autoajustes", endpoint=endpoint)
+        if not cambios:
+            return
+        # La concurrencia de partida es la que AIMD haya alcanzado (más baja si la API nos frena)
+        concurrencia_audio = max(1, int(motor.concurrencia_actual("audio")))
+        concurrencia_chat = max(1, int(motor.concurrencia_actual("chat")))
+        fragmento_s = self.plan.chunk_length_ms / 1000
+        # Con latencias mayores de lo previsto hacen falta más peticiones en vuelo para el mismo ritmo
+        for endpoint in ENDPOINTS:
+            frenadas = sum(frenada for *_, frenada in observadas[endpoint])
+            if not frenadas and self.escalas[endpoint] > 1:
+                actual = concurrencia_audio if endpoint == "audio" else concurrencia_chat
+                nueva = min(self.concurrencias_maximas[endpoint], math.ceil(actual * self.escalas[endpoint]))
+                if endpoint == "audio":
+                    concurrencia_audio = nueva
+                else:
+                    concurrencia_chat = nueva
+        prevista, _, lote = self._elegir((fragmento_s,), concurrencia_audio, concurrencia_chat)
+        self.plan = Plan(self.plan.chunk_length_ms, concurrencia_audio, concurrencia_chat, lote, prevista)
+        print(f"[INFO] Autoajuste: {', '.join(cambios)}; nuevo plan: {self.plan.resumen()}")
+        self.aplicar(traductores)
+
+    @contextmanager
+    def ejecucion(self, pipeline):
+        """
+        Aplica el plan a 'pipeline' (Pipeline) durante el bloque 'with', lo
+        revisa cada INTERVALO_S segundos y, al salir, guarda en el historial
+        las observaciones y los tokens de texto transcritos.
+        """
+        motor = self._motor()
+        traductores = pipeline.traductores
+        observadas = {endpoint: [] for endpoint in ENDPOINTS}
+        self._recoger(motor, {endpoint: [] for endpoint in ENDPOINTS})  # Descarta las de ejecuciones anteriores
+        self.aplicar(traductores)
+        prevista = self.plan.prevista_s
+        inicio = time.perf_counter()
+        parar = threading.Event()
+
+        def vigilar():
+            while not parar.wait(self.INTERVALO_S):
+                self._recoger(motor, observadas)
+                self._revisar(motor, observadas, traductores)
+
+        hilo = threading.Thread(target=vigilar, name="autoajuste", daemon=True)
+        hilo.start()
+        exito = False
+        try:
+            yield self.plan
+            exito = True
+        finally:
+            parar.set()
+            hilo.join()
+            self._recoger(motor, observadas)
+            for endpoint in ENDPOINTS:
+                self.historial.anotar(endpoint, observadas[endpoint])
+            if exito:
+                real = time.perf_counter() - inicio
+                self.historial.anotar_ejecucion(
+                    self.duracion_s, sum(contar_tokens(cue.texto) for cue in pipeline.originales),
+                    {endpoint: motor.concurrencia_actual(endpoint) for endpoint in ENDPOINTS},
+                    {endpoint: sum(frenada for *_, frenada in observadas[endpoint]) for endpoint in ENDPOINTS},
+                    prevista, real
+                )
+                print(f"[INFO] Autoajuste: duración prevista {prevista / 60:.1f} min, real {real / 60:.1f} min.")
@@ -0,0 +1,66 @@
+import importlib
+import threading
+
+# Backends disponibles por tipo y nombre, como "módulo:atributo". El módulo
+# solo se importa la primera vez que se pide el backend: así elegir un backend
+# no arrastra las dependencias de los demás (openai, torch/transformers...).
+_REGISTRO = {
+    "transcripcion": {
+        "openai": "subtitle_package.transcription:BackendOpenAI",
+        "local": "subtitle_package.local_transcription:BackendWhisperLocal",
+    },
+    "traduccion": {
+        "openai": "subtitle_package.subtitles:crear_traductores",
+    },
+    "mux": {
+        "ffmpeg": "subtitle_package.video:insertar_subtitulos",
+        "quemado": "subtitle_package.video:quemar_subtitulos",
+    },
+}
+
+_cargados = {}
+_lock = threading.Lock()
+
+def registrar(tipo, nombre, ruta):
+    """
+    Declara un backend sin importarlo.
+
+    Args:
+        tipo (str): "transcripcion", "traduccion" o "mux".
+        nombre (str): Nombre con el que se elige el backend.
+        ruta (str): "módulo:atributo" del backend (una clase de
+            BackendTranscripcion, una función como 'crear_traductores' o como
+            'insertar_subtitulos', según el tipo).
+    """
+    with _lock:
+        _REGISTRO.setdefault(tipo, {})[nombre] = ruta
+        _cargados.pop((tipo, nombre), None)
+
+def disponibles(tipo):
+    """Nombres de los backends registrados de un tipo."""
+    return sorted(_REGISTRO.get(tipo, {}))
+
+def obtener(tipo, nombre):
+    """
+    Devuelve el backend 'nombre' de tipo 'tipo', importando su módulo la
+    primera vez.
+
+    Raises:
+        ValueError: Si el backend no está registrado.
+    """
+    clave = (tipo, nombre)
+    with _lock:
+        if clave in _cargados:
+            return _cargados[clave]
+        ruta = _REGISTRO.get(tipo, {}).get(nombre)
+    if ruta is None:
+        raise ValueError(f"Backend de {tipo} desconocido: '{nombre}' "
+                         f"(disponibles: {', '.join(disponibles(tipo))})")
+    # El módulo se importa sin el cerrojo: una importación lenta no bloquea las
+    # demás consultas y el módulo puede usar 'obtener' o 'registrar' al cargarse
+    modulo, atributo = ruta.split(":")
+    backend = getattr(importlib.import_module(modulo), atributo)
+    with _lock:
+        if _REGISTRO.get(tipo, {}).get(nombre) != ruta:
+            return backend  # Se registró otro mientras tanto: no se memoriza
+        return _cargados.setdefault(clave, backend)
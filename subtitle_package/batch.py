@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+EXTENSIONES_VIDEO = (".mp4", ".mkv", ".mov", ".avi", ".webm", ".m4v")
+
+class ColaTrabajos:
+    """
+    Cola de trabajos en SQLite, compartida por varios procesos trabajadores.
+
+    Cada trabajo pasa por los estados 'pendiente' -> 'en_curso' -> 'hecho'
+    (o 'error' tras 'max_intentos' fallos). Los trabajadores toman trabajos
+    de forma atómica y mantienen un latido; un trabajo 'en_curso' sin latido
+    durante 'caducidad_s' segundos (su proceso ha muerto) vuelve a estar
+    disponible, salvo que ya haya agotado sus intentos: entonces pasa a 'error'.
+    """
+
+    def __init__(self, ruta, caducidad_s=120, max_intentos=3):
+        self.ruta = ruta
+        self.caducidad_s = caducidad_s
+        self.max_intentos = max_intentos
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    video TEXT NOT NULL,
+                    directorio TEXT NOT NULL,
+                    idiomas TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendiente',
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    trabajador TEXT,
+                    error TEXT,
+                    actualizado REAL NOT NULL,
+                    UNIQUE (video, directorio)
+                )
+            """)
+
+    def encolar(self, video, directorio, idiomas):
+        """
+        Añade un trabajo (o lo vuelve a dejar pendiente si ya existía y no está
+        en curso). Repetir un trabajo terminado es barato: el manifiesto del
+        trabajo salta las etapas que no han cambiado.
+        """
+        with self._lock:
+            self._conexion.execute(
+                "INSERT INTO trabajos (video, directorio, idiomas, actualizado) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(video, directorio) DO UPDATE SET idiomas = excluded.idiomas, "
+                "estado = CASE WHEN estado = 'en_curso' THEN estado ELSE 'pendiente' END, "
+                "intentos = 0, error = NULL, actualizado = excluded.actualizado",
+                (video, directorio, json.dumps(idiomas), time.time())
+            )
+
+    def tomar(self, trabajador):
+        """
+        Toma el siguiente trabajo disponible para 'trabajador'.
+
+        Returns:
+            dict: Trabajo ('id', 'video', 'directorio', 'idiomas') o None si no quedan.
+        """
+        with self._lock:
+            ahora = time.time()
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                # Un trabajo que ya ha tumbado a su trabajador 'max_intentos' veces no se
+                # vuelve a tomar: reintentarlo sin fin bloquearía la cola
+                self._conexion.execute(
+                    "UPDATE trabajos SET estado = 'error', "
+                    "error = COALESCE(error, 'El proceso trabajador terminó sin completarlo') "
+                    "WHERE estado = 'en_curso' AND actualizado < ? AND intentos >= ?",
+                    (ahora - self.caducidad_s, self.max_intentos)
+                )
+                fila = self._conexion.execute(
+                    "SELECT id, video, directorio, idiomas FROM trabajos "
+                    "WHERE estado = 'pendiente' OR (estado = 'en_curso' AND actualizado < ? AND intentos < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (ahora - self.caducidad_s, self.max_intentos)
+                ).fetchone()
+                if fila is not None:
+                    self._conexion.execute(
+                        "UPDATE trabajos SET estado = 'en_curso', trabajador = ?, intentos = intentos + 1, "
+                        "actualizado = ? WHERE id = ?",
+                        (trabajador, ahora, fila[0])
+                    )
+                self._conexion.execute("COMMIT")
+            except BaseException:
+                self._conexion.execute("ROLLBACK")
+                raise
+        if fila is None:
+            return None
+        return {"id": fila[0], "video": fila[1], "directorio": fila[2], "idiomas": json.loads(fila[3])}
+
+    def latido(self, id_trabajo):
+        """Indica que el trabajo sigue en curso."""
+        with self._lock:
+            self._conexion.execute("UPDATE trabajos SET actualizado = ? WHERE id = ? AND estado = 'en_curso'",
+                                   (time.time(), id_trabajo))
+
+    def completar(self, id_trabajo):
+        with self._lock:
+            self._conexion.execute("UPDATE trabajos SET estado = 'hecho', error = NULL, actualizado = ? WHERE id = ?",
+                                   (time.time(), id_trabajo))
+
+    def fallar(self, id_trabajo, error):
+        """Registra un fallo: el trabajo se reintenta hasta agotar 'max_intentos'."""
+        with self._lock:
+            self._conexion.execute(
+                "UPDATE trabajos SET estado = CASE WHEN intentos >= ? THEN 'error' ELSE 'pendiente' END, "
+                "error = ?, actualizado = ? WHERE id = ?",
+                (self.max_intentos, error, time.time(), id_trabajo)
+            )
+
+    def resumen(self):
+        """Número de trabajos en cada estado."""
+        with self._lock:
+            return dict(self._conexion.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+
+    def errores(self):
+        """Lista de (vídeo, error) de los trabajos que han fallado definitivamente."""
+        with self._lock:
+            return self._conexion.execute("SELECT video, error FROM trabajos WHERE estado = 'error'").fetchall()
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+def descubrir_videos(entrada, idiomas):
+    """
+    Devuelve la lista de (vídeo, idiomas) a procesar a partir de un directorio
+    (todos los vídeos que contenga, recursivamente) o de un manifiesto: un
+    .txt con una ruta por línea o un .json con una lista de rutas u objetos
+    {"video": ..., "idiomas": [...]}. Las rutas relativas del manifiesto se
+    resuelven respecto a su directorio.
+    """
+    if os.path.isdir(entrada):
+        videos = []
+        for raiz, _, archivos in os.walk(entrada):
+            for archivo in sorted(archivos):
+                if archivo.lower().endswith(EXTENSIONES_VIDEO):
+                    videos.append((os.path.abspath(os.path.join(raiz, archivo)), idiomas))
+        return sorted(videos)
+
+    base = os.path.dirname(os.path.abspath(entrada))
+    with open(entrada, "r", encoding="utf-8") as f:
+        if entrada.lower().endswith(".json"):
+            elementos = json.load(f)
+        else:
+            elementos = [linea.strip() for linea in f if linea.strip() and not linea.lstrip().startswith("#")]
+    videos = []
+    for elemento in elementos:
+        if isinstance(elemento, str):
+            elemento = {"video": elemento}
+        videos.append((os.path.abspath(os.path.join(base, elemento["video"])), elemento.get("idiomas") or idiomas))
+    return videos
+
+def directorio_trabajo(salida, video):
+    """
+    Directorio de trabajo propio de un vídeo: SRT, manifiesto y vídeo final de
+    cada trabajo quedan aislados aunque dos vídeos se llamen igual.
+    """
+    nombre = os.path.splitext(os.path.basename(video))[0]
+    sufijo = hashlib.sha1(os.path.abspath(video).encode("utf-8")).hexdigest()[:8]
+    return os.path.abspath(os.path.join(salida, f"{nombre}-{sufijo}"))
+
+def procesar_trabajo(trabajo):
+    """Procesa un trabajo de la cola dentro de su directorio de trabajo."""
+    from subtitle_package.job import procesar_video
+
+    directorio = trabajo["directorio"]
+    os.makedirs(directorio, exist_ok=True)
+    nombre = os.path.splitext(os.path.basename(trabajo["video"]))[0]
+    procesar_video(
+        trabajo["video"],
+        os.path.join(directorio, "subtitulos.srt"),
+        os.path.join(directorio, f"{nombre}_subs.mp4"),
+        trabajo["idiomas"],
+        ruta_manifiesto=os.path.join(directorio, "manifiesto.json"),
+        ruta_metricas=os.path.join(directorio, "metricas"),
+    )
+
+def _latir(cola, id_trabajo, parar):
+    while not parar.wait(cola.caducidad_s / 4):
+        cola.latido(id_trabajo)
+
+def trabajar(ruta_cola, ruta_presupuesto=None, perfil=False):
+    """
+    Bucle de un proceso trabajador: toma trabajos de la cola hasta que no
+    quedan. Todos los trabajadores comparten el presupuesto de la API de
+    'ruta_presupuesto' (por defecto, la propia base de la cola). Con 'perfil'
+    los informes de rendimiento incluyen cProfile y tracemalloc.
+
+    Returns:
+        int: Número de trabajos terminados por este proceso.
+    """
+    from subtitle_package import config
+    from subtitle_package.metrics import obtener_metricas
+
+    # Debe fijarse antes de que este proceso cree su motor de la API
+    config.PRESUPUESTO_GLOBAL_DB = ruta_presupuesto or ruta_cola
+    if perfil:
+        obtener_metricas().activar_perfil()
+    cola = ColaTrabajos(ruta_cola)
+    nombre = f"{socket.gethostname()}:{os.getpid()}"
+    hechos = 0
+    while (trabajo := cola.tomar(nombre)) is not None:
+        print(f"[INFO] [{nombre}] Procesando {trabajo['video']} -> {trabajo['directorio']}")
+        parar = threading.Event()
+        latidos = threading.Thread(target=_latir, args=(cola, trabajo["id"], parar), daemon=True)
+        latidos.start()
+        try:
+            procesar_trabajo(trabajo)
+            cola.completar(trabajo["id"])
+            hechos += 1
+        except Exception as e:
+            print(f"[ERROR] [{nombre}] Fallo en {trabajo['video']}: {e}")
+            cola.fallar(trabajo["id"], f"{type(e).__name__}: {e}")
+        finally:
+            parar.set()
+            latidos.join()
+    cola.cerrar()
+    return hechos
+
+def ejecutar_lote(entrada, salida, idiomas, procesos=None, ruta_cola=None, perfil=False):
+    """
+    Procesa por lotes todos los vídeos de un directorio o manifiesto, sin
+    preguntas. Los trabajos se encolan en SQLite y los procesan 'procesos'
+    trabajadores en paralelo (la decodificación y el muxing con ffmpeg usan
+    CPU), compartiendo un único presupuesto de concurrencia y tokens de la API.
+    Cada trabajo deja su informe de rendimiento en su directorio ('metricas.json').
+
+    Returns:
+        dict: Número de trabajos en cada estado al terminar.
+    """
+    ruta_cola = ruta_cola or os.path.join(salida, "cola.sqlite3")
+    os.makedirs(salida, exist_ok=True)
+    cola = ColaTrabajos(ruta_cola)
+    videos = descubrir_videos(entrada, idiomas) if entrada else []
+    for video, idiomas_video in videos:
+        cola.encolar(video, directorio_trabajo(salida, video), idiomas_video)
+    print(f"[INFO] {len(videos)} vídeos encolados en {ruta_cola}")
+
+    procesos = procesos or max(1, min(len(videos) or 1, os.cpu_count() or 1))
+    # 'spawn': cada trabajador crea su propio motor (con su hilo de fondo) desde cero
+    with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(trabajar, ruta_cola, None, perfil) for _ in range(procesos)]
+        hechos = sum(future.result() for future in futures)
+
+    resumen = cola.resumen()
+    print(f"[INFO] Lote terminado: {hechos} trabajos procesados; estado de la cola: {resumen}")
+    for video, error in cola.errores():
+        print(f"[ERROR] {video}: {error}")
+    cola.cerrar()
+    return resumen
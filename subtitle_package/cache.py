@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import wraps
+from subtitle_package import config
+
+class CacheSQLite:
+    """
+    Almacén clave-valor persistente en SQLite con expulsión LRU por número
+    de entradas, por tamaño total y por antigüedad.
+
+    Una única conexión protegida por un lock permite usar la caché desde los
+    hilos de trabajo; el modo WAL permite además compartir el archivo entre procesos.
+    """
+
+    def __init__(self, ruta, tabla="cache", max_entradas=200_000, max_bytes=512 * 1024 * 1024,
+                 max_edad_dias=180, purgar_cada=500):
+        """
+        Args:
+            ruta (str): Ruta del archivo SQLite.
+            tabla (str): Nombre de la tabla dentro del archivo.
+            max_entradas (int): Número máximo de entradas que se conservan.
+            max_bytes (int): Tamaño máximo (aproximado) de los valores almacenados.
+            max_edad_dias (float): Antigüedad máxima desde el último acceso.
+            purgar_cada (int): Número de escrituras entre purgas automáticas.
+        """
+        directorio = os.path.dirname(ruta)
+        if directorio and not os.path.exists(directorio):
+            os.makedirs(directorio, exist_ok=True)
+        self.ruta = ruta
+        self.tabla = tabla
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.max_edad_dias = max_edad_dias
+        self.purgar_cada = purgar_cada
+
+        self.aciertos = 0
+        self.fallos = 0
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        with self._lock, self._conexion:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {tabla} ("
+                "clave TEXT PRIMARY KEY, valor BLOB NOT NULL, tamano INTEGER NOT NULL, "
+                "creado REAL NOT NULL, ultimo_acceso REAL NOT NULL)"
+            )
+            self._conexion.execute(
+                f"CREATE INDEX IF NOT EXISTS {tabla}_ultimo_acceso ON {tabla} (ultimo_acceso)"
+            )
+
+    @staticmethod
+    def hash_clave(*partes) -> str:
+        """Calcula una clave de contenido (SHA-256) a partir de varias partes."""
+        h = hashlib.sha256()
+        for parte in partes:
+            datos = parte if isinstance(parte, bytes) else str(parte).encode("utf-8")
+            h.update(len(datos).to_bytes(8, "little"))
+            h.update(datos)
+        return h.hexdigest()
+
+    def obtener(self, clave, contar=True):
+        """
+        Devuelve el valor asociado a la clave o None si no está (o ha caducado).
+        Sin 'contar' la consulta no se anota en los aciertos ni en los fallos.
+        """
+        ahora = time.time()
+        with self._lock, self._conexion:
+            fila = self._conexion.execute(
+                f"SELECT valor, ultimo_acceso FROM {self.tabla} WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or ahora - fila[1] > self.max_edad_dias * 86400:
+                self.fallos += contar
+                return None
+            self._conexion.execute(
+                f"UPDATE {self.tabla} SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave)
+            )
+            self.aciertos += contar
+            return fila[0]
+
+    def guardar(self, clave, valor):
+        """Guarda un valor (str o bytes) y purga la caché periódicamente."""
+        ahora = time.time()
+        tamano = len(valor.encode("utf-8") if isinstance(valor, str) else valor)
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                f"INSERT OR REPLACE INTO {self.tabla} (clave, valor, tamano, creado, ultimo_acceso) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (clave, valor, tamano, ahora, ahora)
+            )
+            self._escrituras += 1
+            if self._escrituras % self.purgar_cada == 0:
+                self._purgar()
+
+    def purgar(self):
+        """Elimina las entradas caducadas y las menos usadas que excedan los límites."""
+        with self._lock, self._conexion:
+            self._purgar()
+
+    def _purgar(self):
+        limite = time.time() - self.max_edad_dias * 86400
+        self._conexion.execute(f"DELETE FROM {self.tabla} WHERE ultimo_acceso < ?", (limite,))
+        self._conexion.execute(
+            f"DELETE FROM {self.tabla} WHERE clave IN ("
+            f"SELECT clave FROM {self.tabla} ORDER BY ultimo_acceso DESC LIMIT -1 OFFSET ?)",
+            (self.max_entradas,)
+        )
+        self._conexion.execute(
+            f"DELETE FROM {self.tabla} WHERE clave IN ("
+            "SELECT clave FROM (SELECT clave, SUM(tamano) OVER (ORDER BY ultimo_acceso DESC) AS acumulado "
+            f"FROM {self.tabla}) WHERE acumulado > ?)",
+            (self.max_bytes,)
+        )
+
+    def estadisticas(self) -> dict:
+        """Devuelve los contadores de aciertos y fallos y el tamaño actual."""
+        with self._lock:
+            entradas, tamano = self._conexion.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM {self.tabla}"
+            ).fetchone()
+        return {"aciertos": self.aciertos, "fallos": self.fallos,
+                "entradas": entradas, "bytes": tamano}
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+class CacheTraducciones(CacheSQLite):
+    """
+    Caché de traducciones direccionada por contenido. La clave es un hash de
+    (texto, contexto previo, contexto siguiente, idioma, modelo, versión del prompt).
+    """
+
+    def __init__(self, ruta=None, **kwargs):
+        super().__init__(ruta or os.path.join(config.CACHE_DIR, "traducciones.sqlite3"),
+                         tabla="traducciones", **kwargs)
+
+    def clave(self, texto, idioma_destino, contexto_previo, contexto_siguiente, modelo, version_prompt):
+        return self.hash_clave(texto, contexto_previo, contexto_siguiente,
+                               idioma_destino, modelo, version_prompt)
+
+    def envolver(self, translate_func, modelo, version_prompt, contar=True):
+        """
+        Devuelve una función con la misma firma que 'translate_func' que consulta
+        la caché antes de traducir y guarda el resultado después. Si se llama con
+        'modelo', ese modelo sustituye al indicado aquí en la clave y se pasa a
+        'translate_func'. Sin 'contar' sus consultas no se anotan en las
+        estadísticas (ver 'obtener').
+        """
+        modelo_por_defecto = modelo
+
+        @wraps(translate_func)
+        def traducir_con_cache(texto, idioma_destino="en", contexto_previo="", contexto_siguiente="",
+                               modelo=None):
+            clave = self.clave(texto, idioma_destino, contexto_previo, contexto_siguiente,
+                               modelo or modelo_por_defecto, version_prompt)
+            traduccion = self.obtener(clave, contar=contar)
+            if traduccion is None:
+                argumentos = {"modelo": modelo} if modelo is not None else {}
+                traduccion = translate_func(texto, idioma_destino,
+                                            contexto_previo=contexto_previo,
+                                            contexto_siguiente=contexto_siguiente, **argumentos)
+                self.guardar(clave, traduccion)
+            return traduccion
+        return traducir_con_cache
+
+class CacheTranscripcionesPCM(CacheSQLite):
+    """
+    Caché de transcripciones direccionada por los bytes exactos del audio. La
+    clave es un sha256 de las muestras PCM decodificadas de cada fragmento y
+    de los parámetros del backend (modelo, idioma...); el valor, los
+    segmentos del fragmento con tiempos relativos a su inicio, de modo que un
+    acierto sirve aunque el fragmento esté en otra posición del audio.
+
+    No es una huella acústica: solo acierta con fragmentos idénticos muestra
+    a muestra: volver a transcribir el mismo audio con la misma versión de
+    ffmpeg y los mismos parámetros (el vídeo remuxado o con otros metadatos,
+    un trabajo cuyo manifiesto o SRT se perdió, copias del mismo archivo).
+    Un corte desplazado una sola muestra o una decodificación con otro
+    ffmpeg no acierta.
+    """
+
+    def __init__(self, ruta=None, max_bytes=128 * 1024 * 1024, **kwargs):
+        super().__init__(ruta or os.path.join(config.CACHE_DIR, "transcripciones.sqlite3"),
+                         tabla="transcripciones", max_bytes=max_bytes, **kwargs)
+
+    def clave(self, fragmento, parametros):
+        return self.hash_clave(fragmento.muestras.tobytes(), fragmento.sample_rate,
+                               json.dumps(parametros, sort_keys=True))
+
+    def obtener_segmentos(self, clave, inicio):
+        """Segmentos guardados para 'clave', desplazados al instante 'inicio' (s), o None."""
+        valor = self.obtener(clave)
+        if valor is None:
+            return None
+        return [{**seg, 'start': seg['start'] + inicio, 'end': seg['end'] + inicio} for seg in json.loads(valor)]
+
+    def guardar_segmentos(self, clave, segments, inicio):
+        """Guarda los segmentos de un fragmento que empieza en 'inicio' (s) en tiempo relativo."""
+        relativos = [{**seg, 'start': seg['start'] - inicio, 'end': seg['end'] - inicio} for seg in segments]
+        self.guardar(clave, json.dumps(relativos, ensure_ascii=False))
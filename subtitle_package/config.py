@@ -1,8 +1,79 @@
 import os
-from dotenv import load_dotenv
 
-# Carga las variables definidas en el archivo .env
-load_dotenv()
+# La configuración se lee la primera vez que se consulta un parámetro
+# (config.X o 'from subtitle_package.config import X'), no al importar el
+# módulo: así las órdenes que no la necesitan (--help, el parser de SRT...)
+# no pagan la carga del .env.
+_cargada = False
 
-# Asigna la API key a una variable
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+def _cargar():
+    global _cargada
+    from dotenv import load_dotenv
+
+    # Carga las variables definidas en el archivo .env
+    load_dotenv()
+
+    parametros = {
+        # API key de OpenAI
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
+
+        # Directorio de las cachés persistentes (traducciones, etc.)
+        "CACHE_DIR": os.getenv("SUBTITULOS_CACHE_DIR", ".cache"),
+
+        # Límites de la API por endpoint (peticiones y tokens por minuto) y concurrencia
+        # máxima. Ajustar al tier de la organización; un 0 desactiva el límite.
+        "OPENAI_RPM_CHAT": int(os.getenv("OPENAI_RPM_CHAT", "500")),
+        "OPENAI_TPM_CHAT": int(os.getenv("OPENAI_TPM_CHAT", "30000")),
+        "OPENAI_RPM_AUDIO": int(os.getenv("OPENAI_RPM_AUDIO", "50")),
+        "OPENAI_MAX_CONCURRENCIA_CHAT": int(os.getenv("OPENAI_MAX_CONCURRENCIA_CHAT", "32")),
+        "OPENAI_MAX_CONCURRENCIA_AUDIO": int(os.getenv("OPENAI_MAX_CONCURRENCIA_AUDIO", "16")),
+
+        # Percentil de las latencias recientes a partir del cual una petición rezagada se
+        # duplica y se usa la primera respuesta (0 desactiva las peticiones de cobertura)
+        "OPENAI_PERCENTIL_COBERTURA": float(os.getenv("OPENAI_PERCENTIL_COBERTURA", "95")),
+
+        # Base SQLite con el presupuesto de la API compartido entre procesos (modo por lotes).
+        # Sin ella, cada proceso aplica los límites anteriores por su cuenta.
+        "PRESUPUESTO_GLOBAL_DB": os.getenv("SUBTITULOS_PRESUPUESTO_DB"),
+
+        # Backend de transcripción (ver subtitle_package.backends): "openai" (API) o "local" (Whisper en CPU)
+        "BACKEND_TRANSCRIPCION": os.getenv("SUBTITULOS_TRANSCRIPCION", "openai"),
+        "MODELO_WHISPER_LOCAL": os.getenv("SUBTITULOS_MODELO_WHISPER", "openai/whisper-small"),
+
+        # Autoajuste de la duración de los fragmentos, la concurrencia y el tamaño de los lotes
+        # a partir de las latencias observadas en ejecuciones anteriores ("0" lo desactiva)
+        "AUTOAJUSTE": os.getenv("SUBTITULOS_AUTOAJUSTE", "1") != "0",
+
+        # Formato en que se sube el audio a la API de transcripción: "opus" (el más ligero),
+        # "flac" (sin pérdidas) o "wav". Si un fragmento no cabe en 25 MB se usa uno más compacto.
+        "FORMATO_AUDIO": os.getenv("SUBTITULOS_FORMATO_AUDIO", "opus"),
+
+        # Procesos de ffmpeg que decodifican a la vez el audio de los archivos largos
+        "PROCESOS_AUDIO": int(os.getenv("SUBTITULOS_PROCESOS_AUDIO", str(os.cpu_count() or 1))),
+
+        # Forma de añadir los subtítulos al vídeo (ver subtitle_package.backends): "ffmpeg"
+        # (pistas seleccionables, sin recodificar) o "quemado" (en la imagen, recodificando)
+        "MUX": os.getenv("SUBTITULOS_MUX", "ffmpeg"),
+        # Procesos de ffmpeg que recodifican a la vez los tramos del vídeo al quemar los subtítulos
+        "PROCESOS_QUEMADO": int(os.getenv("SUBTITULOS_PROCESOS_QUEMADO", str(os.cpu_count() or 1))),
+
+        # Modelo de traducción (forma parte de la clave de la caché de traducciones)
+        "MODELO_TRADUCCION": os.getenv("SUBTITULOS_MODELO_TRADUCCION", "gpt-4o"),
+        # Modelo barato para los subtítulos normales; los difíciles van al anterior y los
+        # triviales no llegan a la API ("" envía todo lo que no se resuelve en local al principal)
+        "MODELO_TRADUCCION_RAPIDO": os.getenv("SUBTITULOS_MODELO_TRADUCCION_RAPIDO", "gpt-4o-mini"),
+
+        # Idiomas que se traducen juntos en cada petición por lotes (1 = una petición por idioma)
+        "IDIOMAS_POR_PETICION": int(os.getenv("SUBTITULOS_IDIOMAS_POR_PETICION", "1")),
+    }
+    # Los valores asignados antes de la carga (config.X = ...) tienen prioridad
+    for nombre, valor in parametros.items():
+        globals().setdefault(nombre, valor)
+    _cargada = True
+
+def __getattr__(nombre):
+    if not _cargada and not nombre.startswith("__"):
+        _cargar()
+        if nombre in globals():
+            return globals()[nombre]
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
@@ -0,0 +1,226 @@
+import io
+
+class Cue:
+    """
+    Subtítulo individual, representación común a todos los módulos.
+
+    Los tiempos se guardan como milisegundos enteros y la clase usa __slots__
+    para que listas de cientos de miles de subtítulos ocupen poca memoria.
+
+    Attributes:
+        indice (int): Número del subtítulo (empezando en 1).
+        inicio_ms (int): Instante de inicio en milisegundos.
+        fin_ms (int): Instante de fin en milisegundos.
+        texto (str): Texto del subtítulo (las líneas del SRT se unen con espacios).
+    """
+    __slots__ = ("indice", "inicio_ms", "fin_ms", "texto")
+
+    def __init__(self, indice, inicio_ms, fin_ms, texto):
+        self.indice = indice
+        self.inicio_ms = inicio_ms
+        self.fin_ms = fin_ms
+        self.texto = texto
+
+    @classmethod
+    def desde_segundos(cls, indice, inicio, fin, texto):
+        """Crea un Cue a partir de tiempos en segundos (float)."""
+        return cls(indice, int(round(inicio * 1000)), int(round(fin * 1000)), texto)
+
+    @property
+    def inicio(self):
+        """Instante de inicio en segundos."""
+        return self.inicio_ms / 1000
+
+    @property
+    def fin(self):
+        """Instante de fin en segundos."""
+        return self.fin_ms / 1000
+
+    def con_texto(self, texto):
+        """Devuelve una copia del subtítulo con otro texto y los mismos tiempos."""
+        return Cue(self.indice, self.inicio_ms, self.fin_ms, texto)
+
+    def a_bloque_srt(self) -> str:
+        """Devuelve el bloque SRT del subtítulo (sin línea en blanco final)."""
+        return f"{self.indice}\n{ms_a_tiempo(self.inicio_ms)} --> {ms_a_tiempo(self.fin_ms)}\n{self.texto}"
+
+    def __eq__(self, otro):
+        if not isinstance(otro, Cue):
+            return NotImplemented
+        return (self.indice, self.inicio_ms, self.fin_ms, self.texto) == \
+               (otro.indice, otro.inicio_ms, otro.fin_ms, otro.texto)
+
+    def __repr__(self):
+        return f"Cue({self.indice}, {self.inicio_ms}, {self.fin_ms}, {self.texto!r})"
+
+def tiempo_a_ms(tiempo):
+    """
+    Convierte una marca de tiempo SRT ("00:36:26,798", también con punto
+    como separador de milisegundos) a milisegundos enteros.
+    """
+    horas, minutos, resto = tiempo.strip().split(":")
+    segundos, _, milis = resto.replace(".", ",").partition(",")
+    return ((int(horas) * 60 + int(minutos)) * 60 + int(segundos)) * 1000 + int(milis.ljust(3, "0")[:3] or 0)
+
+def ms_a_tiempo(ms):
+    """Convierte milisegundos enteros al formato HH:MM:SS,mmm usado en archivos SRT."""
+    segundos, milis = divmod(int(ms), 1000)
+    minutos, segundos = divmod(segundos, 60)
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas:02}:{minutos:02}:{segundos:02},{milis:03}"
+
+def formatear_tiempo(segundos):
+    """
+    Convierte un tiempo en segundos al formato HH:MM:SS,mmm usado en archivos SRT.
+    """
+    return ms_a_tiempo(int(round(segundos * 1000)))
+
+def _tiempos(linea):
+    """Extrae (inicio_ms, fin_ms) de una línea de tiempos o None si no lo es."""
+    inicio, separador, fin = linea.partition("-->")
+    if not separador:
+        return None
+    try:
+        # Tras el tiempo final puede haber coordenadas de posición
+        return tiempo_a_ms(inicio), tiempo_a_ms(fin.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+def iterar_srt(lineas):
+    """
+    Parser de una sola pasada: recorre las líneas de un SRT y va entregando
+    los subtítulos según se completan, sin cargar el archivo entero.
+
+    Tolera saltos de línea CRLF, BOM inicial, texto en varias líneas, líneas
+    en blanco de más y bloques sin número. Los bloques sin línea de tiempos
+    válida se ignoran.
+
+    Args:
+        lineas (iterable): Líneas del archivo (por ejemplo, el propio objeto archivo).
+
+    Yields:
+        Cue: Cada subtítulo, con las líneas de texto unidas por espacios.
+    """
+    indice = None
+    tiempos = None
+    texto = []
+    numero = 0
+    anterior = None  # Línea numérica pendiente de saber si es índice o texto
+    for linea in lineas:
+        linea = linea.rstrip("\r\n")
+        if numero == 0:
+            linea = linea.lstrip("\ufeff")
+        numero += 1
+        limpia = linea.strip()
+        if tiempos is None:
+            if not limpia:
+                continue
+            nuevos = _tiempos(limpia)
+            if nuevos is not None:
+                tiempos = nuevos
+            elif limpia.isdigit():
+                indice = int(limpia)
+            continue
+        if not limpia:
+            if anterior is not None:
+                texto.append(anterior)
+                anterior = None
+            yield Cue(indice, tiempos[0], tiempos[1], " ".join(texto))
+            indice, tiempos, texto = None, None, []
+            continue
+        if limpia.isdigit():
+            # Puede ser texto o el índice de un bloque sin línea en blanco previa
+            if anterior is not None:
+                texto.append(anterior)
+            anterior = limpia
+            continue
+        nuevos = _tiempos(limpia)
+        if nuevos is not None:
+            # Bloque nuevo sin separación: se cierra el actual
+            yield Cue(indice, tiempos[0], tiempos[1], " ".join(texto))
+            indice = int(anterior) if anterior is not None else None
+            tiempos, texto, anterior = nuevos, [], None
+            continue
+        if anterior is not None:
+            texto.append(anterior)
+            anterior = None
+        texto.append(limpia)
+    if tiempos is not None:
+        if anterior is not None:
+            texto.append(anterior)
+        yield Cue(indice, tiempos[0], tiempos[1], " ".join(texto))
+
+def parsear_srt(contenido):
+    """Parsea el contenido de un SRT (str) y devuelve la lista de subtítulos."""
+    return list(iterar_srt(io.StringIO(contenido)))
+
+def leer_srt(ruta):
+    """Lee un archivo SRT y devuelve la lista de subtítulos."""
+    with open(ruta, "r", encoding="utf-8-sig", newline="") as f:
+        return list(iterar_srt(f))
+
+class EscritorSRT:
+    """
+    Escritor de archivos SRT con buffer grande, para escribir subtítulos a
+    medida que se generan. Con 'renumerar' los índices se asignan de forma
+    consecutiva en el orden de escritura.
+    """
+
+    def __init__(self, ruta, renumerar=False, tam_buffer=1024 * 1024):
+        self.ruta = ruta
+        self.renumerar = renumerar
+        self.escritos = 0
+        self._archivo = open(ruta, "w", encoding="utf-8", buffering=tam_buffer)
+
+    def escribir(self, cue):
+        self.escritos += 1
+        indice = self.escritos if self.renumerar or cue.indice is None else cue.indice
+        self._archivo.write(f"{indice}\n{ms_a_tiempo(cue.inicio_ms)} --> {ms_a_tiempo(cue.fin_ms)}\n{cue.texto}\n\n")
+
+    def escribir_todos(self, cues):
+        for cue in cues:
+            self.escribir(cue)
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+class EscritorVTT(EscritorSRT):
+    """Escritor de archivos WebVTT, con la misma interfaz que EscritorSRT."""
+
+    def __init__(self, ruta, renumerar=False, tam_buffer=1024 * 1024):
+        super().__init__(ruta, renumerar, tam_buffer)
+        self._archivo.write("WEBVTT\n\n")
+
+    def escribir(self, cue):
+        self.escritos += 1
+        indice = self.escritos if self.renumerar or cue.indice is None else cue.indice
+        inicio, fin = ms_a_tiempo(cue.inicio_ms).replace(",", "."), ms_a_tiempo(cue.fin_ms).replace(",", ".")
+        self._archivo.write(f"{indice}\n{inicio} --> {fin}\n{cue.texto}\n\n")
+
+def abrir_escritor(ruta, renumerar=False, inmediato=False):
+    """
+    Abre un escritor SRT o WebVTT según la extensión de 'ruta'. Con
+    'inmediato' cada subtítulo llega al archivo en cuanto se escribe (para
+    que un reproductor pueda seguir el archivo mientras crece).
+    """
+    clase = EscritorVTT if ruta.lower().endswith(".vtt") else EscritorSRT
+    return clase(ruta, renumerar=renumerar, tam_buffer=1 if inmediato else 1024 * 1024)
+
+def escribir_srt(cues, ruta, renumerar=False):
+    """Escribe una secuencia de subtítulos en un archivo SRT."""
+    with EscritorSRT(ruta, renumerar=renumerar) as escritor:
+        escritor.escribir_todos(cues)
+
+def formatear_srt(cues, renumerar=False):
+    """Genera el contenido SRT (str) de una secuencia de subtítulos."""
+    partes = []
+    for numero, cue in enumerate(cues, start=1):
+        indice = numero if renumerar or cue.indice is None else cue.indice
+        partes.append(f"{indice}\n{ms_a_tiempo(cue.inicio_ms)} --> {ms_a_tiempo(cue.fin_ms)}\n{cue.texto}\n")
+    return "\n".join(partes)
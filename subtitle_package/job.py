@@ -0,0 +1,144 @@
+import os
+from dataclasses import asdict
+from subtitle_package import config, backends
+from subtitle_package.manifest import ManifiestoTrabajo
+from subtitle_package.cues import leer_srt
+from subtitle_package.audio import duracion_media
+from subtitle_package.autotune import Autoajuste
+from subtitle_package.cache import CacheTranscripcionesPCM
+from subtitle_package.pipeline import Pipeline
+from subtitle_package.reflow import ConfigReflow
+from subtitle_package.metrics import obtener_metricas
+
+def rutas_traducidas(srt_original, idiomas):
+    """Un SRT traducido por idioma junto al original: subtitulos.srt -> subtitulos_en.srt."""
+    base, extension = os.path.splitext(srt_original)
+    return {idioma: f"{base}_{idioma}{extension}" for idioma in idiomas}
+
+def crear_backend_transcripcion():
+    """
+    Devuelve el backend de transcripción configurado y la duración de
+    fragmento adecuada para él.
+    """
+    clase = backends.obtener("transcripcion", config.BACKEND_TRANSCRIPCION)
+    backend = clase(config.MODELO_WHISPER_LOCAL) if config.BACKEND_TRANSCRIPCION == "local" else clase()
+    return backend, backend.duracion_fragmento_ms
+
+def procesar_video(video, srt_original, video_final, idiomas, ruta_manifiesto=None, ruta_metricas=None):
+    """
+    Transcribe, traduce a cada idioma y añade las pistas de subtítulos a un vídeo.
+
+    El manifiesto del trabajo (por defecto, junto al vídeo) permite saltar
+    las etapas cuyas entradas y parámetros no han cambiado, y reanudar una
+    transcripción interrumpida. Al terminar, con éxito o no, se guarda el
+    informe de rendimiento en '<ruta_metricas>.json' y '<ruta_metricas>.prom'.
+    """
+    metricas = obtener_metricas()
+    metricas.reiniciar()
+    # El backend (procesos y hilos del Whisper local) se libera al terminar cada
+    # trabajo: en modo por lotes un mismo proceso encadena muchos
+    backend, chunk_length_ms = crear_backend_transcripcion()
+    try:
+        with metricas.etapa("total"):
+            _procesar_video(video, srt_original, video_final, idiomas, ruta_manifiesto, backend, chunk_length_ms)
+    finally:
+        backend.cerrar()
+        metricas.guardar(ruta_metricas or os.path.splitext(video)[0] + ".metricas")
+
+def _procesar_video(video, srt_original, video_final, idiomas, ruta_manifiesto, backend, chunk_length_ms):
+    metricas = obtener_metricas()
+    srts_traducidos = rutas_traducidas(srt_original, idiomas)
+    manifiesto = ManifiestoTrabajo(ruta_manifiesto or os.path.splitext(video)[0] + ".manifiesto.json")
+    autoajuste = None
+    if config.AUTOAJUSTE and backend.nombre == "openai":
+        # La duración de los fragmentos se elige una sola vez por trabajo: cambiarla
+        # invalidaría la transcripción hecha, su reanudación y la caché de fragmentos
+        fijada = manifiesto.valor("chunk_length_ms", manifiesto.parametros("transcripcion").get("chunk_length_ms"))
+        autoajuste = Autoajuste()
+        chunk_length_ms = autoajuste.planificar(duracion_media(video), len(idiomas),
+                                                chunk_length_ms=fijada).chunk_length_ms
+        if fijada is None:
+            manifiesto.fijar_valor("chunk_length_ms", chunk_length_ms)
+    parametros_transcripcion = {"chunk_length_ms": chunk_length_ms, "solape_ms": 0, **backend.parametros()}
+    config_reflow = ConfigReflow()
+    crear_traductores = backends.obtener("traduccion", "openai")
+    insertar_subtitulos = backends.obtener("mux", config.MUX)
+    parametros_traduccion = {
+        idioma: {"idioma_destino": idioma, "num_contextos": 2, "modelo": config.MODELO_TRADUCCION,
+                 "modelo_rapido": config.MODELO_TRADUCCION_RAPIDO,
+                 "reflow": asdict(config_reflow)}
+        for idioma in idiomas
+    }
+
+    def crear_pipeline(pendientes):
+        # Una transcripción compartida y una cadena de traducción por idioma.
+        # La concurrencia de las llamadas a la API la ajusta el motor compartido.
+        # En modo incremental solo se piden los subtítulos que cambiaron.
+        traductores = crear_traductores(pendientes, idiomas_por_peticion=config.IDIOMAS_POR_PETICION,
+                                        num_contextos=2, por_lotes=True, incremental=True,
+                                        rutas=srts_traducidos)
+        return Pipeline(traductores, chunk_length_ms=parametros_transcripcion["chunk_length_ms"],
+                        solape_ms=parametros_transcripcion["solape_ms"],
+                        config_reflow=config_reflow, backend_transcripcion=backend,
+                        srt_original=srt_original,
+                        srt_traducido={idioma: srts_traducidos[idioma] for idioma in pendientes})
+
+    def ejecutar(pipeline, funcion, *args):
+        # Con autoajuste, el plan se aplica y se revisa mientras dura la ejecución
+        if autoajuste is None:
+            return funcion(*args)
+        with autoajuste.ejecucion(pipeline):
+            return funcion(*args)
+
+    def registrar_traducciones(pendientes):
+        for idioma in pendientes:
+            manifiesto.registrar(f"traduccion_{idioma}", [srt_original], parametros_traduccion[idioma],
+                                 [srts_traducidos[idioma]])
+
+    if manifiesto.salidas_editadas("transcripcion", [video], parametros_transcripcion, [srt_original]):
+        # Transcribir de nuevo borraría las correcciones: se da el SRT editado por bueno
+        print("[INFO] El SRT original se ha editado a mano: se conserva y solo se traducen de nuevo "
+              "los subtítulos cambiados.")
+        manifiesto.registrar("transcripcion", [video], parametros_transcripcion, [srt_original])
+    if not manifiesto.vigente("transcripcion", [video], parametros_transcripcion, [srt_original]):
+        # El audio se decodifica en streaming directamente desde el vídeo y cada
+        # subtítulo se traduce en cuanto está transcrito junto con su contexto.
+        # Si una ejecución anterior se interrumpió, se reanuda fragmento a fragmento.
+        registro = manifiesto.registro_fragmentos(
+            "transcripcion", [manifiesto.hash_archivo(video), parametros_transcripcion]
+        )
+        pipeline = crear_pipeline(idiomas)
+        pipeline.registro_fragmentos = registro
+        # Los fragmentos idénticos muestra a muestra a otro ya transcrito (el mismo
+        # audio en otro archivo o tras perder el manifiesto) no se vuelven a enviar
+        pipeline.cache_transcripciones = CacheTranscripcionesPCM()
+        ejecutar(pipeline, pipeline.ejecutar, video)
+        manifiesto.registrar("transcripcion", [video], parametros_transcripcion, [srt_original])
+        registrar_traducciones(idiomas)
+        registro.limpiar()
+    else:
+        pendientes = [idioma for idioma in idiomas
+                      if not manifiesto.vigente(f"traduccion_{idioma}", [srt_original],
+                                                parametros_traduccion[idioma], [srts_traducidos[idioma]])]
+        if pendientes:
+            print(f"[INFO] La transcripción está al día; solo se traduce a: {', '.join(pendientes)}.")
+            # Las traducciones ya hechas se recuperan de la caché bloque a bloque
+            pipeline = crear_pipeline(pendientes)
+            pipeline.srt_original = None
+            with metricas.etapa("leer_srt", perfilar=True):
+                cues = leer_srt(srt_original)
+            ejecutar(pipeline, pipeline.traducir_cues, cues)
+            registrar_traducciones(pendientes)
+        else:
+            print("[INFO] La transcripción y las traducciones están al día.")
+
+    # Todas las pistas se añaden al vídeo en una sola pasada de ffmpeg (en modo
+    # "quemado", la primera se incrusta en la imagen y el resto van como pistas)
+    pistas = [(srts_traducidos[idioma], idioma) for idioma in idiomas]
+    entradas = [video] + [ruta for ruta, _ in pistas]
+    parametros_mux = {"idiomas": idiomas, "mux": config.MUX}
+    if not manifiesto.vigente("subtitulos", entradas, parametros_mux, [video_final]):
+        insertar_subtitulos(video, pistas, video_final)
+        manifiesto.registrar("subtitulos", entradas, parametros_mux, [video_final])
+    else:
+        print(f"[INFO] El vídeo con subtítulos está al día: {video_final}")
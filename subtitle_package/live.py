@@ -0,0 +1,58 @@
+import os
+from subtitle_package import config, backends
+from subtitle_package.job import crear_backend_transcripcion
+from subtitle_package.pipeline import Pipeline
+from subtitle_package.metrics import obtener_metricas
+
+def subtitular_en_vivo(entrada, salidas, srt_original=None, ventana_ms=10000, contexto_siguiente=0,
+                       ruta_metricas=None):
+    """
+    Subtitula una emisión en directo o una grabación en curso con unos pocos
+    segundos de retraso.
+
+    El audio se lee con ffmpeg según llega (archivo que crece, tubería o '-'
+    para la entrada estándar) y se transcribe por ventanas de unos
+    'ventana_ms' cortadas en las pausas. Cada subtítulo se traduce usando solo
+    el contexto previo y, como mucho, 'contexto_siguiente' subtítulos
+    posteriores (cada uno retrasa la traducción hasta que se transcribe), y se
+    añade al archivo de su idioma en cuanto está terminado.
+
+    Args:
+        entrada (str): Archivo, tubería, URL o '-'.
+        salidas (dict): Idioma -> ruta del archivo de subtítulos (.srt o .vtt).
+        srt_original (str): Si se indica, ruta de los subtítulos transcritos.
+        ventana_ms (int): Duración objetivo de cada ventana de audio.
+        contexto_siguiente (int): Subtítulos posteriores que se esperan como contexto.
+        ruta_metricas (str): Base de las rutas del informe de rendimiento (por
+            defecto, junto al primer archivo de salida).
+
+    Returns:
+        dict: Idioma -> lista de latencias (segundos) de cada subtítulo.
+    """
+    metricas = obtener_metricas()
+    metricas.reiniciar()
+    idiomas = list(salidas)
+    backend, duracion_fragmento_ms = crear_backend_transcripcion()
+    crear_traductores = backends.obtener("traduccion", "openai")
+    traductores = crear_traductores(idiomas, idiomas_por_peticion=config.IDIOMAS_POR_PETICION,
+                                    num_contextos=2, por_lotes=True,
+                                    num_contextos_siguientes=contexto_siguiente)
+    pipeline = Pipeline(traductores, chunk_length_ms=min(ventana_ms, duracion_fragmento_ms),
+                        backend_transcripcion=backend, srt_original=srt_original, srt_traducido=salidas,
+                        max_cola=8, en_vivo=True)
+    print(f"[INFO] Subtitulando en directo: {entrada} -> {', '.join(salidas.values())}")
+    try:
+        with metricas.etapa("total"):
+            pipeline.ejecutar(entrada)
+    finally:
+        backend.cerrar()
+        metricas.guardar(ruta_metricas or os.path.splitext(salidas[idiomas[0]])[0] + ".metricas")
+
+    latencias = {idioma: [segundos for _, segundos in pipeline.latencias[idioma]] for idioma in idiomas}
+    for idioma, valores in latencias.items():
+        if valores:
+            ordenados = sorted(valores)
+            print(f"[INFO] Latencia ({idioma}): mediana {ordenados[len(ordenados) // 2]:.1f} s, "
+                  f"p95 {ordenados[min(len(ordenados) - 1, int(0.95 * len(ordenados)))]:.1f} s, "
+                  f"máxima {ordenados[-1]:.1f} s en {len(valores)} subtítulos")
+    return latencias
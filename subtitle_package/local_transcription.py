@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import numpy as np
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from .transcription import BackendTranscripcion
+
+# Whisper trabaja con ventanas de audio de 30 segundos como máximo
+VENTANA_WHISPER_S = 30
+
+# --- Procesos de extracción de características ---
+
+_extractor_proceso = None
+
+def _extraer_caracteristicas(modelo, ventanas, sample_rate):
+    """Calcula los espectrogramas log-mel de varias ventanas (en un proceso aparte)."""
+    global _extractor_proceso
+    if _extractor_proceso is None:
+        from transformers import WhisperFeatureExtractor
+        _extractor_proceso = WhisperFeatureExtractor.from_pretrained(modelo)
+    return _extractor_proceso(ventanas, sampling_rate=sample_rate, return_tensors="np").input_features
+
+class BackendWhisperLocal(BackendTranscripcion):
+    """
+    Transcripción en CPU con un modelo Whisper de transformers/torch, sin API.
+
+    Los fragmentos se acumulan hasta reunir 'tam_lote' ventanas de 30 s, que
+    se transcriben en una sola pasada del modelo. Los espectrogramas se
+    calculan en un pool de procesos mientras el modelo procesa el lote
+    anterior en un hilo propio. Los fragmentos de más de 30 s se parten en
+    ventanas fijas, así que conviene usar fragmentos de 30 s como máximo.
+    """
+    nombre = "whisper-local"
+    # Whisper procesa ventanas de 30 s: fragmentos más largos se cortarían a ciegas
+    duracion_fragmento_ms = VENTANA_WHISPER_S * 1000
+
+    def __init__(self, modelo="openai/whisper-small", idioma=None, tam_lote=8, procesos=None, hilos=None,
+                 num_beams=1):
+        """
+        Args:
+            modelo (str): Nombre o ruta del modelo Whisper.
+            idioma (str): Idioma del audio (ej: "es"); None para detectarlo.
+            tam_lote (int): Ventanas de 30 s por pasada del modelo.
+            procesos (int): Procesos para calcular los espectrogramas.
+            hilos (int): Hilos intra-op de torch para la inferencia.
+            num_beams (int): Haces de la búsqueda; 1 es decodificación voraz.
+        """
+        self.modelo = modelo
+        self.idioma = idioma
+        self.tam_lote = tam_lote
+        self.procesos = procesos or min(4, os.cpu_count() or 1)
+        self.hilos = hilos
+        self.num_beams = num_beams
+        self._acumulados = []  # (future, inicio del fragmento, sample rate, ventanas)
+        self._num_ventanas = 0
+        self._lock = threading.Lock()
+        self._pool_procesos = None
+        self._inferencia = ThreadPoolExecutor(max_workers=1)
+        self._cargado = None
+
+    def max_pendientes(self):
+        # Un lote en el modelo y otro acumulándose
+        return 2 * self.tam_lote
+
+    def parametros(self):
+        return {"backend": self.nombre, "modelo": self.modelo, "idioma": self.idioma, "num_beams": self.num_beams}
+
+    def enviar(self, fragmento):
+        future = Future()
+        # La conversión a float32 copia las muestras y libera el buffer del fragmento
+        audio = fragmento.muestras.astype(np.float32) / 32768.0
+        paso = VENTANA_WHISPER_S * fragmento.sample_rate
+        ventanas = [(inicio / fragmento.sample_rate, audio[inicio:inicio + paso])
+                    for inicio in range(0, len(audio), paso)]
+        with self._lock:
+            self._acumulados.append((future, fragmento.inicio, fragmento.sample_rate, ventanas))
+            self._num_ventanas += len(ventanas)
+            completo = self._num_ventanas >= self.tam_lote
+        if completo:
+            self.vaciar()
+        return future
+
+    def vaciar(self):
+        with self._lock:
+            lote, self._acumulados = self._acumulados, []
+            self._num_ventanas = 0
+        if not lote:
+            return
+        if self._pool_procesos is None:
+            self._pool_procesos = ProcessPoolExecutor(self.procesos)
+        caracteristicas = [
+            self._pool_procesos.submit(_extraer_caracteristicas, self.modelo,
+                                       [ventana for _, ventana in ventanas], sample_rate)
+            for _, _, sample_rate, ventanas in lote
+        ]
+        self._inferencia.submit(self._transcribir_lote, lote, caracteristicas)
+
+    def _cargar(self):
+        if self._cargado is None:
+            import torch
+            from transformers import WhisperForConditionalGeneration, WhisperTokenizer
+
+            if self.hilos:
+                torch.set_num_threads(self.hilos)
+            red = WhisperForConditionalGeneration.from_pretrained(self.modelo)
+            red.eval()
+            self._cargado = (WhisperTokenizer.from_pretrained(self.modelo), red)
+        return self._cargado
+
+    def _transcribir_lote(self, lote, caracteristicas):
+        try:
+            import torch
+
+            tokenizador, red = self._cargar()
+            inicio = time.perf_counter()
+            entrada = torch.from_numpy(np.concatenate([f.result() for f in caracteristicas]))
+            with torch.inference_mode():
+                salida = red.generate(input_features=entrada, language=self.idioma, task="transcribe",
+                                      return_timestamps=True, num_beams=self.num_beams)
+            decodificados = tokenizador.batch_decode(salida, skip_special_tokens=True, output_offsets=True)
+        except BaseException as e:
+            for future, *_ in lote:
+                future.set_exception(e)
+            return
+
+        segundos_audio = 0.0
+        posicion = 0
+        for future, inicio_fragmento, sample_rate, ventanas in lote:
+            segments = []
+            for desplazamiento, ventana in ventanas:
+                segundos_audio += len(ventana) / sample_rate
+                for offset in decodificados[posicion]["offsets"]:
+                    texto = offset["text"].strip()
+                    inicio_seg, fin_seg = offset["timestamp"]
+                    if not texto or inicio_seg is None:
+                        continue
+                    fin_seg = len(ventana) / sample_rate if fin_seg is None else fin_seg
+                    segments.append({
+                        'index': len(segments) + 1,
+                        'start': inicio_fragmento + desplazamiento + inicio_seg,
+                        'end': inicio_fragmento + desplazamiento + fin_seg,
+                        'text': texto,
+                    })
+                posicion += 1
+            future.set_result(segments)
+        segundos = time.perf_counter() - inicio
+        if segundos_audio:
+            print(f"[INFO] Whisper local: {posicion} ventanas, {segundos_audio:.0f} s de audio en "
+                  f"{segundos:.1f} s (factor tiempo real {segundos / segundos_audio:.2f})")
+
+    def cerrar(self):
+        self._inferencia.shutdown()
+        if self._pool_procesos is not None:
+            self._pool_procesos.shutdown()
+            self._pool_procesos = None
@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from .SRTTranslator import SRTTranslator
+from .cache import CacheTraducciones
+
+# Versión del backend local en la clave de la caché (no hay prompt que versionar)
+VERSION_LOCAL = 1
+
+def modelo_marian(idioma_origen, idioma_destino):
+    """Nombre del modelo MarianMT (Helsinki-NLP/opus-mt) para un par de idiomas."""
+    return f"Helsinki-NLP/opus-mt-{idioma_origen}-{idioma_destino}"
+
+def cargar_modelo(modelo, hilos=None):
+    """
+    Carga el tokenizador y el modelo seq2seq en CPU en modo evaluación.
+    'modelo' puede ser un nombre del Hub o una ruta local. transformers y
+    torch se importan aquí para que sean dependencias opcionales.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    if hilos:
+        torch.set_num_threads(hilos)
+    tokenizador = AutoTokenizer.from_pretrained(modelo)
+    red = AutoModelForSeq2SeqLM.from_pretrained(modelo)
+    red.eval()
+    return tokenizador, red
+
+def crear_lotes_por_longitud(longitudes, max_lote=32, max_tokens_lote=4096):
+    """
+    Ordena los textos por longitud y los agrupa en lotes dinámicos: cada lote
+    se cierra al llegar a 'max_lote' textos o cuando el relleno hasta el más
+    largo superaría 'max_tokens_lote' tokens. Al ir ordenados, los textos de
+    un lote tienen longitudes parecidas y apenas hay relleno.
+
+    Returns:
+        list: Lotes de índices de la lista original.
+    """
+    orden = sorted(range(len(longitudes)), key=longitudes.__getitem__)
+    lotes = []
+    lote = []
+    for i in orden:
+        # Ordenados de menor a mayor, el último añadido marca el relleno del lote
+        if lote and (len(lote) >= max_lote or longitudes[i] * (len(lote) + 1) > max_tokens_lote):
+            lotes.append(lote)
+            lote = []
+        lote.append(i)
+    if lote:
+        lotes.append(lote)
+    return lotes
+
+def traducir_con_modelo(tokenizador, red, textos, max_lote=32, max_tokens_lote=4096, num_beams=1):
+    """
+    Traduce una lista de textos con lotes ordenados por longitud y relleno
+    dinámico (cada lote se rellena solo hasta su texto más largo).
+
+    Returns:
+        list: Traducciones en el mismo orden que 'textos'.
+    """
+    import torch
+
+    longitudes = [len(ids) for ids in tokenizador(textos, truncation=True)["input_ids"]]
+    resultado = [None] * len(textos)
+    for lote in crear_lotes_por_longitud(longitudes, max_lote, max_tokens_lote):
+        entrada = tokenizador([textos[i] for i in lote], return_tensors="pt", padding="longest", truncation=True)
+        with torch.inference_mode():
+            salida = red.generate(**entrada, num_beams=num_beams)
+        for i, traduccion in zip(lote, tokenizador.batch_decode(salida, skip_special_tokens=True)):
+            resultado[i] = traduccion.strip()
+    return resultado
+
+# --- Procesos de trabajo: cada uno carga su propia copia del modelo ---
+
+_modelo_proceso = None
+
+def _iniciar_proceso(modelo, hilos):
+    global _modelo_proceso
+    _modelo_proceso = cargar_modelo(modelo, hilos)
+
+def _traducir_en_proceso(textos, max_lote, max_tokens_lote, num_beams):
+    tokenizador, red = _modelo_proceso
+    return traducir_con_modelo(tokenizador, red, textos, max_lote, max_tokens_lote, num_beams)
+
+class TraductorLocal:
+    """
+    Backend de traducción offline en CPU con un modelo seq2seq (MarianMT).
+
+    Se puede usar como 'translate_func' (traducción de un texto) y como
+    'translate_batch_func' (varios bloques a la vez) de SRTTranslator. El
+    modelo no usa el contexto previo ni siguiente.
+    """
+
+    def __init__(self, modelo, hilos=None, procesos=1, max_lote=32, max_tokens_lote=4096, num_beams=1):
+        """
+        Args:
+            modelo (str): Nombre o ruta del modelo (ver 'modelo_marian').
+            hilos (int): Hilos intra-op de torch por proceso. Por defecto se
+                reparten los núcleos disponibles entre los procesos.
+            procesos (int): Procesos con su propia copia del modelo. Con más de
+                uno, los lotes se reparten entre ellos.
+            max_lote (int): Máximo de textos por lote de inferencia.
+            max_tokens_lote (int): Máximo de tokens (con relleno) por lote.
+            num_beams (int): Haces de la búsqueda; 1 es decodificación voraz.
+        """
+        self.modelo = modelo
+        self.procesos = max(1, procesos)
+        self.hilos = hilos or max(1, (os.cpu_count() or 1) // self.procesos)
+        self.max_lote = max_lote
+        self.max_tokens_lote = max_tokens_lote
+        self.num_beams = num_beams
+        self._cargado = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self.bloques_traducidos = 0
+        self.segundos = 0.0
+
+    def _modelo(self):
+        if self._cargado is None:
+            self._cargado = cargar_modelo(self.modelo, self.hilos)
+        return self._cargado
+
+    def traducir_textos(self, textos):
+        """
+        Traduce una lista de textos y devuelve las traducciones en el mismo orden.
+        """
+        if not textos:
+            return []
+        inicio = time.perf_counter()
+        if self.procesos == 1:
+            tokenizador, red = self._modelo()
+            resultado = traducir_con_modelo(tokenizador, red, textos, self.max_lote,
+                                            self.max_tokens_lote, self.num_beams)
+        else:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.procesos, initializer=_iniciar_proceso,
+                                                     initargs=(self.modelo, self.hilos))
+            # Trozos intercalados para que cada proceso reciba textos de todas las longitudes
+            trozos = [textos[p::self.procesos] for p in range(self.procesos)]
+            tarea = partial(_traducir_en_proceso, max_lote=self.max_lote,
+                            max_tokens_lote=self.max_tokens_lote, num_beams=self.num_beams)
+            traducidos = list(self._executor.map(tarea, trozos))
+            resultado = [None] * len(textos)
+            for p, trozo in enumerate(traducidos):
+                resultado[p::self.procesos] = trozo
+        with self._lock:
+            self.bloques_traducidos += len(textos)
+            self.segundos += time.perf_counter() - inicio
+        return resultado
+
+    def resumen(self):
+        """Bloques traducidos y tiempo empleado hasta ahora (ver SRTTranslator.informar_resumen)."""
+        if not self.bloques_traducidos:
+            return "Traducción local: ningún bloque traducido."
+        return (f"Traducción local: {self.bloques_traducidos} bloques en {self.segundos:.2f} s "
+                f"({self.bloques_traducidos / max(self.segundos, 1e-9):.1f} bloques/s)")
+
+    def __call__(self, texto, idioma_destino="en", contexto_previo="", contexto_siguiente=""):
+        """Firma de 'translate_func': traduce un único texto."""
+        return self.traducir_textos([texto])[0]
+
+    def traducir_lote(self, textos, idioma_destino="en", contexto_previo="", contexto_siguiente=""):
+        """Firma de 'translate_batch_func': número de bloque -> traducción."""
+        numeros = list(textos)
+        return dict(zip(numeros, self.traducir_textos([textos[n] for n in numeros])))
+
+    def cerrar(self):
+        """Detiene los procesos de trabajo, si los hay."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+def crear_traductor_local(srt_path=None, srt_traducido_path=None, idioma_origen="es", idioma_destino="en",
+                          modelo=None, hilos=None, procesos=1, max_lote=32, max_tokens_lote=4096,
+                          tokens_por_peticion=20000, usar_cache=True):
+    """
+    Crea un SRTTranslator que traduce en local con MarianMT, sin latencia ni
+    coste de API. Los bloques se envían en lotes grandes
+    ('tokens_por_peticion') para que la ordenación por longitud agrupe bien
+    y un único hilo alimenta al modelo, que ya usa todos los núcleos.
+    """
+    modelo = modelo or modelo_marian(idioma_origen, idioma_destino)
+    traductor = TraductorLocal(modelo, hilos=hilos, procesos=procesos, max_lote=max_lote,
+                               max_tokens_lote=max_tokens_lote)
+    return SRTTranslator(
+        srt_path=srt_path,
+        srt_traducido_path=srt_traducido_path,
+        idioma_destino=idioma_destino,
+        num_contextos=0,
+        max_workers=1,
+        translate_func=traductor,
+        translate_batch_func=traductor.traducir_lote,
+        max_tokens_lote=tokens_por_peticion,
+        cache=CacheTraducciones() if usar_cache else None,
+        modelo=modelo,
+        version_prompt=VERSION_LOCAL,
+        backend=traductor
+    )
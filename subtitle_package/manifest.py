@@ -0,0 +1,161 @@
+import os
+import json
+import hashlib
+import threading
+
+def hash_contenido(ruta, tam_bloque=1024 * 1024):
+    """Calcula el SHA-256 del contenido de un archivo leyéndolo por bloques."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while bloque := f.read(tam_bloque):
+            h.update(bloque)
+    return h.hexdigest()
+
+def _normalizar(valor):
+    """Normaliza parámetros para compararlos tal y como quedan guardados en JSON."""
+    return json.loads(json.dumps(valor, sort_keys=True))
+
+class ManifiestoTrabajo:
+    """
+    Manifiesto de un trabajo: registra, para cada etapa, los hashes de contenido
+    de sus entradas y salidas y sus parámetros, como un pequeño DAG de build.
+
+    Una etapa está vigente si sus parámetros coinciden y todas sus entradas y
+    salidas existen con el mismo contenido que cuando se ejecutó; si no, hay
+    que volver a ejecutarla. Como las entradas de una etapa son las salidas de
+    la anterior, cualquier cambio se propaga hacia abajo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.datos = {"etapas": {}, "hashes": {}}
+        if os.path.exists(ruta):
+            with open(ruta, "r", encoding="utf-8") as f:
+                self.datos = json.load(f)
+
+    def hash_archivo(self, ruta):
+        """
+        Devuelve el hash del contenido de un archivo. Se memoriza por tamaño y
+        fecha de modificación para no releer vídeos grandes en cada ejecución.
+        """
+        ruta_abs = os.path.abspath(ruta)
+        info = os.stat(ruta_abs)
+        memorizado = self.datos["hashes"].get(ruta_abs)
+        if memorizado and memorizado["tamano"] == info.st_size and memorizado["mtime_ns"] == info.st_mtime_ns:
+            return memorizado["sha256"]
+        sha256 = hash_contenido(ruta_abs)
+        self.datos["hashes"][ruta_abs] = {"tamano": info.st_size, "mtime_ns": info.st_mtime_ns, "sha256": sha256}
+        return sha256
+
+    def _hashes(self, rutas):
+        return {ruta: self.hash_archivo(ruta) if os.path.exists(ruta) else None for ruta in rutas}
+
+    def vigente(self, nombre, entradas, parametros, salidas):
+        """
+        Indica si la etapa 'nombre' puede omitirse porque ni sus entradas, ni sus
+        parámetros, ni sus salidas han cambiado desde la última ejecución.
+        """
+        registro = self.datos["etapas"].get(nombre)
+        if registro is None or registro["parametros"] != _normalizar(parametros):
+            return False
+        for rutas, registrados in ((entradas, registro["entradas"]), (salidas, registro["salidas"])):
+            actuales = self._hashes(rutas)
+            if None in actuales.values() or actuales != registrados:
+                return False
+        return True
+
+    def salidas_editadas(self, nombre, entradas, parametros, salidas):
+        """
+        Indica si la etapa 'nombre' solo ha dejado de estar vigente porque se
+        editaron sus salidas (por ejemplo, un SRT corregido a mano): sus
+        entradas y parámetros no han cambiado y todas sus salidas existen.
+        """
+        registro = self.datos["etapas"].get(nombre)
+        if registro is None or registro["parametros"] != _normalizar(parametros):
+            return False
+        if self._hashes(entradas) != registro["entradas"]:
+            return False
+        actuales = self._hashes(salidas)
+        return None not in actuales.values() and actuales != registro["salidas"]
+
+    def registrar(self, nombre, entradas, parametros, salidas):
+        """Registra una ejecución correcta de la etapa y guarda el manifiesto."""
+        with self._lock:
+            self.datos["etapas"][nombre] = {
+                "entradas": self._hashes(entradas),
+                "parametros": _normalizar(parametros),
+                "salidas": self._hashes(salidas),
+            }
+            self.guardar()
+
+    def parametros(self, nombre):
+        """Parámetros con los que se registró por última vez la etapa 'nombre' ({} si no consta)."""
+        return self.datos["etapas"].get(nombre, {}).get("parametros", {})
+
+    def valor(self, nombre, defecto=None):
+        """Devuelve un valor fijado para el trabajo con 'fijar_valor'."""
+        return self.datos.get("valores", {}).get(nombre, defecto)
+
+    def fijar_valor(self, nombre, valor):
+        """Fija un valor que debe mantenerse en todas las ejecuciones del trabajo y guarda el manifiesto."""
+        with self._lock:
+            self.datos.setdefault("valores", {})[nombre] = _normalizar(valor)
+            self.guardar()
+
+    def guardar(self):
+        """Escribe el manifiesto de forma atómica."""
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(self.datos, f, indent=2, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+    def registro_fragmentos(self, nombre, firma):
+        """
+        Devuelve el registro de fragmentos de la etapa 'nombre' para reanudar
+        una ejecución interrumpida. 'firma' identifica la entrada y los
+        parámetros: si cambia, los fragmentos guardados dejan de ser válidos.
+        """
+        return RegistroFragmentos(f"{self.ruta}.{nombre}.jsonl", firma)
+
+class RegistroFragmentos:
+    """
+    Registro de solo-añadir (JSON Lines) con el resultado de cada fragmento
+    terminado, para que una ejecución interrumpida continúe donde se quedó.
+    """
+
+    def __init__(self, ruta, firma):
+        self.ruta = ruta
+        self.firma = firma
+        self.resultados = {}
+        self._lock = threading.Lock()
+        if os.path.exists(ruta):
+            with open(ruta, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except json.JSONDecodeError:
+                        break  # Última línea a medio escribir
+                    if entrada.get("firma") == firma:
+                        self.resultados[entrada["clave"]] = entrada["resultado"]
+        if not self.resultados and os.path.exists(ruta):
+            os.remove(ruta)
+
+    def obtener(self, clave):
+        """Devuelve el resultado guardado para 'clave' o None."""
+        return self.resultados.get(str(clave))
+
+    def guardar(self, clave, resultado):
+        """Añade el resultado de un fragmento terminado."""
+        with self._lock:
+            self.resultados[str(clave)] = resultado
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"firma": self.firma, "clave": str(clave), "resultado": resultado},
+                                   ensure_ascii=False) + "\n")
+
+    def limpiar(self):
+        """Elimina el registro una vez la etapa ha terminado."""
+        with self._lock:
+            self.resultados = {}
+            if os.path.exists(self.ruta):
+                os.remove(self.ruta)
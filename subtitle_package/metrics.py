@@ -0,0 +1,222 @@
+import io
+import json
+import time
+import bisect
+import pstats
+import random
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Límites (en segundos) de las cubetas de los histogramas de latencia
+CUBETAS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _clave(nombre, etiquetas):
+    return (nombre, tuple(sorted(etiquetas.items())))
+
+def _etiquetas_prometheus(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+class Histograma:
+    """
+    Histograma de cubetas fijas (como los de Prometheus) más una muestra
+    acotada de valores para calcular percentiles en el informe.
+    """
+
+    def __init__(self, cubetas=CUBETAS_LATENCIA, max_muestra=10000):
+        self.cubetas = cubetas
+        self.conteos = [0] * (len(cubetas) + 1)
+        self.suma = 0.0
+        self.total = 0
+        self.max_muestra = max_muestra
+        self.muestra = []
+
+    def observar(self, valor):
+        self.conteos[bisect.bisect_left(self.cubetas, valor)] += 1
+        self.suma += valor
+        self.total += 1
+        # Muestreo por reservorio: la muestra representa a todas las observaciones
+        if len(self.muestra) < self.max_muestra:
+            self.muestra.append(valor)
+        else:
+            i = random.randrange(self.total)
+            if i < self.max_muestra:
+                self.muestra[i] = valor
+
+    def percentil(self, p):
+        if not self.muestra:
+            return None
+        ordenada = sorted(self.muestra)
+        return ordenada[min(len(ordenada) - 1, int(p / 100 * len(ordenada)))]
+
+    def resumen(self):
+        return {
+            "total": self.total,
+            "suma": round(self.suma, 6),
+            "media": round(self.suma / self.total, 6) if self.total else None,
+            "p50": self.percentil(50),
+            "p90": self.percentil(90),
+            "p99": self.percentil(99),
+            "max": max(self.muestra) if self.muestra else None,
+        }
+
+class Metricas:
+    """
+    Registro de métricas de una ejecución: tiempos de pared y de CPU por etapa,
+    contadores (reintentos, esperas, bytes subidos, tokens...) e histogramas de
+    latencia por petición. Se exporta como informe JSON y en formato de texto
+    de Prometheus.
+
+    Con 'perfilar' activado, las etapas marcadas como CPU intensivas se
+    ejecutan bajo cProfile y se toma una instantánea de tracemalloc.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.perfilar = False
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Borra todas las métricas (por ejemplo, al empezar un trabajo nuevo)."""
+        with self._lock:
+            self.inicio = time.time()
+            self.etapas = {}
+            self.contadores = {}
+            self.histogramas = {}
+            self.perfiles = {}
+            self.memoria = None
+
+    def activar_perfil(self):
+        """Activa cProfile en las etapas CPU intensivas y el seguimiento de memoria."""
+        self.perfilar = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def etapa(self, nombre, perfilar=False):
+        """
+        Mide una etapa: tiempo de pared, CPU del hilo que la ejecuta y número
+        de ejecuciones. Con 'perfilar' y el perfil activado, la etapa se
+        ejecuta bajo cProfile.
+        """
+        perfil = cProfile.Profile() if perfilar and self.perfilar else None
+        inicio, cpu = time.perf_counter(), time.thread_time()
+        if perfil is not None:
+            perfil.enable()
+        try:
+            yield
+        finally:
+            if perfil is not None:
+                perfil.disable()
+            pared, cpu = time.perf_counter() - inicio, time.thread_time() - cpu
+            with self._lock:
+                datos = self.etapas.setdefault(nombre, {"ejecuciones": 0, "pared_s": 0.0, "cpu_s": 0.0})
+                datos["ejecuciones"] += 1
+                datos["pared_s"] += pared
+                datos["cpu_s"] += cpu
+                if perfil is not None:
+                    self.perfiles.setdefault(nombre, []).append(perfil)
+
+    def medir_iterador(self, nombre, iterable):
+        """
+        Recorre 'iterable' midiendo como etapa 'nombre' solo el tiempo que tarda
+        en producir cada elemento (por ejemplo, la decodificación del audio).
+        """
+        iterador = iter(iterable)
+        while True:
+            with self.etapa(nombre):
+                try:
+                    elemento = next(iterador)
+                except StopIteration:
+                    return
+            yield elemento
+
+    def incrementar(self, nombre, cantidad=1, **etiquetas):
+        with self._lock:
+            clave = _clave(nombre, etiquetas)
+            self.contadores[clave] = self.contadores.get(clave, 0) + cantidad
+
+    def observar(self, nombre, valor, **etiquetas):
+        with self._lock:
+            clave = _clave(nombre, etiquetas)
+            if clave not in self.histogramas:
+                self.histogramas[clave] = Histograma()
+            self.histogramas[clave].observar(valor)
+
+    def _texto_perfil(self, perfiles, lineas=25):
+        salida = io.StringIO()
+        estadisticas = pstats.Stats(perfiles[0], stream=salida)
+        for perfil in perfiles[1:]:
+            estadisticas.add(perfil)
+        estadisticas.sort_stats("cumulative").print_stats(lineas)
+        return salida.getvalue()
+
+    def informe(self):
+        """Devuelve el informe de la ejecución como diccionario serializable en JSON."""
+        with self._lock:
+            if self.perfilar and tracemalloc.is_tracing():
+                actual, pico = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:20]
+                self.memoria = {
+                    "actual_bytes": actual,
+                    "pico_bytes": pico,
+                    "top": [{"linea": str(e.traceback), "bytes": e.size, "bloques": e.count} for e in top],
+                }
+            return {
+                "inicio": self.inicio,
+                "duracion_s": round(time.time() - self.inicio, 3),
+                "etapas": {nombre: {k: round(v, 6) if isinstance(v, float) else v for k, v in datos.items()}
+                           for nombre, datos in self.etapas.items()},
+                "contadores": [{"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                               for (nombre, etiquetas), valor in sorted(self.contadores.items())],
+                "histogramas": [{"nombre": nombre, "etiquetas": dict(etiquetas), **h.resumen()}
+                                for (nombre, etiquetas), h in sorted(self.histogramas.items())],
+                "perfiles": {nombre: self._texto_perfil(perfiles) for nombre, perfiles in self.perfiles.items()},
+                "memoria": self.memoria,
+            }
+
+    def exportar_prometheus(self, prefijo="subtitulos"):
+        """Devuelve las métricas en el formato de texto de Prometheus."""
+        lineas = []
+        with self._lock:
+            for metrica, campo in (("etapa_pared_segundos", "pared_s"), ("etapa_cpu_segundos", "cpu_s"),
+                                   ("etapa_ejecuciones", "ejecuciones")):
+                lineas.append(f"# TYPE {prefijo}_{metrica} counter")
+                for nombre, datos in sorted(self.etapas.items()):
+                    lineas.append(f'{prefijo}_{metrica}{{etapa="{nombre}"}} {datos[campo]}')
+            tipos = set()
+            for (nombre, etiquetas), valor in sorted(self.contadores.items()):
+                if nombre not in tipos:
+                    lineas.append(f"# TYPE {prefijo}_{nombre} counter")
+                    tipos.add(nombre)
+                lineas.append(f"{prefijo}_{nombre}{_etiquetas_prometheus(etiquetas)} {valor}")
+            for (nombre, etiquetas), h in sorted(self.histogramas.items()):
+                if nombre not in tipos:
+                    lineas.append(f"# TYPE {prefijo}_{nombre} histogram")
+                    tipos.add(nombre)
+                acumulado = 0
+                for limite, conteo in zip(list(h.cubetas) + ["+Inf"], h.conteos):
+                    acumulado += conteo
+                    lineas.append(f"{prefijo}_{nombre}_bucket{_etiquetas_prometheus(etiquetas, [('le', limite)])} "
+                                  f"{acumulado}")
+                lineas.append(f"{prefijo}_{nombre}_sum{_etiquetas_prometheus(etiquetas)} {h.suma}")
+                lineas.append(f"{prefijo}_{nombre}_count{_etiquetas_prometheus(etiquetas)} {h.total}")
+        return "\n".join(lineas) + "\n"
+
+    def guardar(self, ruta_base):
+        """Escribe el informe JSON ('<ruta_base>.json') y las métricas de Prometheus ('<ruta_base>.prom')."""
+        with open(ruta_base + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.informe(), f, indent=2, ensure_ascii=False)
+        with open(ruta_base + ".prom", "w", encoding="utf-8") as f:
+            f.write(self.exportar_prometheus())
+        print(f"[INFO] Informe de rendimiento guardado en: {ruta_base}.json")
+
+_metricas = Metricas()
+
+def obtener_metricas():
+    """Devuelve el registro de métricas del proceso."""
+    return _metricas
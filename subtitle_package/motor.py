@@ -0,0 +1,642 @@
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import sqlite3
+import asyncio
+import threading
+from collections import deque
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import httpx
+from subtitle_package import config
+from subtitle_package.metrics import obtener_metricas
+
+class CuboTokens:
+    """
+    Cubo de tokens asíncrono: permite consumir hasta 'por_minuto' unidades por
+    minuto, repuestas de forma continua. Con 'por_minuto' a 0 no limita nada.
+    """
+
+    def __init__(self, por_minuto):
+        self.capacidad = por_minuto
+        self.tasa = por_minuto / 60.0
+        self.disponibles = float(por_minuto)
+        self.actualizado = time.monotonic()
+        self.bloqueado_hasta = 0.0
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        self.disponibles = min(self.capacidad, self.disponibles + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+
+    async def consumir(self, cantidad=1):
+        """Espera hasta que haya 'cantidad' unidades disponibles y las consume."""
+        while True:
+            ahora = time.monotonic()
+            if ahora < self.bloqueado_hasta:
+                await asyncio.sleep(self.bloqueado_hasta - ahora)
+                continue
+            if not self.capacidad:
+                return
+            cantidad = min(cantidad, self.capacidad)
+            self._reponer()
+            if self.disponibles >= cantidad:
+                self.disponibles -= cantidad
+                return
+            await asyncio.sleep((cantidad - self.disponibles) / self.tasa)
+
+    def sincronizar(self, restantes, reinicio_s=None):
+        """Ajusta el cubo a lo que informa el servidor en las cabeceras de límite."""
+        if not self.capacidad or restantes is None:
+            return
+        self._reponer()
+        self.disponibles = min(self.disponibles, restantes)
+        if restantes == 0 and reinicio_s:
+            self.bloquear(reinicio_s)
+
+    def bloquear(self, segundos):
+        """Impide consumir durante 'segundos' (por ejemplo, tras un Retry-After)."""
+        self.bloqueado_hasta = max(self.bloqueado_hasta, time.monotonic() + segundos)
+
+    def hay_disponibles(self, cantidad=1):
+        """Indica si se podrían consumir 'cantidad' unidades sin esperar."""
+        if time.monotonic() < self.bloqueado_hasta:
+            return False
+        if not self.capacidad:
+            return True
+        self._reponer()
+        return self.disponibles >= min(cantidad, self.capacidad)
+
+    def consumir_sin_esperar(self, cantidad=1):
+        """Consume 'cantidad' unidades (comprobadas antes con 'hay_disponibles')."""
+        if self.capacidad:
+            self.disponibles -= min(cantidad, self.capacidad)
+
+class LimitadorAIMD:
+    """
+    Limita las peticiones en vuelo y ajusta el límite con AIMD: suma
+    1/límite con cada éxito (unas +1 por ventana completa) y lo multiplica por
+    'factor' cuando el servidor nos frena, como mucho una vez por segundo.
+
+    Cuando hay peticiones esperando hueco, entra primero la de mayor
+    prioridad (su coste esperado: el audio más largo o el lote con más
+    tokens), de modo que las más lentas empiezan antes y no quedan rezagadas
+    al final del trabajo. Solo se usa desde el bucle del motor.
+    """
+
+    def __init__(self, inicial=4, minimo=1, maximo=32, factor=0.5):
+        self.limite = float(inicial)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.factor = factor
+        self.en_vuelo = 0
+        self._ultima_reduccion = 0.0
+        self._esperando = []  # Montículo de (-prioridad, orden de llegada, future)
+        self._orden = itertools.count()
+
+    async def adquirir(self, prioridad=0):
+        if not self._esperando and self.en_vuelo < int(self.limite):
+            self.en_vuelo += 1
+            return
+        turno = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._esperando, (-prioridad, next(self._orden), turno))
+        try:
+            await turno
+        except asyncio.CancelledError:
+            if turno.done() and not turno.cancelled():
+                # El hueco se concedió justo antes de la cancelación
+                self._soltar()
+            raise
+
+    def intentar_adquirir(self):
+        """Ocupa un hueco si lo hay sin esperar ni adelantar a nadie."""
+        if self._esperando or self.en_vuelo >= int(self.limite):
+            return False
+        self.en_vuelo += 1
+        return True
+
+    def fijar(self, limite):
+        """Fija el límite actual (desde un plan del autoajuste); AIMD sigue ajustándolo después."""
+        self.limite = float(min(self.maximo, max(self.minimo, limite)))
+        self._admitir()
+
+    def _soltar(self):
+        self.en_vuelo -= 1
+        self._admitir()
+
+    def _admitir(self):
+        while self._esperando and self.en_vuelo < int(self.limite):
+            _, _, turno = heapq.heappop(self._esperando)
+            if not turno.done():  # Las esperas canceladas se descartan
+                self.en_vuelo += 1
+                turno.set_result(None)
+
+    async def liberar(self, exito=False, frenado=False):
+        ahora = time.monotonic()
+        if frenado:
+            if ahora - self._ultima_reduccion > 1.0:
+                self.limite = max(self.minimo, self.limite * self.factor)
+                self._ultima_reduccion = ahora
+        elif exito:
+            self.limite = min(self.maximo, self.limite + 1.0 / self.limite)
+        self._soltar()
+
+class Endpoint:
+    """
+    Estado de limitación de un endpoint: cubos de peticiones y tokens,
+    concurrencia AIMD, latencias recientes por unidad de coste (para decidir
+    cuándo cubrir una petición rezagada) y observaciones de cada petición
+    (para el autoajuste).
+    """
+
+    # Latencias recientes que se conservan y mínimo necesario para cubrir peticiones
+    VENTANA_LATENCIAS = 200
+    MIN_LATENCIAS = 10
+    # Observaciones por petición pendientes de recoger por el autoajuste
+    VENTANA_OBSERVACIONES = 5000
+
+    def __init__(self, nombre, rpm, tpm, max_concurrencia):
+        self.nombre = nombre
+        self.peticiones = CuboTokens(rpm)
+        self.tokens = CuboTokens(tpm)
+        self.limitador = LimitadorAIMD(inicial=min(4, max_concurrencia), maximo=max_concurrencia)
+        self.latencias_por_coste = deque(maxlen=self.VENTANA_LATENCIAS)
+        # (instante, coste, latencia o None, frenada) de cada intento, para el autoajuste
+        self.observaciones = deque(maxlen=self.VENTANA_OBSERVACIONES)
+        self.llamadas = 0
+        self.coberturas = 0
+
+    @staticmethod
+    def unidades(coste):
+        """Unidades de coste (segundos de audio o tokens) por las que se divide la latencia."""
+        return max(1.0, coste or 0)
+
+    def anotar_latencia(self, latencia, coste):
+        self.latencias_por_coste.append(latencia / self.unidades(coste))
+
+    def umbral_cobertura(self, percentil, coste=0):
+        """
+        Latencia (s) a partir de la cual una petición de coste 'coste' se
+        considera rezagada: el percentil 'percentil' de las latencias recientes
+        por unidad de coste, multiplicado por su coste. Así el audio más largo
+        o el lote con más tokens no parece rezagado solo por ser el mayor.
+        Devuelve None si aún no hay suficientes latencias o la cobertura está
+        desactivada.
+        """
+        if not percentil or len(self.latencias_por_coste) < self.MIN_LATENCIAS:
+            return None
+        ordenadas = sorted(self.latencias_por_coste)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * percentil / 100))] * self.unidades(coste)
+
+    def reservar_cobertura(self, tokens, max_fraccion):
+        """
+        Reserva sin esperar un hueco de concurrencia, una petición y 'tokens'
+        tokens para una copia de una petición rezagada. Las copias no pueden
+        superar 'max_fraccion' de las llamadas ni adelantar a las peticiones
+        que esperan turno.
+
+        Returns:
+            bool: True si la reserva se ha hecho (y hay que liberar el hueco).
+        """
+        if self.coberturas >= max_fraccion * self.llamadas:
+            return False
+        if not (self.peticiones.hay_disponibles(1) and self.tokens.hay_disponibles(tokens)):
+            return False
+        if not self.limitador.intentar_adquirir():
+            return False
+        self.peticiones.consumir_sin_esperar(1)
+        self.tokens.consumir_sin_esperar(tokens)
+        self.coberturas += 1
+        return True
+
+    def actualizar_desde_cabeceras(self, cabeceras):
+        """Sincroniza los cubos con las cabeceras 'x-ratelimit-*' de la respuesta."""
+        self.peticiones.sincronizar(_entero(cabeceras.get("x-ratelimit-remaining-requests")),
+                                    _duracion(cabeceras.get("x-ratelimit-reset-requests")))
+        self.tokens.sincronizar(_entero(cabeceras.get("x-ratelimit-remaining-tokens")),
+                                _duracion(cabeceras.get("x-ratelimit-reset-tokens")))
+
+    def bloquear(self, segundos):
+        self.peticiones.bloquear(segundos)
+        self.tokens.bloquear(segundos)
+
+class PresupuestoGlobal:
+    """
+    Presupuesto de la API compartido entre procesos a través de SQLite.
+
+    Cada proceso tiene su propio motor, con sus cubos y su límite AIMD; este
+    presupuesto añade por encima unos cubos de peticiones y tokens por minuto
+    y un máximo de peticiones en vuelo comunes a todos los procesos que usen
+    la misma base de datos, de modo que muchos trabajos a la vez saturen la
+    cuota sin superarla. Las peticiones en vuelo se registran como reservas
+    con caducidad, para que un proceso que muere no bloquee a los demás.
+    """
+
+    def __init__(self, ruta, limites=None, caducidad_s=600):
+        """
+        Args:
+            ruta (str): Base de datos SQLite compartida.
+            limites (dict): Endpoint -> (rpm, tpm, max_concurrencia). Por defecto,
+                los de la configuración.
+            caducidad_s (float): Segundos tras los que se descarta una reserva
+                que no se ha liberado.
+        """
+        self.ruta = ruta
+        self.caducidad_s = caducidad_s
+        self.limites = limites or {
+            "chat": (config.OPENAI_RPM_CHAT, config.OPENAI_TPM_CHAT, config.OPENAI_MAX_CONCURRENCIA_CHAT),
+            "audio": (config.OPENAI_RPM_AUDIO, 0, config.OPENAI_MAX_CONCURRENCIA_AUDIO),
+        }
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS cubos (
+                    nombre TEXT PRIMARY KEY,
+                    disponibles REAL NOT NULL,
+                    actualizado REAL NOT NULL,
+                    bloqueado_hasta REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS en_vuelo (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    endpoint TEXT NOT NULL,
+                    caduca REAL NOT NULL
+                );
+            """)
+
+    def _cubo(self, nombre, capacidad, ahora):
+        fila = self._conexion.execute(
+            "SELECT disponibles, actualizado, bloqueado_hasta FROM cubos WHERE nombre = ?", (nombre,)
+        ).fetchone()
+        if fila is None:
+            return float(capacidad), 0.0
+        disponibles, actualizado, bloqueado_hasta = fila
+        return min(capacidad, disponibles + (ahora - actualizado) * capacidad / 60.0), bloqueado_hasta
+
+    def reservar(self, endpoint, tokens=0):
+        """
+        Intenta reservar una petición de 'tokens' tokens en 'endpoint'.
+
+        Returns:
+            tuple: (id de la reserva, 0) si se concede o (None, segundos que
+            conviene esperar antes de volver a intentarlo).
+        """
+        rpm, tpm, max_concurrencia = self.limites[endpoint]
+        with self._lock:
+            ahora = time.time()
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                self._conexion.execute("DELETE FROM en_vuelo WHERE caduca < ?", (ahora,))
+                peticiones, bloqueado_hasta = self._cubo(f"{endpoint}:peticiones", rpm, ahora)
+                disponibles_tokens, _ = self._cubo(f"{endpoint}:tokens", tpm, ahora)
+                tokens = min(tokens, tpm)
+                espera = max(0.0, bloqueado_hasta - ahora)
+                if rpm and peticiones < 1:
+                    espera = max(espera, (1 - peticiones) * 60.0 / rpm)
+                if tpm and disponibles_tokens < tokens:
+                    espera = max(espera, (tokens - disponibles_tokens) * 60.0 / tpm)
+                if max_concurrencia:
+                    (en_vuelo,) = self._conexion.execute(
+                        "SELECT COUNT(*) FROM en_vuelo WHERE endpoint = ?", (endpoint,)
+                    ).fetchone()
+                    if en_vuelo >= max_concurrencia:
+                        espera = max(espera, 0.05)
+                if espera > 0:
+                    self._conexion.execute("COMMIT")
+                    return None, espera
+                for nombre, capacidad, restantes in ((f"{endpoint}:peticiones", rpm, peticiones - 1),
+                                                     (f"{endpoint}:tokens", tpm, disponibles_tokens - tokens)):
+                    if capacidad:
+                        self._conexion.execute(
+                            "INSERT INTO cubos (nombre, disponibles, actualizado) VALUES (?, ?, ?) "
+                            "ON CONFLICT(nombre) DO UPDATE SET disponibles = excluded.disponibles, "
+                            "actualizado = excluded.actualizado",
+                            (nombre, restantes, ahora)
+                        )
+                reserva = self._conexion.execute(
+                    "INSERT INTO en_vuelo (endpoint, caduca) VALUES (?, ?)", (endpoint, ahora + self.caducidad_s)
+                ).lastrowid
+                self._conexion.execute("COMMIT")
+            except BaseException:
+                self._conexion.execute("ROLLBACK")
+                raise
+        return reserva, 0
+
+    def liberar(self, reserva):
+        """Libera una reserva concedida por 'reservar'."""
+        with self._lock:
+            self._conexion.execute("DELETE FROM en_vuelo WHERE id = ?", (reserva,))
+
+    def bloquear(self, endpoint, segundos):
+        """Detiene el endpoint en todos los procesos durante 'segundos' (tras un 429)."""
+        hasta = time.time() + segundos
+        rpm = self.limites[endpoint][0]
+        with self._lock:
+            self._conexion.execute(
+                "INSERT INTO cubos (nombre, disponibles, actualizado, bloqueado_hasta) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(nombre) DO UPDATE SET bloqueado_hasta = MAX(bloqueado_hasta, excluded.bloqueado_hasta)",
+                (f"{endpoint}:peticiones", float(rpm), time.time(), hasta)
+            )
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _duracion(valor):
+    """Convierte duraciones como '1s', '6m0s' o '20ms' a segundos."""
+    if not valor:
+        return None
+    unidades = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    partes = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", valor)
+    if not partes:
+        return None
+    return sum(float(numero) * unidades[unidad] for numero, unidad in partes)
+
+def retry_after(cabeceras):
+    """Devuelve la espera (segundos) indicada por 'retry-after-ms' o 'Retry-After'."""
+    if cabeceras is None:
+        return None
+    try:
+        if cabeceras.get("retry-after-ms"):
+            return float(cabeceras["retry-after-ms"]) / 1000
+        if cabeceras.get("retry-after"):
+            return float(cabeceras["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+# Errores transitorios que merecen reintento (además de RateLimitError).
+ERRORES_TRANSITORIOS = (openai.APIConnectionError, openai.InternalServerError)
+
+class MotorAPI:
+    """
+    Motor asíncrono compartido para todas las llamadas a la API de OpenAI.
+
+    Usa un único cliente AsyncOpenAI con un pool de conexiones httpx y un bucle
+    de eventos propio en un hilo de fondo, de modo que el código síncrono puede
+    enviarle corrutinas con 'ejecutar' (no bloquea) o 'esperar' (bloquea).
+    Cada endpoint ('chat', 'audio') tiene sus propios cubos de peticiones y de
+    tokens y su propio límite de concurrencia AIMD. Los reintentos se deciden
+    por tipo de excepción, con backoff exponencial con jitter y respetando
+    'Retry-After'.
+
+    Con 'presupuesto' (PresupuestoGlobal) cada petición reserva además su
+    parte del presupuesto común a todos los procesos que lo comparten.
+
+    Para que una sola petición lenta no marque la duración de todo el trabajo,
+    cuando una tarda más que el percentil 'percentil_cobertura' de las
+    latencias recientes de su endpoint, escalado a su coste, se envía una
+    copia (si hay hueco y cupo sin esperar); se usa la primera respuesta y
+    se cancela la otra.
+    """
+
+    # Fracción máxima de peticiones que pueden duplicarse para cubrir rezagadas
+    MAX_FRACCION_COBERTURAS = 0.1
+
+    def __init__(self, api_key=None, max_reintentos=8, backoff_base=0.5, backoff_max=60.0, presupuesto=None,
+                 percentil_cobertura=None):
+        self.api_key = api_key
+        self.presupuesto = presupuesto
+        self.percentil_cobertura = (config.OPENAI_PERCENTIL_COBERTURA if percentil_cobertura is None
+                                    else percentil_cobertura)
+        self.max_reintentos = max_reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cliente = None
+        self._loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self._loop.run_forever, name="motor-api", daemon=True)
+        self._hilo.start()
+        self.endpoints = self.esperar(self._crear_endpoints())
+
+    async def _crear_endpoints(self):
+        # Las primitivas de asyncio se crean dentro del bucle del motor.
+        return {
+            "chat": Endpoint("chat", config.OPENAI_RPM_CHAT, config.OPENAI_TPM_CHAT,
+                             config.OPENAI_MAX_CONCURRENCIA_CHAT),
+            "audio": Endpoint("audio", config.OPENAI_RPM_AUDIO, 0,
+                              config.OPENAI_MAX_CONCURRENCIA_AUDIO),
+        }
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            maximo = sum(ep.limitador.maximo for ep in self.endpoints.values())
+            self._cliente = AsyncOpenAI(
+                api_key=self.api_key or config.OPENAI_API_KEY,
+                max_retries=0,  # Los reintentos los gestiona el motor
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=maximo, max_keepalive_connections=maximo)
+                )
+            )
+        return self._cliente
+
+    def concurrencia_maxima(self, endpoint):
+        """Máximo de peticiones simultáneas que el motor permitirá en 'endpoint'."""
+        return self.endpoints[endpoint].limitador.maximo
+
+    def concurrencia_actual(self, endpoint):
+        """Límite AIMD actual de peticiones simultáneas en 'endpoint'."""
+        return self.endpoints[endpoint].limitador.limite
+
+    def ajustar_concurrencia(self, endpoint, limite):
+        """Fija el límite de concurrencia actual de 'endpoint' (ver LimitadorAIMD.fijar)."""
+        self._loop.call_soon_threadsafe(self.endpoints[endpoint].limitador.fijar, limite)
+
+    def ejecutar(self, corrutina):
+        """Planifica una corrutina en el bucle del motor y devuelve un concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(corrutina, self._loop)
+
+    def esperar(self, corrutina):
+        """Ejecuta una corrutina en el bucle del motor y espera su resultado."""
+        return self.ejecutar(corrutina).result()
+
+    async def _reservar_global(self, endpoint, tokens):
+        """Espera hasta obtener una reserva del presupuesto global (o None si no hay)."""
+        if self.presupuesto is None:
+            return None
+        while True:
+            reserva, espera = await asyncio.to_thread(self.presupuesto.reservar, endpoint, tokens)
+            if reserva is not None:
+                return reserva
+            await asyncio.sleep(espera)
+
+    def _backoff(self, intento):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** intento)))
+
+    async def _reservar_cobertura(self, ep, tokens):
+        """
+        Reserva sin esperar lo necesario para enviar la copia de una petición.
+
+        Returns:
+            tuple: (reservada, reserva del presupuesto global o None).
+        """
+        if not ep.reservar_cobertura(tokens, self.MAX_FRACCION_COBERTURAS):
+            return False, None
+        if self.presupuesto is None:
+            return True, None
+        reserva, _ = await asyncio.to_thread(self.presupuesto.reservar, ep.nombre, tokens)
+        if reserva is None:
+            await ep.limitador.liberar()
+            return False, None
+        return True, reserva
+
+    async def _llamar_cubierta(self, ep, llamada, tokens, coste):
+        """
+        Ejecuta 'llamada(cliente)' y, si tarda más que el umbral de cobertura
+        del endpoint para su 'coste', envía una copia. Devuelve la primera
+        respuesta correcta y cancela la otra petición; si las dos fallan,
+        lanza el primer error.
+        """
+        principal = asyncio.ensure_future(llamada(self.cliente))
+        inicios = {principal: time.perf_counter()}
+        pendientes = {principal}
+        umbral = ep.umbral_cobertura(self.percentil_cobertura, coste)
+        reservada, reserva = False, None
+        error = None
+        try:
+            while pendientes:
+                terminadas, pendientes = await asyncio.wait(pendientes, timeout=umbral,
+                                                            return_when=asyncio.FIRST_COMPLETED)
+                for tarea in terminadas:
+                    if tarea.exception() is None:
+                        ep.anotar_latencia(time.perf_counter() - inicios[tarea], coste)
+                        if reservada:
+                            obtener_metricas().incrementar(
+                                "coberturas", endpoint=ep.nombre,
+                                resultado="ganada" if tarea is not principal else "perdida"
+                            )
+                        return tarea.result()
+                    error = error or tarea.exception()
+                if not terminadas:
+                    # La petición supera el umbral: se envía una copia, solo una vez
+                    umbral = None
+                    reservada, reserva = await self._reservar_cobertura(ep, tokens)
+                    if reservada:
+                        copia = asyncio.ensure_future(llamada(self.cliente))
+                        inicios[copia] = time.perf_counter()
+                        pendientes.add(copia)
+            raise error
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
+            if reservada:
+                if reserva is not None:
+                    await asyncio.to_thread(self.presupuesto.liberar, reserva)
+                await ep.limitador.liberar()
+
+    async def llamar(self, endpoint, llamada, tokens=0, prioridad=None):
+        """
+        Ejecuta 'llamada(cliente)' (que debe devolver una respuesta cruda,
+        'with_raw_response') respetando los límites del endpoint, reintentando
+        los errores transitorios y cubriendo las peticiones rezagadas.
+
+        Args:
+            prioridad (float): Coste esperado de la petición. Entre las que
+                esperan hueco entra antes la más costosa (por defecto, 'tokens').
+
+        Returns:
+            El objeto de respuesta ya parseado.
+        """
+        ep = self.endpoints[endpoint]
+        metricas = obtener_metricas()
+        coste = tokens if prioridad is None else prioridad
+        intento = 0
+        while True:
+            espera_limites = time.perf_counter()
+            # Primero el turno por prioridad y después los cubos: si los cubos se
+            # tomaran antes, entraría la petición que llegó primero y no la más costosa
+            await ep.limitador.adquirir(coste)
+            ep.llamadas += 1
+            exito = frenado = False
+            reserva = None
+            try:
+                await ep.peticiones.consumir(1)
+                await ep.tokens.consumir(tokens)
+                reserva = await self._reservar_global(endpoint, tokens)
+                metricas.observar("espera_limites_segundos", time.perf_counter() - espera_limites,
+                                  endpoint=endpoint)
+                inicio = time.perf_counter()
+                crudo = await self._llamar_cubierta(ep, llamada, tokens, coste)
+                latencia = time.perf_counter() - inicio
+                metricas.observar("latencia_peticion_segundos", latencia, endpoint=endpoint)
+                ep.observaciones.append((time.time(), coste, latencia, False))
+                ep.actualizar_desde_cabeceras(crudo.headers)
+                exito = True
+                respuesta = crudo.parse()
+                metricas.incrementar("peticiones", endpoint=endpoint, resultado="ok")
+                uso = getattr(respuesta, "usage", None)
+                if uso is not None:
+                    metricas.incrementar("tokens_prompt", uso.prompt_tokens or 0, endpoint=endpoint)
+                    metricas.incrementar("tokens_completion", uso.completion_tokens or 0, endpoint=endpoint)
+                return respuesta
+            except openai.RateLimitError as e:
+                if e.code == "insufficient_quota" or intento >= self.max_reintentos:
+                    raise
+                frenado = True
+                ep.observaciones.append((time.time(), coste, None, True))
+                espera = retry_after(e.response.headers) or self._backoff(intento)
+                ep.bloquear(espera)
+                if self.presupuesto is not None:
+                    await asyncio.to_thread(self.presupuesto.bloquear, endpoint, espera)
+                error = e
+            except ERRORES_TRANSITORIOS as e:
+                if intento >= self.max_reintentos:
+                    raise
+                espera = retry_after(getattr(getattr(e, "response", None), "headers", None)) \
+                    or self._backoff(intento)
+                error = e
+            finally:
+                if reserva is not None:
+                    await asyncio.to_thread(self.presupuesto.liberar, reserva)
+                await ep.limitador.liberar(exito=exito, frenado=frenado)
+            metricas.incrementar("peticiones", endpoint=endpoint, resultado=type(error).__name__)
+            metricas.incrementar("reintentos", endpoint=endpoint, error=type(error).__name__)
+            metricas.incrementar("espera_backoff_segundos", espera, endpoint=endpoint)
+            print(f"[WARNING] {type(error).__name__} en '{endpoint}': {error}. "
+                  f"Reintentando en {espera:.2f} segundos...")
+            await asyncio.sleep(espera)
+            intento += 1
+
+    async def chat(self, tokens_estimados=0, **kwargs):
+        """Crea una chat completion con los límites del endpoint 'chat'."""
+        return await self.llamar(
+            "chat",
+            lambda cliente: cliente.chat.completions.with_raw_response.create(**kwargs),
+            tokens=tokens_estimados
+        )
+
+    async def transcribir(self, prioridad=0, **kwargs):
+        """
+        Crea una transcripción con los límites del endpoint 'audio'. La
+        'prioridad' es el coste esperado (p. ej. el tamaño del audio).
+        """
+        return await self.llamar(
+            "audio",
+            lambda cliente: cliente.audio.transcriptions.with_raw_response.create(**kwargs),
+            prioridad=prioridad
+        )
+
+_motor = None
+_motor_lock = threading.Lock()
+
+def obtener_motor():
+    """Devuelve el motor compartido, creándolo la primera vez."""
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            # Con una base de presupuesto configurada, el límite de la API se comparte entre procesos
+            presupuesto = PresupuestoGlobal(config.PRESUPUESTO_GLOBAL_DB) if config.PRESUPUESTO_GLOBAL_DB else None
+            _motor = MotorAPI(presupuesto=presupuesto)
+        return _motor
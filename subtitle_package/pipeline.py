@@ -0,0 +1,409 @@
+import time
+import queue
+import bisect
+import threading
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
+from tqdm import tqdm
+from subtitle_package.cues import Cue, abrir_escritor, ms_a_tiempo
+from subtitle_package.tokens import contar_tokens
+from subtitle_package.transcription import split_audio, transcribir_en_orden
+from subtitle_package.reflow import ConfigReflow, reflow
+from subtitle_package.metrics import obtener_metricas
+
+# Marca de fin de stream entre etapas
+FIN = object()
+
+# En directo, segundos sin subtítulos nuevos tras los que el reflow entrega el que retiene
+ESPERA_VACIADO_EN_VIVO_S = 0.5
+
+class PipelineCancelado(Exception):
+    """Otra etapa del pipeline ha fallado y las demás deben detenerse."""
+
+class Pipeline:
+    """
+    Pipeline en memoria: transcripción -> traducción -> reflow de los subtítulos.
+
+    Cada etapa corre en su propio hilo y se comunica con la siguiente mediante
+    colas acotadas de objetos Cue, de modo que la traducción de un subtítulo
+    empieza en cuanto él y su ventana de contexto ('num_contextos_siguientes'
+    subtítulos posteriores del traductor) están transcritos, sin esperar al
+    final del audio. Solo se escribe a disco si se indican 'srt_original' o
+    'srt_traducido' (SRT o, con extensión .vtt, WebVTT).
+
+    Con varios idiomas de destino la transcripción se hace una sola vez y
+    cada subtítulo se reparte a una cadena traducción -> reflow por idioma;
+    todas avanzan a la vez y comparten el motor de la API.
+
+    En directo ('en_vivo') la entrada puede ser un archivo que sigue
+    creciendo, una tubería o la entrada estándar: cada ventana de audio se
+    transcribe en cuanto se llena, los lotes de traducción no esperan a
+    llenarse, cada subtítulo terminado se añade al archivo de inmediato y se
+    mide su latencia de extremo a extremo.
+    """
+
+    def __init__(self, traductor, chunk_length_ms=60000, solape_ms=0, config_reflow=None, max_cola=64,
+                 srt_original=None, srt_traducido=None, registro_fragmentos=None, backend_transcripcion=None,
+                 en_vivo=False, cache_transcripciones=None):
+        """
+        Args:
+            traductor (SRTTranslator | dict): Traductor (ver 'crear_traductor') o
+                diccionario idioma -> traductor (ver 'crear_traductores'). Sus funciones
+                de traducción, caché, lotes y número de hilos se usan tal cual.
+            chunk_length_ms (int): Duración objetivo de los fragmentos de audio.
+            solape_ms (int): Solape entre fragmentos de audio consecutivos.
+            config_reflow (ConfigReflow): Límites de líneas, duración y velocidad de
+                lectura que se aplican a los subtítulos traducidos.
+            max_cola (int): Capacidad de las colas entre etapas.
+            srt_original (str): Si se indica, ruta donde escribir el SRT transcrito.
+            srt_traducido (str | dict): Si se indica, ruta donde escribir el SRT
+                traducido (o diccionario idioma -> ruta con varios idiomas).
+            registro_fragmentos (RegistroFragmentos): Registro para reanudar la
+                transcripción de una ejecución interrumpida fragmento a fragmento.
+            backend_transcripcion (BackendTranscripcion): Backend de transcripción
+                (por defecto, la API de OpenAI).
+            en_vivo (bool): Modo en directo (ver la descripción de la clase).
+            cache_transcripciones (CacheTranscripcionesPCM): Caché de fragmentos ya
+                transcritos, indexada por los bytes exactos de su audio.
+        """
+        self.multiidioma = isinstance(traductor, dict)
+        self.traductores = traductor if self.multiidioma else {traductor.idioma_destino: traductor}
+        self.chunk_length_ms = chunk_length_ms
+        self.solape_ms = solape_ms
+        self.config_reflow = config_reflow or ConfigReflow()
+        self.max_cola = max_cola
+        self.srt_original = srt_original
+        self.srt_traducido = srt_traducido
+        if srt_traducido is None or isinstance(srt_traducido, dict):
+            self.rutas_traducidas = srt_traducido or {}
+        else:
+            self.rutas_traducidas = {idioma: srt_traducido for idioma in self.traductores}
+        self.registro_fragmentos = registro_fragmentos
+        self.backend_transcripcion = backend_transcripcion
+        self.en_vivo = en_vivo
+        self.cache_transcripciones = cache_transcripciones
+
+        self.originales = []
+        self.latencias = {}  # Idioma -> lista de (subtítulo, segundos) en directo
+        self._lecturas = []  # (fin del fragmento en ms, instante en que se leyó)
+        self._cancelado = threading.Event()
+        self._errores = []
+        self._traducidos = {}
+
+    def ejecutar(self, media_path):
+        """
+        Transcribe y traduce el audio de 'media_path'.
+
+        Returns:
+            tuple: (subtítulos originales, subtítulos traducidos), listas de Cue
+            (los traducidos, un diccionario idioma -> lista con varios idiomas).
+        """
+        return self._ejecutar(self._transcribir, media_path)
+
+    def traducir_cues(self, cues):
+        """
+        Traduce subtítulos ya transcritos (cualquier iterable de Cue).
+
+        Returns:
+            tuple: (subtítulos originales, subtítulos traducidos), como en 'ejecutar'.
+        """
+        return self._ejecutar(self._alimentar, cues)
+
+    # --- Infraestructura ---
+
+    def _ejecutar(self, productor, fuente):
+        self.originales = []
+        self._cancelado.clear()
+        self._errores = []
+        self._traducidos = {}
+        self.latencias = {idioma: [] for idioma in self.traductores}
+        self._lecturas = []
+
+        cola_cues = queue.Queue(self.max_cola)
+        colas_idioma = {idioma: queue.Queue(self.max_cola) for idioma in self.traductores}
+        hilos = [
+            self._hilo("transcripcion" if productor == self._transcribir else "lectura", productor, fuente,
+                       cola_cues),
+            self._hilo("reparto", self._repartir, cola_cues, colas_idioma, perfilar=True),
+        ]
+        for idioma, cola in colas_idioma.items():
+            cola_futures = queue.Queue(self.max_cola)
+            cola_traducidos = queue.Queue(self.max_cola)
+            hilos += [
+                self._hilo(f"traduccion[{idioma}]", partial(self._traducir, idioma), cola, cola_futures),
+                self._hilo(f"orden[{idioma}]", partial(self._ordenar, idioma), cola_futures, cola_traducidos),
+                self._hilo(f"reflow[{idioma}]", partial(self._reflow_y_escribir, idioma), cola_traducidos, None,
+                           perfilar=True),
+            ]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for hilo in hilos:
+                hilo.join()
+        except BaseException as e:
+            self._cancelado.set()
+            self._errores.append(e)
+            for hilo in hilos:
+                hilo.join()
+        if self._errores:
+            raise self._errores[0]
+        traducidos = {idioma: self._traducidos.get(idioma) for idioma in self.traductores}
+        if self.multiidioma:
+            return self.originales, traducidos
+        return self.originales, next(iter(traducidos.values()))
+
+    def _hilo(self, nombre, funcion, entrada, salida, perfilar=False):
+        return threading.Thread(target=self._etapa, args=(funcion, entrada, salida, nombre, perfilar),
+                                name=nombre, daemon=True)
+
+    def _etapa(self, funcion, entrada, salida, nombre, perfilar=False):
+        """
+        Ejecuta una etapa, midiendo su tiempo en las métricas, y pase lo que
+        pase avisa a la siguiente (o a todas, si 'salida' es un diccionario de colas).
+        'perfilar' marca las etapas CPU intensivas para el perfil opcional.
+        """
+        try:
+            with obtener_metricas().etapa(nombre, perfilar=perfilar):
+                funcion(entrada, salida)
+        except PipelineCancelado:
+            return
+        except BaseException as e:
+            self._errores.append(e)
+            self._cancelado.set()
+            return
+        for cola in salida.values() if isinstance(salida, dict) else [salida]:
+            if cola is not None:
+                self._poner(cola, FIN)
+
+    def _poner(self, cola, elemento):
+        while True:
+            if self._cancelado.is_set():
+                raise PipelineCancelado()
+            try:
+                cola.put(elemento, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _tomar(self, cola):
+        while True:
+            if self._cancelado.is_set():
+                raise PipelineCancelado()
+            try:
+                return cola.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _registrar_lecturas(self, fragmentos):
+        for fragmento in fragmentos:
+            fin_ms = (fragmento.offset + len(fragmento.muestras)) * 1000 // fragmento.sample_rate
+            self._lecturas.append((fin_ms, time.monotonic()))
+            yield fragmento
+
+    def _latencia(self, cue):
+        """
+        Segundos entre que se oyó el inicio de 'cue' y el momento actual. El
+        instante en que llegó esa muestra se estima a partir de cuándo se leyó
+        el fragmento que la contiene, suponiendo una entrada a tiempo real.
+        """
+        posicion = min(bisect.bisect_left(self._lecturas, (cue.inicio_ms,)), len(self._lecturas) - 1)
+        fin_ms, leido = self._lecturas[posicion]
+        return time.monotonic() - (leido - (fin_ms - cue.inicio_ms) / 1000)
+
+    # --- Etapas ---
+
+    def _transcribir(self, media_path, salida):
+        fragmentos = split_audio(media_path, self.chunk_length_ms, num_buffers=1, solape_ms=self.solape_ms,
+                                 en_vivo=self.en_vivo)
+        if self.en_vivo:
+            fragmentos = self._registrar_lecturas(fragmentos)
+        indice = 1
+        for segments in transcribir_en_orden(fragmentos, registro=self.registro_fragmentos,
+                                             backend=self.backend_transcripcion, cache=self.cache_transcripciones):
+            for seg in segments:
+                texto = seg['text'].strip()
+                if texto:
+                    self._poner(salida, Cue.desde_segundos(indice, seg['start'], seg['end'], texto))
+                    indice += 1
+        resumen = self.backend_transcripcion.resumen() if self.backend_transcripcion is not None else None
+        if resumen:
+            print(f"[INFO] {resumen}")
+        cache = self.cache_transcripciones
+        if cache is not None and cache.aciertos:
+            print(f"[INFO] Fragmentos de audio recuperados de la caché de transcripciones: "
+                  f"{cache.aciertos} de {cache.aciertos + cache.fallos}.")
+
+    def _alimentar(self, cues, salida):
+        for cue in cues:
+            self._poner(salida, cue)
+
+    def _repartir(self, entrada, salidas):
+        """
+        Guarda los subtítulos originales (y el SRT original, si se pide) y
+        reparte cada uno a la cadena de traducción de cada idioma.
+        """
+        escritor = abrir_escritor(self.srt_original, inmediato=self.en_vivo) if self.srt_original else None
+        try:
+            while (cue := self._tomar(entrada)) is not FIN:
+                self.originales.append(cue)
+                if escritor:
+                    escritor.escribir(cue)
+                for cola in salidas.values():
+                    self._poner(cola, cue)
+        finally:
+            if escritor:
+                escritor.cerrar()
+                print(f"[INFO] Archivo SRT original guardado en: {self.srt_original}")
+
+    def _traducir(self, idioma, entrada, salida):
+        """
+        Recibe los subtítulos originales y programa su traducción en cuanto su
+        contexto siguiente ('num_contextos_siguientes' subtítulos) es definitivo. Envía a 'salida' pares
+        (índices, Future); el Future devuelve índice -> Cue traducido. Un lote no
+        es necesariamente consecutivo, así que los pares no llegan en orden.
+        En modo incremental, los subtítulos cuya ventana de contexto no cambió
+        desde la ejecución anterior reutilizan su traducción sin pedirla.
+        """
+        t = self.traductores[idioma]
+        t.bloques = []
+        t.total_bloques = 0
+        if t.incremental:
+            t.preparar_anteriores()
+        reutilizados = {}
+        retemporizados = 0
+        lotes = {}  # Nivel del enrutador -> [índices del lote en curso, tokens]
+        siguiente = 0
+
+        def enviar_lote(nivel=None):
+            """Envía el lote en curso de 'nivel' o, si no se indica, los de todos los niveles."""
+            for n in [nivel] if nivel is not None else list(lotes):
+                lote, _ = lotes.pop(n, ([], 0))
+                if lote:
+                    self._poner(salida, (lote, executor.submit(t.procesar_lote_con_fallback, lote)))
+
+        def preparar(i):
+            nonlocal retemporizados
+            # Sin lotes, la propia función de traducción ya consulta la caché
+            resuelto = t.resolver_local(i)
+            if resuelto is None and t.translate_batch_func is not None and not t.bloques[i].texto:
+                resuelto = t.bloques[i]  # Igual que en 'crear_lotes', sin texto no se pide
+            if resuelto is None and t.incremental:
+                resuelto = t.traduccion_anterior(i)
+                if resuelto is not None:
+                    reutilizados[i] = resuelto
+                    retemporizados += t.retemporizado(i)
+            if resuelto is None and t.translate_batch_func is not None:
+                resuelto = t.traduccion_en_cache(i)
+            if resuelto is not None:
+                future = Future()
+                future.set_result({i: resuelto})
+                self._poner(salida, ([i], future))
+            elif t.translate_batch_func is not None:
+                # Como en 'crear_lotes': los bloques resueltos no cortan el lote y
+                # cada nivel tiene su propio lote en curso (cada lote va a un solo modelo)
+                nivel = t.nivel_bloque(i)
+                tokens = contar_tokens(t.obtener_texto_bloque(t.bloques[i]))
+                if nivel in lotes and lotes[nivel][1] + tokens > t.max_tokens_lote:
+                    enviar_lote(nivel)
+                lote = lotes.setdefault(nivel, [[], 0])
+                lote[0].append(i)
+                lote[1] += tokens
+            else:
+                self._poner(salida, ([i], executor.submit(lambda: {i: t.procesar_bloque(i)})))
+
+        with ThreadPoolExecutor(max_workers=t.max_workers) as executor:
+            while True:
+                try:
+                    cue = entrada.get_nowait()
+                except queue.Empty:
+                    # No hay más subtítulos por ahora. En directo manda la latencia y se
+                    # envían los lotes a medio llenar; si no, se espera a llenarlos: con
+                    # el enrutador hay un lote en curso por nivel y enviarlos en cada pausa
+                    # multiplicaría las peticiones, y con varios idiomas así todos cortan
+                    # los lotes por el mismo sitio y pueden compartir peticiones.
+                    if self.en_vivo:
+                        enviar_lote()
+                    cue = self._tomar(entrada)
+                if cue is FIN:
+                    break
+                t.bloques.append(cue)
+                t.total_bloques += 1
+                while siguiente + t.num_contextos_siguientes < t.total_bloques:
+                    preparar(siguiente)
+                    siguiente += 1
+            while siguiente < t.total_bloques:
+                preparar(siguiente)
+                siguiente += 1
+            enviar_lote()
+        t.informar_resumen()
+        if t.ventanas_anteriores:
+            t.informar_reutilizados(reutilizados, retemporizados)
+
+    def _ordenar(self, idioma, entrada, salida):
+        """Espera cada traducción y emite los subtítulos traducidos en orden."""
+        bloques = self.traductores[idioma].bloques
+        pendientes = {}  # Índice -> (índices del lote, Future)
+        resultados = {}  # Future -> índice -> Cue traducido
+        siguiente = 0
+        while (elemento := self._tomar(entrada)) is not FIN:
+            for i in elemento[0]:
+                pendientes[i] = elemento
+            while siguiente in pendientes:
+                indices, future = pendientes.pop(siguiente)
+                if future not in resultados:
+                    try:
+                        resultados[future] = future.result()
+                    except Exception as e:
+                        print(f"[ERROR] Fallo en los bloques {indices[0]+1}-{indices[-1]+1} ({idioma}): {e}")
+                        resultados[future] = {}
+                self._poner(salida, resultados[future].get(siguiente, bloques[siguiente]))
+                if siguiente == indices[-1]:
+                    del resultados[future]
+                siguiente += 1
+
+    def _recibir(self, entrada, pbar, recibidos=None):
+        while True:
+            try:
+                cue = entrada.get(timeout=ESPERA_VACIADO_EN_VIVO_S) if self.en_vivo else self._tomar(entrada)
+            except queue.Empty:
+                # Pausa en directo: el reflow no debe retener el último subtítulo
+                yield None
+                cue = self._tomar(entrada)
+            if cue is FIN:
+                return
+            pbar.update(1)
+            if recibidos is not None:
+                recibidos.append(cue)
+            yield cue
+
+    def _reflow_y_escribir(self, idioma, entrada, salida):
+        """
+        Aplica el reflow a los subtítulos traducidos según llegan y escribe el
+        SRT. En directo informa de la latencia de cada subtítulo al escribirlo.
+        """
+        traducidos = []
+        recibidos = []  # Antes del reflow, para el modo incremental
+        ruta = self.rutas_traducidas.get(idioma)
+        escritor = abrir_escritor(ruta, inmediato=self.en_vivo) if ruta else None
+        metricas = obtener_metricas()
+        pbar = tqdm(desc=f"Subtítulos traducidos ({idioma})", unit="bloque", disable=self.en_vivo)
+        try:
+            for cue in reflow(self._recibir(entrada, pbar, recibidos), self.config_reflow):
+                traducidos.append(cue)
+                if escritor:
+                    escritor.escribir(cue)
+                if self.en_vivo and self._lecturas:
+                    latencia = self._latencia(cue)
+                    self.latencias[idioma].append((cue, latencia))
+                    metricas.observar("latencia_subtitulo_segundos", latencia, idioma=idioma)
+                    print(f"[INFO] [{idioma}] {cue.indice} {ms_a_tiempo(cue.inicio_ms)} "
+                          f"escrito con {latencia:.1f} s de retraso: {cue.texto[:60]!r}")
+        finally:
+            pbar.close()
+            if escritor:
+                escritor.cerrar()
+                print(f"[INFO] Archivo traducido guardado en: {ruta}")
+        t = self.traductores[idioma]
+        if t.incremental and t.srt_traducido_path:
+            t.guardar_origen(recibidos)
+        self._traducidos[idioma] = traducidos
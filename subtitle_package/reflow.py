@@ -0,0 +1,189 @@
+import math
+from dataclasses import dataclass
+from subtitle_package.cues import Cue
+
+@dataclass
+class ConfigReflow:
+    """
+    Límites de legibilidad de los subtítulos.
+
+    Attributes:
+        max_caracteres_linea (int): Caracteres máximos por línea.
+        max_lineas (int): Líneas máximas por subtítulo.
+        max_duracion_ms (int): Duración máxima de un subtítulo.
+        min_duracion_ms (int): Por debajo de esta duración se intenta unir con el siguiente.
+        max_cps (float): Velocidad de lectura máxima (caracteres por segundo).
+        max_hueco_fusion_ms (int): Hueco máximo entre dos subtítulos para unirlos.
+        separacion_min_ms (int): Separación mínima que se respeta al alargar un subtítulo.
+    """
+    max_caracteres_linea: int = 42
+    max_lineas: int = 2
+    max_duracion_ms: int = 7000
+    min_duracion_ms: int = 1000
+    max_cps: float = 17.0
+    max_hueco_fusion_ms: int = 500
+    separacion_min_ms: int = 80
+
+def _lineas_greedy(palabras, ancho):
+    """Reparte las palabras en líneas de como mucho 'ancho' caracteres (llenado voraz)."""
+    lineas = []
+    actual = []
+    longitud = 0
+    for palabra in palabras:
+        extra = len(palabra) + (1 if actual else 0)
+        if actual and longitud + extra > ancho:
+            lineas.append(actual)
+            actual = [palabra]
+            longitud = len(palabra)
+        else:
+            actual.append(palabra)
+            longitud += extra
+    if actual:
+        lineas.append(actual)
+    return lineas
+
+def envolver(texto, config):
+    """
+    Parte el texto en líneas equilibradas de como mucho 'max_caracteres_linea'
+    caracteres y las une con saltos de línea.
+    """
+    palabras = texto.split()
+    lineas = _lineas_greedy(palabras, config.max_caracteres_linea)
+    if len(lineas) > 1:
+        # Se reparte con un ancho objetivo menor para que las líneas queden parejas
+        objetivo = math.ceil(len(" ".join(palabras)) / len(lineas))
+        equilibradas = _lineas_greedy(palabras, objetivo)
+        while len(equilibradas) > len(lineas):
+            objetivo += 1
+            equilibradas = _lineas_greedy(palabras, objetivo)
+        lineas = equilibradas
+    return "\n".join(" ".join(linea) for linea in lineas)
+
+def _repartir_palabras(palabras, partes):
+    """Divide las palabras en 'partes' grupos consecutivos de longitud parecida."""
+    total = sum(len(p) + 1 for p in palabras)
+    grupos = []
+    actual = []
+    acumulado = 0
+    for i, palabra in enumerate(palabras):
+        actual.append(palabra)
+        acumulado += len(palabra) + 1
+        restantes = len(palabras) - i - 1
+        pendientes = partes - len(grupos) - 1
+        if pendientes and (acumulado >= total * (len(grupos) + 1) / partes or restantes == pendientes):
+            grupos.append(actual)
+            actual = []
+    if actual:
+        grupos.append(actual)
+    return grupos
+
+def dividir(cue, config):
+    """
+    Divide un subtítulo en las piezas necesarias para respetar el número de
+    líneas, los caracteres por línea y la duración máxima. El tiempo se reparte
+    en proporción a la longitud del texto de cada pieza.
+    """
+    palabras = cue.texto.split()
+    if not palabras:
+        return [cue]
+    lineas = _lineas_greedy(palabras, config.max_caracteres_linea)
+    duracion = cue.fin_ms - cue.inicio_ms
+    partes = max(math.ceil(len(lineas) / config.max_lineas),
+                 math.ceil(duracion / config.max_duracion_ms) if config.max_duracion_ms else 1)
+    if partes <= 1:
+        return [cue]
+
+    if len(lineas) >= partes:
+        # Se agrupan líneas completas: cada pieza cabe en pantalla
+        grupos = [sum(lineas[len(lineas) * j // partes:len(lineas) * (j + 1) // partes], [])
+                  for j in range(partes)]
+    else:
+        grupos = _repartir_palabras(palabras, min(partes, len(palabras)))
+
+    textos = [" ".join(grupo) for grupo in grupos]
+    total = sum(len(t) for t in textos)
+    piezas = []
+    acumulado = 0
+    inicio = cue.inicio_ms
+    for texto in textos:
+        acumulado += len(texto)
+        fin = cue.inicio_ms + duracion * acumulado // total
+        piezas.append(Cue(cue.indice, inicio, fin, texto))
+        inicio = fin
+    return piezas
+
+def _cabe(texto, config):
+    return len(_lineas_greedy(texto.split(), config.max_caracteres_linea)) <= config.max_lineas
+
+def fusionar(actual, siguiente, config):
+    """
+    Une dos subtítulos consecutivos si alguno es demasiado corto, están
+    próximos y el resultado respeta los límites. Devuelve None si no se unen.
+    """
+    if min(actual.fin_ms - actual.inicio_ms, siguiente.fin_ms - siguiente.inicio_ms) >= config.min_duracion_ms:
+        return None
+    if siguiente.inicio_ms - actual.fin_ms > config.max_hueco_fusion_ms:
+        return None
+    if siguiente.fin_ms - actual.inicio_ms > config.max_duracion_ms:
+        return None
+    texto = f"{actual.texto} {siguiente.texto}".strip()
+    if not _cabe(texto, config):
+        return None
+    return Cue(actual.indice, actual.inicio_ms, siguiente.fin_ms, texto)
+
+def _finalizar(cue, indice, inicio_siguiente, config):
+    """
+    Renumera, alarga el subtítulo si se lee demasiado rápido (sin pisar el
+    siguiente) y parte el texto en líneas.
+    """
+    fin = cue.fin_ms
+    if config.max_cps and cue.texto:
+        necesario = cue.inicio_ms + math.ceil(len(cue.texto) * 1000 / config.max_cps)
+        limite = cue.inicio_ms + config.max_duracion_ms
+        if inicio_siguiente is not None:
+            limite = min(limite, inicio_siguiente - config.separacion_min_ms)
+        fin = max(fin, min(necesario, limite))
+    return Cue(indice, cue.inicio_ms, fin, envolver(cue.texto, config))
+
+def reflow(cues, config=None):
+    """
+    Motor de reflow en streaming: divide y une subtítulos según caracteres por
+    línea, número de líneas, duración máxima y velocidad de lectura, reparte
+    los tiempos en proporción al texto y renumera, todo en una sola pasada.
+
+    Es un generador O(n) que solo retiene un subtítulo de anticipación, por lo
+    que puede encadenarse dentro del pipeline sobre archivos de cualquier duración.
+    Los subtítulos deben llegar ordenados por tiempo de inicio.
+
+    Un None en la entrada indica que de momento no llegan más subtítulos (en
+    directo): el subtítulo retenido se entrega ya, sin alargarlo ni fusionarlo
+    con el siguiente, que todavía no se conoce.
+
+    Args:
+        cues (iterable): Subtítulos de entrada (Cue o None).
+        config (ConfigReflow): Límites a aplicar (por defecto, ConfigReflow()).
+
+    Yields:
+        Cue: Subtítulos resultantes, numerados desde 1, con el texto en líneas.
+    """
+    config = config or ConfigReflow()
+    pendiente = None
+    indice = 1
+    for cue in cues:
+        if cue is None:
+            if pendiente is not None:
+                yield _finalizar(pendiente, indice, pendiente.fin_ms + config.separacion_min_ms, config)
+                indice += 1
+                pendiente = None
+            continue
+        for pieza in dividir(cue, config):
+            if pendiente is not None:
+                unido = fusionar(pendiente, pieza, config)
+                if unido is not None:
+                    pendiente = unido
+                    continue
+                yield _finalizar(pendiente, indice, pieza.inicio_ms, config)
+                indice += 1
+            pendiente = pieza
+    if pendiente is not None:
+        yield _finalizar(pendiente, indice, None, config)
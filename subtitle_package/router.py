@@ -0,0 +1,200 @@
+import re
+import threading
+from subtitle_package.metrics import obtener_metricas
+
+# Niveles de la cascada, del más barato al más caro
+NIVEL_LOCAL = "local"        # Sin llamar a la API
+NIVEL_RAPIDO = "rapido"      # Modelo barato y rápido
+NIVEL_COMPLETO = "completo"  # Modelo principal
+NIVELES = (NIVEL_LOCAL, NIVEL_RAPIDO, NIVEL_COMPLETO)
+
+# Frases muy frecuentes en los subtítulos (en español, el idioma de origen
+# habitual) con su traducción. Clave: la frase en minúsculas, sin signos de
+# apertura ni puntuación final.
+TABLA_FRASES = {
+    "sí": {"en": "Yes", "fr": "Oui", "de": "Ja", "it": "Sì", "pt": "Sim"},
+    "no": {"en": "No", "fr": "Non", "de": "Nein", "it": "No", "pt": "Não"},
+    "gracias": {"en": "Thank you", "fr": "Merci", "de": "Danke", "it": "Grazie", "pt": "Obrigado"},
+    "muchas gracias": {"en": "Thank you very much", "fr": "Merci beaucoup", "de": "Vielen Dank",
+                       "it": "Grazie mille", "pt": "Muito obrigado"},
+    "hola": {"en": "Hi", "fr": "Salut", "de": "Hallo", "it": "Ciao", "pt": "Olá"},
+    "adiós": {"en": "Goodbye", "fr": "Au revoir", "de": "Auf Wiedersehen", "it": "Arrivederci", "pt": "Adeus"},
+    "vale": {"en": "Okay", "fr": "D'accord", "de": "Okay", "it": "Va bene", "pt": "Está bem"},
+    "de acuerdo": {"en": "All right", "fr": "D'accord", "de": "Einverstanden", "it": "D'accordo",
+                   "pt": "De acordo"},
+    "claro": {"en": "Sure", "fr": "Bien sûr", "de": "Klar", "it": "Certo", "pt": "Claro"},
+    "perdón": {"en": "Sorry", "fr": "Pardon", "de": "Entschuldigung", "it": "Scusa", "pt": "Desculpa"},
+    "lo siento": {"en": "I'm sorry", "fr": "Je suis désolé", "de": "Es tut mir leid", "it": "Mi dispiace",
+                  "pt": "Sinto muito"},
+    "por favor": {"en": "Please", "fr": "S'il vous plaît", "de": "Bitte", "it": "Per favore", "pt": "Por favor"},
+    "buenos días": {"en": "Good morning", "fr": "Bonjour", "de": "Guten Morgen", "it": "Buongiorno",
+                    "pt": "Bom dia"},
+    "buenas noches": {"en": "Good night", "fr": "Bonne nuit", "de": "Gute Nacht", "it": "Buona notte",
+                      "pt": "Boa noite"},
+}
+
+# Etiquetas de sonido habituales ("[Música]", "(risas)"...)
+TABLA_ETIQUETAS = {
+    "música": {"en": "Music", "fr": "Musique", "de": "Musik", "it": "Musica", "pt": "Música"},
+    "risas": {"en": "Laughter", "fr": "Rires", "de": "Lachen", "it": "Risate", "pt": "Risos"},
+    "aplausos": {"en": "Applause", "fr": "Applaudissements", "de": "Applaus", "it": "Applausi",
+                 "pt": "Aplausos"},
+    "silencio": {"en": "Silence", "fr": "Silence", "de": "Stille", "it": "Silenzio", "pt": "Silêncio"},
+    "suspira": {"en": "Sighs", "fr": "Soupire", "de": "Seufzt", "it": "Sospira", "pt": "Suspira"},
+    "ruido": {"en": "Noise", "fr": "Bruit", "de": "Lärm", "it": "Rumore", "pt": "Ruído"},
+}
+
+# Palabras funcionales frecuentes por idioma, para reconocer los subtítulos
+# que ya están en el idioma destino
+PALABRAS_FRECUENTES = {
+    "en": {"the", "and", "is", "you", "to", "of", "it", "that", "what", "this", "are", "was", "we", "have",
+           "don't", "not", "my", "your", "be", "for", "with", "do", "know", "i'm", "it's", "he", "she"},
+    "es": {"el", "la", "los", "las", "que", "de", "y", "es", "en", "un", "una", "no", "lo", "por", "con",
+           "para", "pero", "se", "me", "te", "mi", "su", "está", "qué", "yo", "tú", "muy"},
+    "fr": {"le", "la", "les", "et", "est", "un", "une", "de", "je", "tu", "il", "vous", "nous", "pas", "que",
+           "qui", "ce", "c'est", "pour", "dans", "avec", "mais", "mon", "ne", "j'ai", "du", "des"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "ich", "du", "sie", "wir", "ein", "eine", "zu", "mit",
+           "was", "es", "den", "dem", "auf", "für", "aber", "mein", "sind", "hat", "habe", "auch", "wie"},
+    "it": {"il", "lo", "gli", "e", "è", "un", "una", "di", "che", "non", "io", "tu", "lui", "noi", "per",
+           "con", "ma", "sono", "mi", "ti", "questo", "cosa", "della", "del", "ho", "hai", "anche"},
+    "pt": {"o", "os", "as", "e", "é", "um", "uma", "de", "que", "não", "eu", "você", "ele", "nós", "para",
+           "com", "mas", "isso", "meu", "minha", "do", "da", "em", "tem", "está", "muito", "também"},
+}
+
+_ETIQUETA = re.compile(r"^([\[(])\s*([^\[\]()]+?)\s*([\])])$")
+_PALABRA = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+_PUNTUACION_FINAL = re.compile(r"[.!?…]*$")
+# Guion de diálogo al principio del texto o tras un espacio (los subtítulos llegan con
+# sus líneas unidas por espacios): "- Hola. - Adiós." o "-¿Qué? -Nada." Un subtítulo
+# con varios interlocutores empieza por guion y tiene al menos otro.
+_GUION_DIALOGO = re.compile(r"(?:^|\s)[-–—](?=\s|[^\W\d_]|[¿¡])")
+
+def _idioma_base(idioma):
+    return idioma.lower().replace("_", "-").split("-")[0]
+
+def _como_original(traduccion, original):
+    """Aplica a 'traduccion' las mayúsculas del original (todo en mayúsculas o no)."""
+    return traduccion.upper() if original.isupper() and len(original) > 1 else traduccion
+
+def detectar_idioma(texto, min_palabras=3):
+    """
+    Idioma de 'texto' según sus palabras funcionales, o None si el texto es
+    demasiado corto o la detección no es clara.
+    """
+    palabras = _PALABRA.findall(texto.lower())
+    if len(palabras) < min_palabras:
+        return None
+    puntuaciones = sorted(((sum(palabra in frecuentes for palabra in palabras), idioma)
+                           for idioma, frecuentes in PALABRAS_FRECUENTES.items()), reverse=True)
+    (mejor, idioma), (segunda, _) = puntuaciones[0], puntuaciones[1]
+    if mejor >= 2 and mejor >= 0.3 * len(palabras) and mejor >= 2 * segunda:
+        return idioma
+    return None
+
+class EnrutadorTraducciones:
+    """
+    Decide para cada subtítulo el camino más barato que da una buena
+    traducción, en cascada:
+
+    - local: lo que no necesita la API se resuelve aquí. Son los subtítulos
+      sin letras (números, signos, "♪"), las etiquetas de sonido y las frases
+      de la tabla, y los que ya están en el idioma destino.
+    - rapido: los subtítulos normales van al modelo barato.
+    - completo: los difíciles van al modelo principal. Son los largos, los
+      que tienen varios interlocutores y aquellos cuya traducción rápida
+      parece fallida ('dudosa').
+
+    Lleva la cuenta de los subtítulos resueltos en cada nivel (también en las
+    métricas, 'traducciones_por_nivel').
+    """
+
+    def __init__(self, idioma_destino, modelo_rapido, modelo_completo, max_palabras_rapido=16):
+        """
+        Args:
+            idioma_destino (str): Código del idioma destino.
+            modelo_rapido (str): Modelo del nivel rápido. Si está vacío, todo
+                lo que no se resuelve en local va al modelo principal.
+            modelo_completo (str): Modelo principal.
+            max_palabras_rapido (int): Palabras a partir de las cuales un
+                subtítulo se considera largo.
+        """
+        self.idioma_destino = idioma_destino
+        self.idioma = _idioma_base(idioma_destino)
+        self.modelo_rapido = modelo_rapido or modelo_completo
+        self.modelo_completo = modelo_completo
+        self.max_palabras_rapido = max_palabras_rapido
+        self.contadores = dict.fromkeys(NIVELES, 0)
+        self.escalados = 0
+        self._lock = threading.Lock()
+
+    def traduccion_local(self, texto):
+        """Traducción del subtítulo sin llamar a la API, o None si hace falta el modelo."""
+        limpio = texto.strip()
+        if not any(c.isalpha() for c in limpio):
+            return texto
+        etiqueta = _ETIQUETA.match(limpio)
+        if etiqueta:
+            apertura, contenido, cierre = etiqueta.groups()
+            traduccion = TABLA_ETIQUETAS.get(contenido.lower(), {}).get(self.idioma)
+            if traduccion is not None:
+                return f"{apertura}{_como_original(traduccion, contenido)}{cierre}"
+        frase = limpio.lstrip("¿¡").strip()
+        final = _PUNTUACION_FINAL.search(frase).group()
+        frase = frase[:len(frase) - len(final)].strip()
+        traduccion = TABLA_FRASES.get(frase.lower(), {}).get(self.idioma)
+        if traduccion is not None:
+            return _como_original(traduccion, frase) + final
+        if detectar_idioma(limpio) == self.idioma:
+            return texto
+        return None
+
+    def nivel(self, texto):
+        """Nivel de la API ('rapido' o 'completo') al que se envía un subtítulo no resuelto en local."""
+        if self.modelo_rapido == self.modelo_completo:
+            return NIVEL_COMPLETO
+        if len(_PALABRA.findall(texto)) > self.max_palabras_rapido:
+            return NIVEL_COMPLETO
+        guiones = _GUION_DIALOGO.findall(texto.strip())
+        if len(guiones) >= 2 and texto.strip()[0] in "-–—":
+            return NIVEL_COMPLETO
+        return NIVEL_RAPIDO
+
+    def modelo(self, nivel):
+        return self.modelo_rapido if nivel == NIVEL_RAPIDO else self.modelo_completo
+
+    def dudosa(self, original, traduccion):
+        """
+        Indica si una traducción del nivel rápido parece fallida y conviene
+        repetirla con el modelo principal. Eso ocurre si está vacía, si trae
+        restos del prompt, si su longitud no encaja con el original o si lo
+        deja sin traducir.
+        """
+        traduccion = (traduccion or "").strip()
+        original = original.strip()
+        if not traduccion or "===" in traduccion or traduccion.count("\n") > original.count("\n") + 1:
+            return True
+        if sum(c.isalpha() for c in original) < 12:
+            return False
+        if not 0.4 <= len(traduccion) / len(original) <= 2.5:
+            return True
+        return traduccion == original and detectar_idioma(original) != self.idioma
+
+    def contar(self, nivel, cantidad=1):
+        """Anota 'cantidad' subtítulos resueltos en 'nivel'."""
+        with self._lock:
+            self.contadores[nivel] += cantidad
+        obtener_metricas().incrementar("traducciones_por_nivel", cantidad, nivel=nivel, idioma=self.idioma_destino)
+
+    def contar_escalado(self, cantidad=1):
+        """Anota subtítulos que pasaron del nivel rápido al principal (ya contados en este)."""
+        with self._lock:
+            self.escalados += cantidad
+        obtener_metricas().incrementar("traducciones_escaladas", cantidad, idioma=self.idioma_destino)
+
+    def resumen(self):
+        total = sum(self.contadores.values())
+        if not total:
+            return f"Enrutado ({self.idioma_destino}): ningún subtítulo traducido."
+        partes = ", ".join(f"{nivel} {cantidad} ({cantidad / total:.0%})"
+                           for nivel, cantidad in self.contadores.items())
+        return f"Enrutado ({self.idioma_destino}): {partes}; {self.escalados} escalados al modelo principal."
@@ -1,35 +1,34 @@
+import json
+import threading
+from concurrent.futures import Future
 from .SRTTranslator import SRTTranslator
+from .cache import CacheTraducciones
+from .cues import Cue, escribir_srt
+from .router import EnrutadorTraducciones
+from .metrics import obtener_metricas
+
+from . import config
 
 # IMPORTS PARA GPT
-from openai import OpenAI
-from subtitle_package.config import OPENAI_API_KEY
+from .motor import obtener_motor
+from .tokens import contar_tokens
 
-# Instancia del cliente OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def convertir_tiempo(segundos):
-    """
-    Convierte un tiempo en segundos al formato HH:MM:SS,mmm usado en archivos SRT.
-    """
-    horas = int(segundos // 3600)
-    minutos = int((segundos % 3600) // 60)
-    seg = int(segundos % 60)
-    miliseg = int((segundos - int(segundos)) * 1000)
-    return f"{horas:02}:{minutos:02}:{seg:02},{miliseg:03}"
+# Modelo y versión de los prompts de traducción. Forman parte de la clave de
+# la caché: hay que incrementar VERSION_PROMPT al modificar cualquier prompt.
+MODELO_TRADUCCION = config.MODELO_TRADUCCION
+# Modelo barato al que el enrutador envía los subtítulos normales ("" lo desactiva)
+MODELO_TRADUCCION_RAPIDO = config.MODELO_TRADUCCION_RAPIDO
+VERSION_PROMPT = 1
 
 def generar_srt(transcripcion, srt_path):
     """
     Genera un archivo SRT a partir de una transcripción.
     """
     print(f"[INFO] Generando archivo SRT en: {srt_path}")
-    with open(srt_path, "w", encoding="utf-8") as f:
-        for i, segmento in enumerate(transcripcion['segments'], start=1):
-            inicio = convertir_tiempo(segmento['start'])
-            fin = convertir_tiempo(segmento['end'])
-            texto = segmento['text'].strip()
-            f.write(f"{i}\n{inicio} --> {fin}\n{texto}\n\n")
+    escribir_srt((Cue.desde_segundos(None, segmento['start'], segmento['end'], segmento['text'].strip())
+                  for segmento in transcripcion['segments']), srt_path, renumerar=True)
 
-def traducir_texto_gpt(texto, idioma_destino="en", contexto_previo="", contexto_siguiente=""):
+def traducir_texto_gpt(texto, idioma_destino="en", contexto_previo="", contexto_siguiente="", modelo=None):
     """
     Traduce un texto usando GPT (ChatCompletion) incluyendo contexto.
     
@@ -38,6 +37,7 @@ def traducir_texto_gpt(texto, idioma_destino="en", contexto_previo="", contexto_
         idioma_destino (str): Código del idioma destino (ej: "en", "fr", etc.).
         contexto_previo (str): Texto que antecede al texto principal para dar contexto.
         contexto_siguiente (str): Texto que sigue al texto principal para dar contexto.
+        modelo (str): Modelo de GPT (por defecto, MODELO_TRADUCCION).
     
     Returns:
         str: Solo la traducción del "Texto a traducir".
@@ -55,8 +55,11 @@ def traducir_texto_gpt(texto, idioma_destino="en", contexto_previo="", contexto_
         "RESPONDE CON ÚNICAMENTE LA TRADUCCIÓN EXACTA Y CORREGIDA."
     )
 
-    respuesta = client.chat.completions.create(
-        model="gpt-4o",  # O "gpt-4", "gpt-4o", etc.
+    motor = obtener_motor()
+    respuesta = motor.esperar(motor.chat(
+        # Tokens de entrada más una estimación de la respuesta
+        tokens_estimados=contar_tokens(prompt) + 2 * contar_tokens(texto),
+        model=modelo or MODELO_TRADUCCION,  # O "gpt-4", "gpt-4o", etc.
         messages=[
             {
                 "role": "system",
@@ -72,22 +75,268 @@ def traducir_texto_gpt(texto, idioma_destino="en", contexto_previo="", contexto_
             }
         ],
         temperature=0
-    )
+    ))
 
     texto_traducido = respuesta.choices[0].message.content.strip()
     return texto_traducido
 
-def traducir_srt(srt_path, srt_traducido_path, idioma_destino="en", num_contextos=2, max_workers=3):
+def traducir_lote_gpt(textos, idioma_destino="en", contexto_previo="", contexto_siguiente="", modelo=None):
     """
-    Traduce un archivo SRT completo utilizando la clase SRTTranslator.
+    Traduce varios bloques (no necesariamente consecutivos) en una sola petición a GPT.
+
+    Args:
+        textos (dict): Número de bloque -> texto a traducir.
+        idioma_destino (str): Código del idioma destino (ej: "en", "fr", etc.).
+        contexto_previo (str): Texto anterior al primer bloque del lote.
+        contexto_siguiente (str): Texto posterior al último bloque del lote.
+        modelo (str): Modelo de GPT (por defecto, MODELO_TRADUCCION).
+
+    Returns:
+        dict: Número de bloque -> traducción. Solo contiene los bloques que
+        el modelo haya devuelto, por lo que puede no coincidir con 'textos'.
+    """
+    bloques = "\n".join(f"[{numero}] {texto}" for numero, texto in textos.items())
+    prompt = (
+        f"TRADUCE AL IDIOMA '{idioma_destino.upper()}' CADA UNO DE LOS SIGUIENTES BLOQUES DE SUBTÍTULOS. "
+        "UTILIZA EL CONTEXTO PREVIO Y EL CONTEXTO SIGUIENTE PARA MEJORAR LA PRECISIÓN DE LA TRADUCCIÓN, "
+        "Y CORRIGE CUALQUIER ERROR ORTOGRÁFICO. NO UNAS NI DIVIDAS BLOQUES.\n\n"
+        "=== CONTEXTO PREVIO ===\n"
+        f"{contexto_previo}\n\n"
+        "=== BLOQUES A TRADUCIR ===\n"
+        f"{bloques}\n\n"
+        "=== CONTEXTO SIGUIENTE ===\n"
+        f"{contexto_siguiente}\n\n"
+        'RESPONDE ÚNICAMENTE CON UN OBJETO JSON DE LA FORMA {"traducciones": {"<número>": "<traducción>"}} '
+        "CON UNA ENTRADA POR CADA BLOQUE."
+    )
+
+    motor = obtener_motor()
+    respuesta = motor.esperar(motor.chat(
+        tokens_estimados=contar_tokens(prompt) + 2 * contar_tokens(bloques),
+        model=modelo or MODELO_TRADUCCION,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Eres un traductor profesional de subtítulos. Traduce cada bloque por separado, "
+                    "utilizando el contexto proporcionado para obtener la mejor traducción posible. "
+                    "Responde únicamente con el JSON solicitado."
+                )
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        response_format={"type": "json_object"},
+        temperature=0
+    ))
+
+    try:
+        traducciones = json.loads(respuesta.choices[0].message.content).get("traducciones", {})
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    resultado = {}
+    for numero, texto in traducciones.items():
+        if str(numero).isdigit():
+            resultado[int(numero)] = str(texto).strip()
+    return resultado
+
+def traducir_lote_multi_gpt(textos, idiomas, contexto_previo="", contexto_siguiente="", modelo=None):
     """
-    translator = SRTTranslator(
+    Traduce varios bloques (no necesariamente consecutivos) a varios idiomas en una sola
+    petición a GPT.
+
+    Args:
+        textos (dict): Número de bloque -> texto a traducir.
+        idiomas (list): Códigos de los idiomas destino.
+        contexto_previo (str): Texto anterior al primer bloque del lote.
+        contexto_siguiente (str): Texto posterior al último bloque del lote.
+        modelo (str): Modelo de GPT (por defecto, MODELO_TRADUCCION).
+
+    Returns:
+        dict: Idioma -> (número de bloque -> traducción). Como en 'traducir_lote_gpt',
+        solo contiene lo que el modelo haya devuelto.
+    """
+    bloques = "\n".join(f"[{numero}] {texto}" for numero, texto in textos.items())
+    lista_idiomas = ", ".join(f"'{idioma.upper()}'" for idioma in idiomas)
+    prompt = (
+        f"TRADUCE A CADA UNO DE LOS IDIOMAS {lista_idiomas} CADA UNO DE LOS SIGUIENTES BLOQUES DE SUBTÍTULOS. "
+        "UTILIZA EL CONTEXTO PREVIO Y EL CONTEXTO SIGUIENTE PARA MEJORAR LA PRECISIÓN DE LA TRADUCCIÓN, "
+        "Y CORRIGE CUALQUIER ERROR ORTOGRÁFICO. NO UNAS NI DIVIDAS BLOQUES.\n\n"
+        "=== CONTEXTO PREVIO ===\n"
+        f"{contexto_previo}\n\n"
+        "=== BLOQUES A TRADUCIR ===\n"
+        f"{bloques}\n\n"
+        "=== CONTEXTO SIGUIENTE ===\n"
+        f"{contexto_siguiente}\n\n"
+        'RESPONDE ÚNICAMENTE CON UN OBJETO JSON DE LA FORMA '
+        '{"traducciones": {"<idioma>": {"<número>": "<traducción>"}}} '
+        "CON UNA ENTRADA POR CADA IDIOMA Y, DENTRO DE ELLA, UNA POR CADA BLOQUE."
+    )
+
+    motor = obtener_motor()
+    respuesta = motor.esperar(motor.chat(
+        tokens_estimados=contar_tokens(prompt) + 2 * len(idiomas) * contar_tokens(bloques),
+        model=modelo or MODELO_TRADUCCION,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Eres un traductor profesional de subtítulos. Traduce cada bloque por separado "
+                    "a cada idioma, utilizando el contexto proporcionado para obtener la mejor "
+                    "traducción posible. Responde únicamente con el JSON solicitado."
+                )
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        response_format={"type": "json_object"},
+        temperature=0
+    ))
+
+    try:
+        traducciones = json.loads(respuesta.choices[0].message.content).get("traducciones", {})
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    resultado = {}
+    for idioma in idiomas:
+        por_idioma = traducciones.get(idioma) or traducciones.get(idioma.upper()) or {}
+        if not isinstance(por_idioma, dict):
+            continue
+        resultado[idioma] = {int(numero): str(texto).strip()
+                             for numero, texto in por_idioma.items() if str(numero).isdigit()}
+    return resultado
+
+class LotesMultiidioma:
+    """
+    Comparte las peticiones por lotes entre los traductores de varios idiomas.
+
+    Cada idioma corta sus lotes después de su propia caché y su enrutado, así
+    que no siempre coinciden. El primer idioma que pide un lote espera un
+    momento ('espera_s') a que los demás pidan el mismo (mismos textos,
+    contexto y modelo) y lo traduce en una sola petición solo a los idiomas
+    que lo han pedido; si nadie más lo pide, va en una petición normal de un
+    idioma. Así un lote compartido nunca cuesta más que pedirlo por separado.
+    """
+
+    def __init__(self, idiomas, espera_s=0.5):
+        self.idiomas = list(idiomas)
+        self.espera_s = espera_s
+        self._pendientes = {}  # lote -> [Future, idiomas que lo han pedido]
+        self._cambios = threading.Condition()
+
+    def funcion(self, idioma):
+        """Devuelve la función de traducción por lotes ('translate_batch_func') de 'idioma'."""
+        def traducir(textos, idioma_destino=idioma, contexto_previo="", contexto_siguiente="", modelo=None):
+            clave = (tuple(textos.items()), contexto_previo, contexto_siguiente, modelo)
+            with self._cambios:
+                entrada = self._pendientes.get(clave)
+                propia = entrada is None or idioma in entrada[1]
+                if propia:
+                    entrada = [Future(), {idioma}]
+                    self._pendientes[clave] = entrada
+                else:
+                    entrada[1].add(idioma)
+                    self._cambios.notify_all()
+                if propia:
+                    self._cambios.wait_for(lambda: len(entrada[1]) == len(self.idiomas), timeout=self.espera_s)
+                    # Los idiomas que lleguen después piden el lote por su cuenta
+                    if self._pendientes.get(clave) is entrada:
+                        del self._pendientes[clave]
+                    destinos = [i for i in self.idiomas if i in entrada[1]]
+            future = entrada[0]
+            if propia:
+                obtener_metricas().incrementar("lotes_multiidioma", idiomas=len(destinos))
+                try:
+                    if len(destinos) == 1:
+                        future.set_result({idioma: traducir_lote_gpt(textos, idioma, contexto_previo,
+                                                                     contexto_siguiente, modelo)})
+                    else:
+                        future.set_result(traducir_lote_multi_gpt(textos, destinos, contexto_previo,
+                                                                  contexto_siguiente, modelo))
+                except BaseException as e:
+                    future.set_exception(e)
+            return future.result().get(idioma, {})
+        return traducir
+
+def crear_traductor(srt_path=None, srt_traducido_path=None, idioma_destino="en", num_contextos=2,
+                    max_workers=None, por_lotes=False, max_tokens_lote=1000, usar_cache=True,
+                    lotes_compartidos=None, num_contextos_siguientes=None, enrutar=True, incremental=False):
+    """
+    Crea un SRTTranslator configurado para traducir con GPT.
+    Con 'por_lotes' se envían varios bloques por petición, agrupados hasta
+    'max_tokens_lote' tokens. Con 'usar_cache' las traducciones ya hechas se
+    reutilizan desde la caché persistente en lugar de volver a pedirse a la API.
+    Con 'lotes_compartidos' (LotesMultiidioma) cada lote se pide a la vez para
+    todos los idiomas del grupo. 'num_contextos_siguientes' limita el contexto
+    posterior (por ejemplo, a 0 para subtitular en directo). Con 'enrutar' cada
+    subtítulo pasa por el enrutador (ver EnrutadorTraducciones): los triviales
+    se resuelven sin la API, los normales van a MODELO_TRADUCCION_RAPIDO y solo
+    los difíciles a MODELO_TRADUCCION. Con 'incremental', 'run' y el Pipeline
+    solo traducen los bloques que cambiaron desde la ejecución anterior (ver
+    SRTTranslator.reutilizar_anteriores y SRTTranslator.preparar_anteriores).
+    Por defecto se usan tantos hilos como la concurrencia máxima del motor de la
+    API; el motor decide cuántas peticiones hay realmente en vuelo.
+    """
+    if lotes_compartidos is not None:
+        translate_batch_func = lotes_compartidos.funcion(idioma_destino)
+    else:
+        translate_batch_func = traducir_lote_gpt if por_lotes else None
+    return SRTTranslator(
         srt_path=srt_path,
         srt_traducido_path=srt_traducido_path,
         idioma_destino=idioma_destino,
         num_contextos=num_contextos,
-        max_workers=max_workers,
+        max_workers=max_workers or obtener_motor().concurrencia_maxima("chat"),
         # Pasamos la función de traducción
-        translate_func=traducir_texto_gpt
+        translate_func=traducir_texto_gpt,
+        translate_batch_func=translate_batch_func,
+        max_tokens_lote=max_tokens_lote,
+        cache=CacheTraducciones() if usar_cache else None,
+        modelo=MODELO_TRADUCCION,
+        version_prompt=VERSION_PROMPT,
+        num_contextos_siguientes=num_contextos_siguientes,
+        enrutador=EnrutadorTraducciones(idioma_destino, MODELO_TRADUCCION_RAPIDO, MODELO_TRADUCCION)
+        if enrutar else None,
+        incremental=incremental
     )
-    translator.run()
\ No newline at end of file
+
+def crear_traductores(idiomas, idiomas_por_peticion=1, num_contextos=2, max_workers=None, por_lotes=False,
+                      max_tokens_lote=1000, usar_cache=True, num_contextos_siguientes=None, enrutar=True,
+                      incremental=False, rutas=None):
+    """
+    Crea un traductor por idioma (diccionario idioma -> SRTTranslator) para
+    traducir a todos a la vez con el Pipeline. Con 'idiomas_por_peticion' > 1
+    los idiomas se agrupan y cada lote se traduce en una sola petición a los
+    idiomas del grupo que lo piden (implica el modo por lotes; ver LotesMultiidioma).
+    Con 'incremental' y 'rutas' (idioma -> SRT traducido), solo se traducen los
+    subtítulos que cambiaron desde la traducción anterior de cada ruta.
+    """
+    traductores = {}
+    for inicio in range(0, len(idiomas), idiomas_por_peticion):
+        grupo = idiomas[inicio:inicio + idiomas_por_peticion]
+        compartidos = LotesMultiidioma(grupo) if len(grupo) > 1 else None
+        for idioma in grupo:
+            traductores[idioma] = crear_traductor(
+                idioma_destino=idioma, num_contextos=num_contextos, max_workers=max_workers,
+                por_lotes=por_lotes or compartidos is not None, max_tokens_lote=max_tokens_lote,
+                usar_cache=usar_cache, lotes_compartidos=compartidos,
+                num_contextos_siguientes=num_contextos_siguientes, enrutar=enrutar,
+                srt_traducido_path=(rutas or {}).get(idioma), incremental=incremental
+            )
+    return traductores
+
+def traducir_srt(srt_path, srt_traducido_path, idioma_destino="en", num_contextos=2, max_workers=None,
+                 por_lotes=False, max_tokens_lote=1000, usar_cache=True, incremental=False):
+    """
+    Traduce un archivo SRT completo utilizando la clase SRTTranslator
+    (ver 'crear_traductor' para los parámetros). Con 'incremental', tras
+    corregir el SRT original solo se vuelven a traducir los bloques editados
+    y los vecinos cuyo contexto cambió.
+    """
+    translator = crear_traductor(srt_path, srt_traducido_path, idioma_destino, num_contextos,
+                                 max_workers, por_lotes, max_tokens_lote, usar_cache, incremental=incremental)
+    translator.run()
@@ -0,0 +1,25 @@
+_codificadores = {}
+
+def obtener_codificador(modelo="gpt-4o"):
+    """
+    Devuelve (y memoriza) el codificador de tiktoken asociado a un modelo.
+    Si tiktoken no conoce el modelo se usa la codificación 'o200k_base'.
+    """
+    codificador = _codificadores.get(modelo)
+    if codificador is None:
+        import tiktoken
+
+        try:
+            codificador = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            codificador = tiktoken.get_encoding("o200k_base")
+        _codificadores[modelo] = codificador
+    return codificador
+
+def contar_tokens(texto, modelo="gpt-4o"):
+    """
+    Cuenta los tokens que ocupa un texto para el modelo indicado.
+    """
+    if not texto:
+        return 0
+    return len(obtener_codificador(modelo).encode(texto))
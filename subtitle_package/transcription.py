@@ -1,174 +1,388 @@
-import os
-import re
-import math
+import io
+import wave
+import queue
+import subprocess
+import threading
 from tqdm import tqdm
-from pydub import AudioSegment
-from pydub.utils import make_chunks
-from openai import OpenAI
-from subtitle_package.config import OPENAI_API_KEY
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from subtitle_package import config
+from subtitle_package.audio import SAMPLE_RATE_WHISPER, leer_fragmentos, leer_fragmentos_por_silencios
+from subtitle_package.metrics import obtener_metricas
+from subtitle_package.cues import Cue, parsear_srt, formatear_srt
+from concurrent.futures import Future
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def split_audio(audio_path, chunk_length_ms):
-    """
-    Divide un archivo de audio en fragmentos de duración especificada (en milisegundos).
+def split_audio(audio_path, chunk_length_ms, num_buffers=2, por_silencios=True, solape_ms=0, en_vivo=False,
+                procesos=None):
     """
-    audio = AudioSegment.from_file(audio_path)
-    chunks = make_chunks(audio, chunk_length_ms)
-    return chunks
+    Divide un archivo de audio (o vídeo) en fragmentos de duración aproximada
+    'chunk_length_ms' (en milisegundos).
 
-def save_chunks(chunks, output_dir):
+    Con 'por_silencios' los cortes se hacen en las pausas cercanas a esa duración
+    y se descartan los fragmentos en silencio; si no, los cortes son fijos.
+    Los fragmentos se generan en streaming y comparten 'num_buffers' buffers reutilizables.
+    Con 'en_vivo' la entrada puede seguir creciendo (ver 'abrir_pcm'). Los
+    archivos largos se decodifican con 'procesos' procesos de ffmpeg en
+    paralelo (por defecto, config.PROCESOS_AUDIO).
     """
-    Guarda cada fragmento en un archivo WAV y devuelve la lista de rutas.
-    """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    chunk_files = []
-    for i, chunk in enumerate(chunks):
-        chunk_filename = os.path.join(output_dir, f"chunk_{i}.wav")
-        chunk.export(chunk_filename, format="wav")
-        chunk_files.append(chunk_filename)
-    return chunk_files
+    if procesos is None:
+        procesos = config.PROCESOS_AUDIO
+    if por_silencios:
+        return leer_fragmentos_por_silencios(audio_path, objetivo_ms=chunk_length_ms,
+                                             margen_ms=chunk_length_ms // 6, solape_ms=solape_ms,
+                                             num_buffers=num_buffers, en_vivo=en_vivo, procesos=procesos)
+    return leer_fragmentos(audio_path, chunk_length_ms, num_buffers=num_buffers, en_vivo=en_vivo,
+                           procesos=procesos)
+
+# Tamaño máximo de archivo que admite la API de transcripción (25 MB), con margen
+LIMITE_SUBIDA_BYTES = 24 * 1024 * 1024
 
-def srt_time_to_seconds(srt_time):
+# Codificaciones de subida, de más a menos fiel: (formato, extensión, bitrate).
+# Si un fragmento no cabe en el límite con la elegida se usa la siguiente.
+CODIFICACIONES = (
+    ("wav", "wav", None),
+    ("flac", "flac", None),
+    ("opus", "ogg", 24000),
+    ("opus", "ogg", 16000),
+    ("opus", "ogg", 12000),
+)
+
+def codificar_wav(fragmento):
     """
-    Convierte una marca de tiempo SRT (ejemplo "00:00:55,200") a segundos (float).
+    Codifica un fragmento PCM como WAV en memoria, listo para subirse a la API.
     """
-    hours, minutes, sec_millis = srt_time.split(':')
-    seconds, millis = sec_millis.split(',')
-    total = int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000.0
-    return total
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(fragmento.sample_rate)
+        wav.writeframes(memoryview(fragmento.muestras).cast("B"))
+    return buffer.getvalue()
+
+def _codificar_ffmpeg(fragmento, formato, bitrate):
+    """Codifica en memoria un fragmento PCM con ffmpeg (FLAC u Ogg Opus), sin archivos temporales."""
+    if formato == "flac":
+        salida = ["-c:a", "flac", "-compression_level", "8", "-f", "flac"]
+    else:
+        # 'voip' favorece la inteligibilidad de la voz a bitrates bajos
+        salida = ["-c:a", "libopus", "-b:a", str(bitrate), "-application", "voip", "-f", "ogg"]
+    proceso = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-nostdin",
+         "-f", "s16le", "-ar", str(fragmento.sample_rate), "-ac", "1", "-i", "pipe:0",
+         *salida, "pipe:1"],
+        input=memoryview(fragmento.muestras).cast("B"), capture_output=True, check=True
+    )
+    datos = proceso.stdout
+    if formato == "flac" and datos[:4] == b"fLaC":
+        # ffmpeg no puede volver al principio de una tubería para anotar el total de
+        # muestras en STREAMINFO (36 bits al final de los bytes 18-25): se anota aquí
+        datos = bytearray(datos)
+        campos = int.from_bytes(datos[18:26], "big")
+        campos = (campos & ~((1 << 36) - 1)) | (len(fragmento.muestras) & ((1 << 36) - 1))
+        datos[18:26] = campos.to_bytes(8, "big")
+        datos = bytes(datos)
+    return datos
 
-def seconds_to_srt_time(seconds):
+def codificar_fragmento(fragmento, formato=None, limite_bytes=LIMITE_SUBIDA_BYTES):
     """
-    Convierte un número de segundos a una cadena en formato SRT (HH:MM:SS,mmm).
+    Codifica un fragmento en memoria para subirlo a la API: 16 kHz mono en
+    WAV, FLAC (sin pérdidas, unas 2 veces menor) u Ogg Opus (unas 8-20 veces
+    menor). Si con 'formato' (por defecto, config.FORMATO_AUDIO) el fragmento
+    supera 'limite_bytes', se pasa a la siguiente codificación más compacta.
+
+    Returns:
+        tuple: (extensión del archivo, bytes codificados).
+
+    Raises:
+        ValueError: Si 'formato' no es una codificación conocida o el fragmento
+            no cabe en 'limite_bytes' con ninguna.
     """
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int(round((seconds - int(seconds)) * 1000))
-    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
+    formato = formato or config.FORMATO_AUDIO
+    nombres = [nombre for nombre, _, _ in CODIFICACIONES]
+    if formato not in nombres:
+        raise ValueError(f"Formato de audio desconocido: {formato!r} (válidos: {', '.join(dict.fromkeys(nombres))}).")
+    duracion = len(fragmento.muestras) / fragmento.sample_rate
+    metricas = obtener_metricas()
+    datos = None
+    with metricas.etapa("codificar_audio"):
+        for nombre, extension, bitrate in CODIFICACIONES[nombres.index(formato):]:
+            if bitrate is not None and bitrate * duracion / 8 > limite_bytes:
+                continue  # Ni siquiera la estimación cabe
+            if nombre == "wav":
+                datos = codificar_wav(fragmento)
+            else:
+                datos = _codificar_ffmpeg(fragmento, nombre, bitrate)
+            if len(datos) <= limite_bytes:
+                break
+        else:
+            raise ValueError(f"El fragmento de {duracion:.0f} s no cabe en {limite_bytes} bytes con ninguna "
+                             f"codificación a partir de {formato}; use fragmentos más cortos.")
+    metricas.incrementar("audio_subido_segundos", duracion, formato=nombre)
+    return extension, datos
 
 def parse_srt(srt_text):
     """
     Parsea un texto en formato SRT y devuelve una lista de segmentos.
-    Cada segmento es un diccionario con 'index', 'start', 'end' y 'text'.
-    """
-    segments = []
-    pattern = re.compile(r'(\d+)\s+([\d:,]+)\s+-->\s+([\d:,]+)\s+(.*?)(?=\n\n|\Z)', re.DOTALL)
-    matches = pattern.findall(srt_text)
-    for match in matches:
-        index = int(match[0])
-        start = srt_time_to_seconds(match[1])
-        end = srt_time_to_seconds(match[2])
-        text = match[3].strip().replace('\n', ' ')
-        segments.append({
-            'index': index,
-            'start': start,
-            'end': end,
-            'text': text
-        })
-    return segments
+    Cada segmento es un diccionario con 'index', 'start', 'end' (en segundos) y 'text'.
+    """
+    return [{'index': cue.indice, 'start': cue.inicio, 'end': cue.fin, 'text': cue.texto}
+            for cue in parsear_srt(srt_text)]
 
 def generate_srt(segments):
     """
     Genera un string en formato SRT a partir de una lista de segmentos.
     Los segmentos se renumeran secuencialmente.
     """
-    srt_lines = []
-    for i, seg in enumerate(segments, start=1):
-        srt_lines.append(str(i))
-        srt_lines.append(f"{seconds_to_srt_time(seg['start'])} --> {seconds_to_srt_time(seg['end'])}")
-        srt_lines.append(seg['text'])
-        srt_lines.append("")  # línea en blanco entre segmentos
-    return "\n".join(srt_lines)
+    return formatear_srt((Cue.desde_segundos(None, seg['start'], seg['end'], seg['text'])
+                          for seg in segments), renumerar=True)
 
-def transcribe_chunk(index, chunk_file, chunk_length_ms):
+async def transcribir_wav(motor, nombre, wav, chunk_offset, modelo="whisper-1", duracion=None):
     """
-    Transcribe un fragmento individual utilizando el formato "srt".
-    Ajusta el offset en función del índice del fragmento.
-    """
-    with open(chunk_file, "rb") as audio_file:
-        srt_text = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="srt"
-        )
+    Transcribe un audio ya codificado (WAV, FLAC u Ogg, según la extensión de
+    'nombre') a través del motor de la API y desplaza los segmentos
+    'chunk_offset' segundos. 'duracion' (segundos de audio) es el coste de la
+    petición; por defecto se estima del tamaño de un WAV de 16 kHz.
+    """
+    obtener_metricas().incrementar("bytes_subidos", len(wav), endpoint="audio")
+    srt_text = await motor.transcribir(
+        prioridad=duracion if duracion is not None else len(wav) / (2 * SAMPLE_RATE_WHISPER),
+        model=modelo,
+        file=(nombre, wav),
+        response_format="srt"
+    )
     segments = parse_srt(srt_text)
-    # Calcular el offset en segundos para este fragmento
-    chunk_offset = index * (chunk_length_ms / 1000.0)
     for seg in segments:
         seg['start'] += chunk_offset
         seg['end'] += chunk_offset
     return segments
 
-def transcribe_chunks(chunk_files, chunk_length_ms, max_workers):
+def transcribe_chunk(fragmento):
+    """
+    Transcribe un fragmento individual utilizando el formato "srt".
+    Ajusta el offset en función de la posición real del fragmento en el audio.
+    """
+    from subtitle_package.motor import obtener_motor
+
+    motor = obtener_motor()
+    extension, datos = codificar_fragmento(fragmento)
+    return motor.esperar(transcribir_wav(
+        motor, f"chunk_{fragmento.indice}.{extension}", datos, fragmento.inicio,
+        duracion=len(fragmento.muestras) / fragmento.sample_rate
+    ))
+
+class BackendTranscripcion:
+    """
+    Interfaz de los backends de transcripción.
+
+    'enviar' recibe un FragmentoAudio y devuelve un concurrent.futures.Future
+    con la lista de segmentos del fragmento (diccionarios con 'index',
+    'start', 'end' y 'text', en segundos absolutos). El buffer del fragmento
+    se reutiliza después de la llamada, así que el backend debe copiar o
+    codificar las muestras antes de volver.
+    """
+    nombre = None
+    # Duración de fragmento adecuada para el backend
+    duracion_fragmento_ms = 60000
+
+    def enviar(self, fragmento):
+        raise NotImplementedError
+
+    def vaciar(self):
+        """Empieza a procesar lo que el backend tenga acumulado (p. ej. un lote incompleto)."""
+
+    def max_pendientes(self):
+        """Número de fragmentos que conviene tener en vuelo a la vez."""
+        return 1
+
+    def parametros(self):
+        """Parámetros que determinan el resultado (para el manifiesto del trabajo)."""
+        return {"backend": self.nombre}
+
+    def resumen(self):
+        """Resumen de la ejecución para mostrar al terminar (o None)."""
+        return None
+
+    def cerrar(self):
+        """Libera los recursos del backend."""
+
+class BackendOpenAI(BackendTranscripcion):
+    """Transcripción con la API de OpenAI (whisper-1) a través del motor compartido."""
+    nombre = "openai"
+
+    def __init__(self, modelo="whisper-1", formato=None):
+        self.modelo = modelo
+        self.formato = formato or config.FORMATO_AUDIO
+        self.bytes_subidos = 0
+        self.segundos_subidos = 0.0
+        self._lock = threading.Lock()
+
+    def enviar(self, fragmento):
+        # El motor (y con él la librería openai) se carga al enviar el primer fragmento
+        from subtitle_package.motor import obtener_motor
+
+        motor = obtener_motor()
+        # Se codifica antes de volver: el buffer del fragmento se reutiliza
+        extension, datos = codificar_fragmento(fragmento, self.formato)
+        duracion = len(fragmento.muestras) / fragmento.sample_rate
+        with self._lock:
+            self.bytes_subidos += len(datos)
+            self.segundos_subidos += duracion
+        return motor.ejecutar(transcribir_wav(
+            motor, f"chunk_{fragmento.indice}.{extension}", datos, fragmento.inicio, self.modelo,
+            duracion=duracion
+        ))
+
+    def max_pendientes(self):
+        from subtitle_package.motor import obtener_motor
+
+        return obtener_motor().concurrencia_maxima("audio")
+
+    def resumen(self):
+        if not self.segundos_subidos:
+            return None
+        por_minuto = self.bytes_subidos / (self.segundos_subidos / 60)
+        ahorro = 2 * SAMPLE_RATE_WHISPER * 60 / por_minuto
+        return (f"Audio subido ({self.formato}): {self.bytes_subidos / 1e6:.1f} MB para "
+                f"{self.segundos_subidos / 60:.1f} min, {por_minuto / 1e3:.0f} KB por minuto de audio"
+                + (f" ({ahorro:.1f} veces menos que en WAV)." if ahorro > 1.05 else "."))
+
+    def parametros(self):
+        # Opus tiene pérdidas: el formato de subida puede cambiar la transcripción
+        return {"backend": self.nombre, "modelo": self.modelo, "formato": self.formato}
+
+def recortar_solape(segments, inicio_nucleo, fin_nucleo):
     """
-    Transcribe cada fragmento en paralelo usando un ThreadPoolExecutor.
+    Descarta los segmentos cuyo punto medio cae fuera del núcleo del fragmento
+    (en segundos). Así, lo transcrito en la zona de solape entre dos fragmentos
+    se conserva solo una vez.
+    """
+    return [seg for seg in segments
+            if inicio_nucleo <= (seg['start'] + seg['end']) / 2 < fin_nucleo]
+
+def transcribir_en_orden(fragmentos, max_workers=None, registro=None, backend=None, cache=None):
+    """
+    Transcribe los fragmentos en paralelo con 'backend' (por defecto, la API de
+    OpenAI a través del motor asíncrono compartido) y entrega los segmentos de cada fragmento en el orden del audio, en cuanto
+    ese fragmento y todos los anteriores están terminados.
+
+    Cada fragmento se entrega al backend al recibirlo, lo que libera su buffer.
+    'fragmentos' puede ser un generador: nunca hay más de 'max_workers'
+    fragmentos pendientes (por defecto, lo que indique el backend), de modo que
+    la memoria no depende de la duración del audio. Los fragmentos se leen en
+    un hilo propio, así que cada resultado se entrega en cuanto llega aunque
+    el siguiente fragmento tarde en leerse (por ejemplo, con audio en directo).
+    Los segmentos de las zonas de solape se deduplican.
+
+    Con 'registro' (RegistroFragmentos) los fragmentos ya transcritos en una
+    ejecución anterior no se vuelven a enviar y cada fragmento terminado se
+    guarda en cuanto llega. Con 'cache' (CacheTranscripcionesPCM) los fragmentos
+    idénticos muestra a muestra, con los mismos parámetros, a uno ya
+    transcrito alguna vez se recuperan de la caché y solo se envía el resto.
+
+    Yields:
+        list: Segmentos (ordenados) de cada fragmento, con tiempos absolutos.
+    """
+    backend = backend or BackendOpenAI()
+    cupo = threading.Semaphore(max_workers or backend.max_pendientes())
+    eventos = queue.Queue()  # ("hecho", future, datos del fragmento) | ("fin", total) | ("error", excepción)
+    parar = threading.Event()
+    metricas = obtener_metricas()
+    parametros = backend.parametros() if cache is not None else None
+
+    def enviar_todos():
+        enviados = 0
+        try:
+            for fragmento in metricas.medir_iterador("decodificar_audio", fragmentos):
+                if not cupo.acquire(blocking=False):
+                    # Sin hueco: el backend debe empezar con lo que tenga acumulado
+                    backend.vaciar()
+                    cupo.acquire()
+                if parar.is_set():
+                    return
+                clave = f"{fragmento.indice}:{fragmento.offset}"
+                guardado = registro.obtener(clave) if registro is not None else None
+                clave_cache = None
+                if guardado is None and cache is not None:
+                    # El hash se calcula aquí, mientras el buffer del fragmento es válido
+                    clave_cache = cache.clave(fragmento, parametros)
+                    guardado = cache.obtener_segmentos(clave_cache, fragmento.inicio)
+                    if guardado is None:
+                        metricas.incrementar("cache_transcripcion", resultado="fallo")
+                    else:
+                        metricas.incrementar("cache_transcripcion", resultado="acierto")
+                        metricas.incrementar("audio_cacheado_segundos",
+                                             len(fragmento.muestras) / fragmento.sample_rate)
+                        clave_cache = None
+                if guardado is not None:
+                    future = Future()
+                    future.set_result(guardado)
+                else:
+                    future = backend.enviar(fragmento)
+                datos = (fragmento.indice, clave, clave_cache, fragmento.inicio,
+                         fragmento.inicio_nucleo / fragmento.sample_rate,
+                         fragmento.fin_nucleo / fragmento.sample_rate)
+                future.add_done_callback(lambda f, datos=datos: eventos.put(("hecho", f, datos)))
+                enviados += 1
+            backend.vaciar()
+            eventos.put(("fin", enviados, None))
+        except BaseException as e:
+            eventos.put(("error", e, None))
+
+    lector = threading.Thread(target=enviar_todos, name="lectura-audio", daemon=True)
+    lector.start()
+    terminados = {}
+    siguiente = 0
+    recibidos = 0
+    total = None
+    try:
+        while total is None or recibidos < total:
+            evento, valor, datos = eventos.get()
+            if evento == "error":
+                raise valor
+            if evento == "fin":
+                total = valor
+                continue
+            recibidos += 1
+            cupo.release()
+            indice, clave, clave_cache, inicio, inicio_nucleo, fin_nucleo = datos
+            segments = valor.result()
+            if registro is not None and registro.obtener(clave) is None:
+                registro.guardar(clave, segments)
+            if clave_cache is not None:
+                cache.guardar_segmentos(clave_cache, segments, inicio)
+            segments = recortar_solape(segments, inicio_nucleo, fin_nucleo)
+            terminados[indice] = sorted(segments, key=lambda seg: seg['start'])
+            while siguiente in terminados:
+                yield terminados.pop(siguiente)
+                siguiente += 1
+    finally:
+        # Si el consumidor se detiene antes de tiempo, el hilo lector termina
+        parar.set()
+        cupo.release()
+
+def transcribe_chunks(fragmentos, max_workers=None, backend=None, cache=None):
+    """
+    Transcribe cada fragmento en paralelo (por defecto, a través del motor
+    asíncrono de la API) y devuelve todos los segmentos (ver 'transcribir_en_orden').
     """
     all_segments = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(transcribe_chunk, i, chunk_file, chunk_length_ms): i 
-                   for i, chunk_file in enumerate(chunk_files)}
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Transcribiendo fragmentos"):
-            segments = future.result()
-            all_segments.extend(segments)
+    pbar = tqdm(desc="Transcribiendo fragmentos", unit="fragmento")
+    for segments in transcribir_en_orden(fragmentos, max_workers, backend=backend, cache=cache):
+        all_segments.extend(segments)
+        pbar.update(1)
+    pbar.close()
     return all_segments
 
-def transcribir_audio(audio_path, chunk_length_ms=60000, max_workers=5):
+def transcribir_audio(audio_path, chunk_length_ms=60000, max_workers=None, solape_ms=0, backend=None,
+                      cache=None):
     """
     Devuelve un diccionario con la transcripción completa y la lista de segmentos.
+    'audio_path' puede ser también el vídeo original: el audio se decodifica en
+    streaming desde ffmpeg, sin archivo WAV intermedio, y se corta en las pausas.
+    'solape_ms' añade un pequeño solape entre fragmentos consecutivos.
     """
-    print("[INFO] Dividiendo el audio en fragmentos...")
-    chunks = split_audio(audio_path, chunk_length_ms)
-    print(f"[INFO] El audio se ha dividido en {len(chunks)} fragmentos.")
-
-    print("[INFO] Guardando fragmentos en disco...")
-    chunk_files = save_chunks(chunks, "chunks")
-
-    print("[INFO] Transcribiendo cada fragmento en paralelo...")
-    segments = transcribe_chunks(chunk_files, chunk_length_ms, max_workers)
+    print("[INFO] Transcribiendo el audio en fragmentos en paralelo...")
+    # Cada fragmento se codifica antes de leer el siguiente: basta con un buffer.
+    fragmentos = split_audio(audio_path, chunk_length_ms, num_buffers=1, solape_ms=solape_ms)
+    segments = transcribe_chunks(fragmentos, max_workers, backend, cache)
     segments.sort(key=lambda seg: seg['start'])
     full_text = " ".join(seg["text"] for seg in segments)
     return {"text": full_text.strip(), "segments": segments}
-
-# --- Nuevas funciones para dividir segmentos largos ---
-
-def split_segment(segment, max_duration=5):
-    """
-    Si la duración del segmento es mayor a max_duration (segundos), lo divide en partes iguales.
-    Reparte el texto en partes iguales (por palabras) para cada subsegmento.
-    """
-    duration = segment['end'] - segment['start']
-    if duration <= max_duration:
-        return [segment]
-    num_subsegments = math.ceil(duration / max_duration)
-    words = segment['text'].split()
-    words_per_segment = math.ceil(len(words) / num_subsegments)
-    subsegments = []
-    for i in range(num_subsegments):
-        new_start = segment['start'] + (duration / num_subsegments) * i
-        new_end = segment['start'] + (duration / num_subsegments) * (i + 1)
-        sub_text_words = words[i * words_per_segment:(i + 1) * words_per_segment]
-        sub_text = " ".join(sub_text_words)
-        subsegments.append({
-            'index': None,  # se asignará luego
-            'start': new_start,
-            'end': new_end,
-            'text': sub_text
-        })
-    return subsegments
-
-def split_long_segments(segments, max_duration=5):
-    """
-    Recorre la lista de segmentos y divide aquellos cuya duración supere max_duration.
-    """
-    new_segments = []
-    for seg in segments:
-        new_segments.extend(split_segment(seg, max_duration))
-    new_segments.sort(key=lambda x: x['start'])
-    # Reasigna los índices secuencialmente
-    for i, seg in enumerate(new_segments, start=1):
-        seg['index'] = i
-    return new_segments
@@ -1,30 +1,241 @@
+import os
+import re
+import csv
+import time
+import shutil
+import tempfile
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from subtitle_package.audio import duracion_media
+from subtitle_package.cues import Cue, leer_srt, escribir_srt
+from subtitle_package.metrics import obtener_metricas
+
+# Por debajo de esta duración el quemado se hace con un solo ffmpeg
+MIN_DURACION_QUEMADO_PARALELO_S = 120
+
+# Códigos ISO 639-2 que esperan los contenedores en la etiqueta 'language'
+CODIGOS_ISO639_2 = {
+    "en": "eng", "es": "spa", "fr": "fra", "de": "deu", "it": "ita", "pt": "por", "nl": "nld",
+    "ca": "cat", "gl": "glg", "eu": "eus", "ru": "rus", "uk": "ukr", "pl": "pol", "ja": "jpn",
+    "zh": "zho", "ko": "kor", "ar": "ara", "hi": "hin", "tr": "tur", "sv": "swe", "ro": "ron",
+}
+
+# Códecs de subtítulos en imagen: no se pueden convertir a texto, solo copiar (y solo MKV los admite)
+CODECS_SUBTITULOS_IMAGEN = {"hdmv_pgs_subtitle", "dvd_subtitle", "dvb_subtitle", "xsub"}
+
+def codigo_idioma(idioma):
+    """Devuelve el código ISO 639-2 de un idioma ("en" -> "eng")."""
+    return CODIGOS_ISO639_2.get(idioma.lower(), idioma.lower())
+
+def _argumentos_pistas(pistas, primera_entrada, codec="mov_text"):
+    """
+    Argumentos de ffmpeg que añaden las pistas [(ruta .srt, idioma)] como
+    subtítulos seleccionables, cuando sus archivos son las entradas desde
+    'primera_entrada' en adelante (las rutas se pasan aparte con '-i').
+    """
+    argumentos = []
+    for numero in range(len(pistas)):
+        argumentos += ["-map", f"{primera_entrada + numero}:s"]
+    argumentos += ["-c:s", codec]
+    for numero, (_, idioma_pista) in enumerate(pistas):
+        argumentos += [
+            f"-metadata:s:s:{numero}", f"language={codigo_idioma(idioma_pista)}",
+            f"-metadata:s:s:{numero}", f"title={idioma_pista}",
+        ]
+    return argumentos
+
+def _codec_subtitulos(ruta):
+    """Códec de subtítulos que admite el contenedor de 'ruta' (MP4: mov_text)."""
+    extension = os.path.splitext(ruta)[1].lower()
+    return {".mkv": "srt", ".webm": "webvtt"}.get(extension, "mov_text")
+
+def _subtitulos_existentes(media_path):
+    """Códecs de las pistas de subtítulos que ya tiene un archivo, según ffmpeg, en orden."""
+    salida = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-i", media_path],
+                            capture_output=True, text=True, errors="replace").stderr
+    return re.findall(r"Stream #0:\d+.*?: Subtitle: (\w+)", salida)
+
+def _argumentos_subtitulos_existentes(media_path, entrada, primera_pista, salida):
+    """
+    Argumentos de ffmpeg que conservan, detrás de las pistas nuevas, los
+    subtítulos que ya tenía el vídeo (la entrada número 'entrada'). La
+    primera va a la pista de subtítulos 'primera_pista' de la salida. Las de
+    texto se convierten con el '-c:s' de las pistas nuevas; las de imagen
+    solo se pueden copiar y, si el contenedor de 'salida' no las admite, se
+    descartan con un aviso. Las pistas de datos no se conservan.
+    """
+    argumentos = []
+    numero = primera_pista
+    for posicion, codec in enumerate(_subtitulos_existentes(media_path)):
+        if codec in CODECS_SUBTITULOS_IMAGEN:
+            if os.path.splitext(salida)[1].lower() != ".mkv":
+                print(f"[WARNING] La pista de subtítulos {posicion + 1} del vídeo ({codec}) es una imagen "
+                      f"y no cabe en {salida}: se descarta.")
+                continue
+            argumentos += ["-map", f"{entrada}:s:{posicion}", f"-c:s:{numero}", "copy"]
+        else:
+            argumentos += ["-map", f"{entrada}:s:{posicion}"]
+        numero += 1
+    return argumentos
 
 def insertar_subtitulos(video_path, srt_path, video_con_subs, idioma="English"):
-    
+
     """
-    Inserta (quema) subtítulos en un video utilizando ffmpeg.
+    Inserta subtítulos en un video utilizando ffmpeg, como pistas seleccionables.
+
+    Todas las pistas se añaden en una sola invocación de ffmpeg, sin recodificar
+    el vídeo ni el audio, cada una con su etiqueta de idioma y su título.
 
     Args:
         video_path (str): Ruta del video original.
-        srt_path (str): Ruta del archivo .srt que contiene los subtítulos.
+        srt_path (str | list): Ruta del archivo .srt que contiene los subtítulos,
+            o lista de pares (ruta .srt, idioma) para añadir varias pistas.
         video_con_subs (str): Ruta donde se guardará el video con subtítulos incrustados.
+        idioma (str): Idioma de los subtítulos cuando 'srt_path' es una sola ruta.
 
     Raises:
         subprocess.CalledProcessError: Si el comando ffmpeg falla.
     """
-    
-    comando = [
-        "ffmpeg",
-        "-i", video_path,
-        "-i", srt_path,
-        "-c", "copy",
-        "-c:s", "mov_text",
-        "-metadata:s:s:0", "title="+idioma,
-        video_con_subs
-    ]
-
-    
-    print(f"[INFO] Insertando subtítulos en el video: {video_path}")
-    subprocess.run(comando, check=True)
+    pistas = [(srt_path, idioma)] if isinstance(srt_path, str) else list(srt_path)
+
+    comando = ["ffmpeg", "-y", "-i", video_path]
+    for ruta, _ in pistas:
+        comando += ["-i", ruta]
+    comando += ["-map", "0:v?", "-map", "0:a?", "-c", "copy"]
+    comando += _argumentos_pistas(pistas, 1, _codec_subtitulos(video_con_subs))
+    comando += _argumentos_subtitulos_existentes(video_path, 0, len(pistas), video_con_subs)
+    comando.append(video_con_subs)
+
+    print(f"[INFO] Insertando {len(pistas)} pista(s) de subtítulos en el video: {video_path}")
+    with obtener_metricas().etapa("insertar_subtitulos"):
+        subprocess.run(comando, check=True)
     print(f"[INFO] Video con subtítulos guardado en: {video_con_subs}")
+
+def _tramos_srt(cues, tramos):
+    """
+    Reparte los subtítulos entre los tramos [(inicio, fin)] en segundos, con
+    los tiempos relativos al inicio de cada tramo. Un subtítulo que cruza un
+    corte aparece en los dos tramos, recortado.
+    """
+    for inicio, fin in tramos:
+        inicio_ms, fin_ms = int(round(inicio * 1000)), int(round(fin * 1000))
+        yield [Cue(cue.indice, max(cue.inicio_ms, inicio_ms) - inicio_ms, min(cue.fin_ms, fin_ms) - inicio_ms,
+                   cue.texto)
+               for cue in cues if cue.fin_ms > inicio_ms and cue.inicio_ms < fin_ms]
+
+def _comando_quemado(entrada, srt, salida, codec, crf, preset, hilos):
+    """Orden de ffmpeg que recodifica el vídeo de 'entrada' con los subtítulos de 'srt' (ruta sin escapar)."""
+    return ["ffmpeg", "-y", "-loglevel", "error", "-nostdin", "-i", entrada, "-map", "0:v:0",
+            "-vf", f"subtitles={srt}", "-c:v", codec, "-crf", str(crf), "-preset", preset,
+            "-threads", str(hilos), salida]
+
+def quemar_subtitulos(video_path, srt_path, video_quemado, idioma="English", procesos=None, codec="libx264",
+                      crf=18, preset="medium"):
+    """
+    Quema (incrusta en la imagen) los subtítulos en el vídeo, recodificándolo
+    en paralelo.
+
+    El vídeo se corta sin recodificar en tramos que empiezan en un fotograma
+    clave. Cada tramo se recodifica en su propio ffmpeg con el filtro
+    'subtitles' y con el SRT desplazado a su inicio. Después los tramos se
+    concatenan sin recodificar, y el audio y los metadatos se copian del
+    original. Los vídeos cortos, o con 'procesos' 1, se queman con un solo
+    ffmpeg.
+
+    Tiene la firma de 'insertar_subtitulos', para usarse como backend "mux".
+    Con varias pistas se quema la primera y las demás se añaden en la
+    concatenación como subtítulos seleccionables, sin coste de codificación.
+
+    Args:
+        video_path (str): Ruta del video original.
+        srt_path (str | list): Ruta del .srt, o lista de pares (ruta .srt, idioma).
+        video_quemado (str): Ruta del vídeo resultante.
+        idioma (str): Idioma de los subtítulos cuando 'srt_path' es una sola ruta.
+        procesos (int): ffmpeg que codifican a la vez (por defecto, config.PROCESOS_QUEMADO).
+        codec, crf, preset: Parámetros del codificador de vídeo.
+
+    Raises:
+        subprocess.CalledProcessError: Si algún comando ffmpeg falla.
+    """
+    from subtitle_package import config
+
+    pistas = [(srt_path, idioma)] if isinstance(srt_path, str) else list(srt_path)
+    (srt, idioma), seleccionables = pistas[0], pistas[1:]
+    if seleccionables:
+        print(f"[INFO] Se queman los subtítulos en {idioma}; "
+              f"{', '.join(idioma_pista for _, idioma_pista in seleccionables)} se añaden como pistas seleccionables.")
+    procesos = max(1, procesos or config.PROCESOS_QUEMADO)
+    duracion = duracion_media(video_path)
+    metricas = obtener_metricas()
+
+    print(f"[INFO] Quemando los subtítulos ({idioma}) en el video: {video_path}")
+    with metricas.etapa("quemar_subtitulos"), tempfile.TemporaryDirectory(prefix="quemado_") as temporal:
+        # ffmpeg se ejecuta en el directorio temporal y el filtro 'subtitles' recibe
+        # un nombre de archivo sin caracteres especiales que escapar
+        shutil.copyfile(srt, os.path.join(temporal, "completo.srt"))
+        if procesos == 1 or duracion is None or duracion < MIN_DURACION_QUEMADO_PARALELO_S:
+            subprocess.run(_comando_quemado(os.path.abspath(video_path), "completo.srt", "video.mkv",
+                                            codec, crf, preset, 0), cwd=temporal, check=True)
+            tramos = ["video.mkv"]
+        else:
+            tramos = _quemar_por_tramos(video_path, temporal, duracion, procesos, codec, crf, preset)
+
+        with open(os.path.join(temporal, "tramos.txt"), "w", encoding="utf-8") as lista:
+            lista.writelines(f"file '{tramo}'\n" for tramo in tramos)
+        comando = ["ffmpeg", "-y", "-loglevel", "error", "-nostdin",
+                   "-f", "concat", "-safe", "0", "-i", "tramos.txt", "-i", os.path.abspath(video_path)]
+        for ruta, _ in seleccionables:
+            comando += ["-i", os.path.abspath(ruta)]
+        comando += ["-map", "0:v", "-map", "1:a?", "-map_metadata", "1", "-c", "copy"]
+        comando += _argumentos_pistas(seleccionables, 2, _codec_subtitulos(video_quemado))
+        comando += _argumentos_subtitulos_existentes(video_path, 1, len(seleccionables), video_quemado)
+        comando.append(os.path.abspath(video_quemado))
+        subprocess.run(comando, cwd=temporal, check=True)
+    print(f"[INFO] Video con subtítulos quemados guardado en: {video_quemado}")
+
+def _quemar_por_tramos(video_path, temporal, duracion, procesos, codec, crf, preset):
+    """Recodifica en paralelo los tramos del vídeo y devuelve sus nombres en orden."""
+    metricas = obtener_metricas()
+    # Unos dos tramos por proceso para repartir bien la carga, de 30 s a 5 min
+    objetivo = min(300.0, max(30.0, duracion / (2 * procesos)))
+    # El muxer 'segment' corta en el primer fotograma clave tras cada múltiplo del
+    # objetivo y anota en la lista el intervalo real de cada tramo
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-nostdin", "-i", os.path.abspath(video_path),
+                    "-map", "0:v:0", "-c", "copy", "-f", "segment", "-segment_time", f"{objetivo:.3f}",
+                    "-reset_timestamps", "1", "-segment_list", "tramos.csv", "-segment_list_type", "csv",
+                    "original_%04d.mkv"], cwd=temporal, check=True)
+    with open(os.path.join(temporal, "tramos.csv"), newline="", encoding="utf-8") as f:
+        filas = [(nombre, float(inicio), float(fin)) for nombre, inicio, fin in csv.reader(f)]
+
+    cues = leer_srt(os.path.join(temporal, "completo.srt"))
+    for numero, cues_tramo in enumerate(_tramos_srt(cues, [(inicio, fin) for _, inicio, fin in filas])):
+        escribir_srt(cues_tramo, os.path.join(temporal, f"tramo_{numero:04d}.srt"))
+
+    # Cada ffmpeg usa su parte de los núcleos
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+    print(f"[INFO] Codificando {len(filas)} tramos de unos {objetivo:.0f} s con {procesos} procesos en paralelo...")
+
+    def codificar(numero):
+        nombre, inicio, fin = filas[numero]
+        inicio_reloj = time.perf_counter()
+        subprocess.run(_comando_quemado(nombre, f"tramo_{numero:04d}.srt", f"quemado_{numero:04d}.mkv",
+                                        codec, crf, preset, hilos), cwd=temporal, check=True)
+        return fin - inicio, time.perf_counter() - inicio_reloj
+
+    terminados = 0
+    with ThreadPoolExecutor(max_workers=procesos) as ejecutor:
+        futuros = {ejecutor.submit(codificar, numero): numero for numero in range(len(filas))}
+        try:
+            for futuro in as_completed(futuros):
+                segundos_video, segundos = futuro.result()
+                terminados += 1
+                metricas.observar("quemado_tramo_segundos", segundos)
+                metricas.incrementar("quemado_video_segundos", segundos_video)
+                print(f"[INFO] Tramo {futuros[futuro] + 1} quemado ({terminados}/{len(filas)}): "
+                      f"{segundos_video:.1f} s de vídeo en {segundos:.1f} s "
+                      f"(x{segundos_video / max(segundos, 1e-6):.2f} tiempo real)")
+        except BaseException:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+    return [f"quemado_{numero:04d}.mkv" for numero in range(len(filas))]